@@ -1,4 +1,27 @@
 import csv
+import numpy as np
+import pandas as pd
+
+# the fields of a row: key of the observation data, default if the key is missing (None if required), format spec
+FIELDS = [
+    ("name", None, ".30"),
+    ("date", None, ".16"),
+    ("magnitude", None, ".3f"),
+    ("magnitude_error", None, ".3f"),
+    ("filter", None, ".5"),
+    ("transformed", None, ".3"),
+    ("magnitude_type", None, ".3"),
+    ("comparison_name", "na", ".20"),
+    ("comparison_magnitude", "na", ".2"),
+    ("check_name", None, ".20"),
+    ("check_magnitude", None, ""),
+    ("airmass", None, ".2f"),
+    ("group", "na", ".5"),
+    ("chart", "na", ".20"),
+    ("notes", "na", ".2000"),
+]
+# rows written to the file at once by addrows
+WRITE_ROWS = 10000
 
 
 class FormatException(Exception):
@@ -69,6 +92,9 @@ class ExtendedFormatWriter(object):
         self.date_format = date_format
         self.obstype = obstype
         self.fp = fp
+        self.delimiter = delimiter
+        # anything written to fp yet, the lines are separated by newlines
+        self._started = False
         self.data = []
         self.data.append(f"#TYPE={type}")
         self.data.append(f"#OBSCODE={observer_code}")
@@ -84,10 +110,15 @@ class ExtendedFormatWriter(object):
         )
 
     def flush(self):
-        string_to_write = "\n".join(self.data)
-        self.fp.write(string_to_write)
+        self._write(self.data)
         self.data = []
 
+    def _write(self, lines):
+        if len(lines) == 0:
+            return
+        self.fp.write(("\n" if self._started else "") + "\n".join(lines))
+        self._started = True
+
     def addrow(self, observation_data):
         """
         Writes a single observation to the output file.
@@ -105,6 +136,21 @@ class ExtendedFormatWriter(object):
             row = self.dict_to_row(observation_data)
         self.data.append(row)
 
+    def addrows(self, observations):
+        """
+        Writes many observations straight to the output file, after the header and the rows added before.
+
+        The columns are formatted at once, which is much faster than addrow per observation. The values of
+        ``observations`` (a dictionary with the keys of addrow) are columns of equal length or a single value for
+        all rows.
+
+        :param observations: the observations as a dictionary or DataFrame of columns
+        """
+        self.flush()
+        lines = self.columns_to_rows(observations)
+        for start in range(0, len(lines), WRITE_ROWS):
+            self._write(lines[start : start + WRITE_ROWS])
+
     @classmethod
     def dict_to_row(cls, observation_data):
         """
@@ -116,17 +162,39 @@ class ExtendedFormatWriter(object):
         :param cls: current class
         :param observation_data: a single observation as a dictionary
         """
-        return (
-            f"{observation_data['name']:.30},{observation_data['date']:.16},"
-            f"{observation_data['magnitude']:.3f},{observation_data['magnitude_error']:.3f},"
-            f"{observation_data['filter']:.5},{observation_data['transformed']:.3},"
-            f"{observation_data['magnitude_type']:.3},"
-            f"{observation_data.get('comparison_name', 'na'):.20},"
-            f"{observation_data.get('comparison_magnitude', 'na'):.2},"
-            f"{observation_data['check_name']:.20},"
-            f"{observation_data['check_magnitude']},"
-            f"{observation_data['airmass']:.2f},"
-            f"{observation_data.get('group', 'na'):.5},"
-            f"{observation_data.get('chart', 'na'):.20},"
-            f"{observation_data.get('notes', 'na'):.2000}"
+        return ",".join(
+            format(observation_data[key] if default is None else observation_data.get(key, default), spec)
+            for key, default, spec in FIELDS
         )
+
+    @classmethod
+    def columns_to_rows(cls, observations):
+        """
+        Takes columns of observation data and converts them to rows as dict_to_row does, one column at a time.
+
+        :param cls: current class
+        :param observations: the observations as a dictionary or DataFrame of columns, or single values
+        """
+        nr_rows = max((len(value) for _, value in observations.items() if _is_column(value)), default=1)
+        columns = [
+            _format_column(observations[key] if default is None else observations.get(key, default), spec, nr_rows)
+            for key, default, spec in FIELDS
+        ]
+        return list(columns[0].str.cat(columns[1:], sep=","))
+
+
+def _is_column(value):
+    return not isinstance(value, str) and np.ndim(value) > 0
+
+
+def _format_column(value, spec, nr_rows) -> pd.Series:
+    """ the values of a column formatted with spec as strings, a single value is repeated nr_rows times """
+    if not _is_column(value):
+        return pd.Series([format(value, spec)] * nr_rows)
+    values = pd.Series(np.asarray(value))
+    if spec.endswith("f"):
+        return pd.Series(np.char.mod(f"%{spec}", values.to_numpy(dtype=float)), dtype=object)
+    if values.dtype == object and spec:
+        # a precision of a string is its max length
+        return values.str.slice(0, int(spec[1:]))
+    return values.map(lambda item: format(item, spec))
@@ -0,0 +1,102 @@
+"""
+The airmass of a field per frame. Transforming one coordinate at one JD to AltAz costs milliseconds, which adds up
+to hours for thousands of stars with thousands of observations each. An AirmassTable transforms the field centre at
+all frame JDs at once, together with two points offset in RA and Dec. The airmass of a star is that of the centre
+corrected with the RA/Dec gradients of cos z (which, unlike sec z, is smooth up to the horizon), stars far from the
+centre are transformed exactly.
+"""
+
+import logging
+from typing import Iterable, List
+import numpy as np
+import toml
+from astropy import units as u
+from astropy.coordinates import SkyCoord, EarthLocation, AltAz
+from astropy.time import Time
+
+# the offset in degrees of the points used for the RA/Dec gradients
+GRADIENT_OFFSET_DEG = 0.5
+# stars further than this from the centre (degrees) are transformed exactly instead of with the gradients
+MAX_GRADIENT_DISTANCE_DEG = 3.0
+
+
+def site_location(settings_file="settings.txt") -> EarthLocation:
+    """ the observing site (sitelat, sitelong, sitealt in m) from the settings file """
+    settings = toml.load(settings_file)
+    return EarthLocation(lat=settings["sitelat"], lon=settings["sitelong"], height=settings["sitealt"] * u.m)
+
+
+def wcs_centre(wcs) -> SkyCoord:
+    """ the coordinate of the central pixel of the wcs """
+    return SkyCoord.from_pixel(wcs.pixel_shape[0] / 2.0, wcs.pixel_shape[1] / 2.0, wcs=wcs, origin=0)
+
+
+def coords_centre(coords: List[SkyCoord]) -> SkyCoord:
+    """ the mean direction of coords """
+    cartesian = np.array([coord.cartesian.xyz.value for coord in coords]).mean(axis=0)
+    centre = SkyCoord(x=cartesian[0], y=cartesian[1], z=cartesian[2], representation_type="cartesian")
+    return SkyCoord(centre.spherical.lon, centre.spherical.lat)
+
+
+def secz(coords: SkyCoord, location: EarthLocation, jds) -> np.ndarray:
+    """ the airmass (sec z) of coords (shape (n,)) at jds (shape (m,)) in one transform, shape (n, m) """
+    times = Time(np.asarray(jds, dtype=float)[np.newaxis, :], format="jd")
+    return coords[:, np.newaxis].transform_to(AltAz(obstime=times, location=location)).secz.value
+
+
+class AirmassTable:
+    """ the airmass of a field at the JDs of its frames, extended on demand with JDs it doesn't have yet """
+
+    def __init__(self, centre: SkyCoord, location: EarthLocation, jds: Iterable[float] = ()):
+        self.centre = centre
+        self.location = location
+        self.jds = np.empty(0)
+        # cos z of the centre and its change per degree of RA (on the sky) and Dec, per JD
+        self.cos_z = np.empty(0)
+        self.d_ra = np.empty(0)
+        self.d_dec = np.empty(0)
+        self.extend(jds)
+
+    @classmethod
+    def of_settings(cls, centre: SkyCoord, jds: Iterable[float] = (), settings_file="settings.txt"):
+        return cls(centre, site_location(settings_file), jds)
+
+    def extend(self, jds: Iterable[float]):
+        """ adds the airmass at the jds which are not in the table yet """
+        jds = np.unique(np.asarray(jds, dtype=float))
+        new = jds[~np.isin(jds, self.jds)]
+        if len(new) == 0:
+            return
+        logging.debug(f"Calculating the airmass of {self.centre} at {len(new)} JDs")
+        cos_dec = max(np.cos(self.centre.dec.radian), 1e-6)
+        points = SkyCoord(
+            [self.centre.ra.deg, self.centre.ra.deg + GRADIENT_OFFSET_DEG / cos_dec, self.centre.ra.deg],
+            [self.centre.dec.deg, self.centre.dec.deg, self.centre.dec.deg + GRADIENT_OFFSET_DEG],
+            unit="deg",
+        )
+        centre, ra_offset, dec_offset = 1 / secz(points, self.location, new)
+        jds = np.concatenate([self.jds, new])
+        order = np.argsort(jds)
+        self.jds = jds[order]
+        self.cos_z = np.concatenate([self.cos_z, centre])[order]
+        self.d_ra = np.concatenate([self.d_ra, (ra_offset - centre) / GRADIENT_OFFSET_DEG])[order]
+        self.d_dec = np.concatenate([self.d_dec, (dec_offset - centre) / GRADIENT_OFFSET_DEG])[order]
+
+    def get_airmass(self, jds, coord: SkyCoord = None) -> np.ndarray:
+        """ the airmass at jds of the centre, or of coord """
+        jds = np.asarray(jds, dtype=float)
+        if coord is not None and coord.separation(self.centre).deg > MAX_GRADIENT_DISTANCE_DEG:
+            return secz(SkyCoord([coord.ra], [coord.dec]), self.location, jds)[0]
+        self.extend(jds)
+        index = np.searchsorted(self.jds, jds)
+        if coord is None:
+            return 1 / self.cos_z[index]
+        d_ra = ((coord.ra.deg - self.centre.ra.deg + 180) % 360 - 180) * np.cos(self.centre.dec.radian)
+        d_dec = coord.dec.deg - self.centre.dec.deg
+        return 1 / (self.cos_z[index] + self.d_ra[index] * d_ra + self.d_dec[index] * d_dec)
+
+    def __len__(self):
+        return len(self.jds)
+
+    def __repr__(self):
+        return f"AirmassTable(centre={self.centre}, {len(self)} JDs)"
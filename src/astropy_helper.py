@@ -62,8 +62,7 @@ def get_data_from_fits_header(reference_frame):
 
 
 def get_fits_header(reference_file):
-    hdulist = fits.open(reference_file)
-    return hdulist[0].header
+    return fits.getheader(reference_file)
 
 
 # TEST code
@@ -0,0 +1,65 @@
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+# calibrated magnitudes of many stars measured on a shared set of frames
+class CalibratedLightcurves:
+    def __init__(
+        self, jds, star_ids: List[int], mags: np.ndarray, errs: np.ndarray,
+    ):
+        # the JD of every frame, as a string like it is written in the VaST lightcurves: [index_of_frame] = JD
+        self.jds = np.asarray(jds)
+        # the same JD's as floats
+        self.floatjds = self.jds.astype(float)
+        # the local id of every star: [index_of_star] = local_id
+        self.star_ids = list(star_ids)
+        # calibrated magnitudes, NaN if the star was not measured on that frame: [index_of_frame, index_of_star] = mag
+        self.mags = mags
+        # calibrated magnitude errors: [index_of_frame, index_of_star] = err
+        self.errs = errs
+        # the HJD or BJD of the frames (see time_correction), None if the lightcurves are in JD
+        self.time_correction = None
+        self._star_index = {star_id: idx for idx, star_id in enumerate(self.star_ids)}
+
+    def __contains__(self, star_id):
+        return star_id in self._star_index
+
+    def __len__(self):
+        return len(self.star_ids)
+
+    def get_star_index(self, star_id) -> int:
+        return self._star_index[star_id]
+
+    def get_star_arrays(self, star_id) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ returns jds, floatjds, mags and errs of all frames on which this star has a calibrated magnitude """
+        idx = self._star_index[star_id]
+        mags, errs = self.mags[:, idx], self.errs[:, idx]
+        mask = ~(np.isnan(mags) | np.isnan(errs))
+        return self.jds[mask], self.floatjds[mask], mags[mask], errs[mask]
+
+    def get_star_df(self, star_id, coord=None) -> DataFrame:
+        """
+        the calibrated lightcurve of one star with columns JD, floatJD, realV and realErr. With a time_correction
+        and the coord of the star, floatJD is in its time reference and JD is still the frame JD
+        """
+        if star_id not in self._star_index:
+            return None
+        jds, floatjds, mags, errs = self.get_star_arrays(star_id)
+        if self.time_correction is not None and coord is not None:
+            floatjds = self.time_correction.correct(floatjds, coord)
+        return pd.DataFrame(
+            {
+                "JD": jds,
+                "floatJD": floatjds,
+                "realV": mags.astype(float),
+                "realErr": errs.astype(float),
+            }
+        )
+
+    def __str__(self):
+        return (
+            f"CalibratedLightcurves class: #frames={len(self.jds)}, #stars={len(self.star_ids)}, "
+            f"#calibrated points={np.count_nonzero(~np.isnan(self.mags))}."
+        )
@@ -11,7 +11,9 @@ import main_vast
 import utils
 import os
 from reading import ImageRecord
+import cutouts
 import do_calibration
+import fits_frame
 import utils_sd
 import subprocess
 import logging
@@ -31,6 +33,8 @@ dpi = 600
 NEIGHBOUR_TEXT_SIZE = 4
 UCAC4_TEXT_SIZE = 3
 RefFrame = namedtuple("RefFrame", "ref_jd path_to_solved path_to_reference_frame")
+# the width in pixels of the stamps on the stamp sheet of every star
+STAMP_CROP = 60
 ucac4 = UCAC4()
 
 
@@ -38,7 +42,8 @@ def inspect(vastdir, resultdir, fitsdir, apikey, stars):
     """generate image+txt file to inspect a certain star on wrong ucac/localid nrs """
     reading.trash_and_recreate_dir(Path(resultdir) / "inspect")
     ref_jd, _, _, reference_frame = reading.extract_reference_frame(vastdir)
-    _, shapex, shapey = reading.get_fits_data(Path(fitsdir, Path(reference_frame).name))
+    # the shape of the reference frame, from its header only
+    shapex, shapey = fits_frame.read_shape(Path(fitsdir, Path(reference_frame).name))
     refframes: List[RefFrame] = [
         RefFrame(
             ref_jd,
@@ -60,7 +65,11 @@ def inspect(vastdir, resultdir, fitsdir, apikey, stars):
         stars = sorted(list(map(lambda x: int(x), stars)))
     else:
         stars = sorted([x.local_id for x in sds if x.get_metadata("SELECTEDTAG")])
+    # the stamps of all stars in one sweep over the frames, the cubes in the resultdir are reused by cli_animate
+    cubes = cutouts.star_cubes(stars, vastdir, fitsdir, STAMP_CROP, resultdir)
     for starid in stars:
+        cube, jds = cubes[starid]
+        cutouts.write_stamp_sheet(cube, jds, Path(resultdir, "inspect", f"{starid:05}_stamps.png"))
         process(
             vastdir,
             resultdir,
@@ -179,12 +188,13 @@ def update_img(
     resultlines = []
     fig = plt.figure(figsize=(36, 32), dpi=dpi, facecolor="w", edgecolor="k")
     wcs = do_calibration.get_wcs(platesolved_file)
-    data, shapex, shapey = reading.get_fits_data(platesolved_file)
-    backgr = data.mean()
-    data = data.reshape(shapex, shapey)
-    data = np.pad(
-        data, (padding, padding), "constant", constant_values=(backgr, backgr)
-    )
+    # float32 is plenty for display and half the memory of get_fits_data
+    data = fits_frame.read_data(platesolved_file)
+    if padding:
+        backgr = data.mean()
+        data = np.pad(
+            data, (padding, padding), "constant", constant_values=(backgr, backgr)
+        )
     starxy = SkyCoord.to_pixel(star.coords, wcs=wcs, origin=0)
 
     # add main target
@@ -1,9 +1,10 @@
-from multiprocessing import cpu_count
 import logging
 import argparse
 import utils
 from datetime import datetime
 import main_vast
+import time_correction
+import worker_pool
 import os.path
 
 if __name__ == "__main__":
@@ -96,10 +97,48 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--threads",
-        help="Specifies the number of threads to be used by this program",
+        help="Specifies the number of threads to be used by this program, defaults to one per core but one, limited "
+        "by the available memory (see --workermemory)",
         nargs="?",
         type=int,
-        default=cpu_count() - 1,
+    )
+    parser.add_argument(
+        "--workermemory",
+        help="A worker process is replaced when its resident memory passes this many MB",
+        type=float,
+        default=worker_pool.MAX_WORKER_RSS_MB,
+    )
+    parser.add_argument(
+        "--taskseconds",
+        help="The max number of seconds for computing or rendering one star. A star which takes longer is killed and "
+        "listed in failed_stars.csv in the resultdir. Default: no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--taskmemory",
+        help="The max resident memory in MB of a worker computing or rendering one star. A star which uses more is "
+        "killed and listed in failed_stars.csv in the resultdir. Default: no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--resume",
+        help="Continue an earlier (e.g. crashed) run in the same resultdir: keeps its results and skips the stars "
+        "whose outputs exist and whose lightcurve, comparison stars and period settings did not change. Without it "
+        "the output dirs are emptied first",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--renderthreads",
+        help="The number of processes rendering the plots and AAVSO reports, defaults to --threads",
+        type=int,
+        required=False,
+    )
+    parser.add_argument(
+        "--timeref",
+        help="The time reference of the periods, epochs and charts: JD as measured, HJD (heliocentric, like most VSX "
+        "epochs) or BJD (barycentric, TDB). The AAVSO reports stay in JD",
+        choices=time_correction.TIME_REFERENCES,
+        default="JD",
     )
     parser.add_argument(
         "--selectvsx",
@@ -120,13 +159,77 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--jdfilter",
-        help="Filters out a range of JD's. Filters every JD between the first and "
-        "the second argument. If you want to filter from a certain point up to infinity,"
-        "use a suitably large JD like 9999999",
+        help="Filters out ranges of JD's. Filters every JD between the first and "
+        "the second argument, the third and the fourth, and so on. If you want to filter from a certain point up "
+        "to infinity, use a suitably large JD like 9999999",
         nargs="+",
         type=float,
         required=False,
     )
+    parser.add_argument(
+        "--periodengine",
+        help="The period search engine for stars without a known period: LS, PDM, AOV or BLS (box search for "
+        "eclipsing binaries)",
+        default="LS",
+    )
+    parser.add_argument(
+        "--vartypeengines",
+        help="Period engines per var type, e.g. --vartypeengines EA=BLS RR=PDM. A var type also matches its "
+        "subtypes (EA matches EA/SD)",
+        nargs="+",
+    )
+    parser.add_argument(
+        "--minperiod",
+        help="The shortest period (days) of the period search",
+        type=float,
+        default=0.01,
+    )
+    parser.add_argument(
+        "--maxperiod",
+        help="The longest period (days) of the period search, defaults to the time span of the observations",
+        type=float,
+    )
+    parser.add_argument(
+        "--oversampling",
+        help="Oversampling of the coarse period search grid w.r.t. the time span of the observations",
+        type=float,
+        default=2,
+    )
+    parser.add_argument(
+        "--toppeaks",
+        help="The number of highest peaks of the coarse period search which are refined on a fine grid",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--refineperiods",
+        help="Refine known VSX or selected-file periods in a narrow window around them (and their half and double) "
+        "instead of using them as is. VSX stars without a significant peak there get a full period search",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--maxerr",
+        help="Removes the points with a magnitude error above this value from the lightcurves",
+        type=float,
+        required=False,
+    )
+    parser.add_argument(
+        "--bootstrap",
+        help="The number of bootstrap resamples for the uncertainty of calculated periods, 0 to skip",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--bootstrapseconds",
+        help="The max number of seconds spent on the bootstrap of one star",
+        type=float,
+        default=10.0,
+    )
+    parser.add_argument(
+        "--periodograms",
+        help="Store the compressed Lomb-Scargle periodogram of every star in the period cache",
+        action="store_true",
+    )
     parser.add_argument(
         "--jdrefignore",
         help="Igone that the ref frame jd is inside of the filter",
@@ -1,5 +1,6 @@
 from typing import List, Dict, Tuple
 import numpy as np
+import pandas as pd
 from star_description import StarDescription
 
 
@@ -12,6 +13,7 @@ class ComparisonStars:
         observations: Dict[str, Tuple[float, float]],
         comp_catalogmags,
         comp_catalogerr,
+        observation_frames: Tuple[pd.DataFrame, pd.DataFrame] = None,
     ):
         self.ids = ids
         # one StarDescription per comparison star: [index_of_comp_star] = StarDescription
@@ -22,19 +24,49 @@ class ComparisonStars:
         self.comp_catalogmags = comp_catalogmags
         # one catalog error per comparison star: [index_of_comp_star] = catalog_err
         self.comp_catalogerr = comp_catalogerr
+        # the observations as a (mags, errs) tuple of DataFrames: [JD, index_of_comp_star] = mag or err
+        self.observation_frames = (
+            observation_frames
+            if observation_frames is not None
+            else self._to_observation_frames(observations)
+        )
+
+    @staticmethod
+    def _to_observation_frames(observations):
+        if observations is None:
+            return None
+        mags, errs = {}, {}
+        for idx, compstar in enumerate(observations):
+            values = np.array(list(compstar.values()), dtype=float).reshape(-1, 2)
+            jds = list(compstar.keys())
+            mags[idx] = pd.Series(values[:, 0], index=jds)
+            errs[idx] = pd.Series(values[:, 1], index=jds)
+        return pd.DataFrame(mags), pd.DataFrame(errs)
 
     # return a subset of this ComparisonStars object
 
     def get_filtered_comparison_stars(self, ids: List[int]):
         mask = np.isin(self.ids, ids)
+        observation_frames = None
+        if self.observation_frames is not None:
+            observation_frames = tuple(
+                frame.loc[:, mask].set_axis(range(mask.sum()), axis=1)
+                for frame in self.observation_frames
+            )
         return ComparisonStars(
             np.array(self.ids)[mask],
             np.array(self.star_descriptions)[mask],
             np.array(self.observations)[mask],
             np.array(self.comp_catalogmags)[mask],
             np.array(self.comp_catalogerr)[mask],
+            observation_frames=observation_frames,
         )
 
+    def get_observation_matrix(self, jds) -> Tuple[np.ndarray, np.ndarray]:
+        """ mags and errs of all comparison stars for the given JD's, shape (len(jds), #compstars), NaN if missing """
+        mags, errs = self.observation_frames
+        return mags.reindex(jds).to_numpy(), errs.reindex(jds).to_numpy()
+
     def get_brightest_comparison_star_index(self):
         return np.argmin(self.comp_catalogmags)
 
@@ -0,0 +1,236 @@
+"""
+Postage stamps of one star on every frame, as a (frames, crop, crop) float32 cube in an .npy file. Each stamp is
+read from its frame through a memory map, only the rows around the star, and rotated like the reference frame. The
+cube is memory mapped too, so animations and inspections of long series don't need the frames or the memory for
+them. For many stars, star_cubes opens every frame once and cuts the stamps of all stars on it. The movies are
+encoded by piping the stamps into ffmpeg, inspection shows a sheet of stamps spread over the cube.
+"""
+
+import logging
+import subprocess
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Tuple
+import matplotlib.pyplot as plt
+import numpy as np
+import tqdm
+from scipy import ndimage
+import reading
+import worker_pool
+from fits_frame import FitsFrame
+from reading import ImageRecord
+
+# extra pixels around a stamp, so the corners are still filled after the rotation
+CUTOUT_BORDER = 20
+# the range of pixel values which is mapped to black..white in the movies
+MOVIE_VMIN, MOVIE_VMAX = 0, 2500
+# the stamps are enlarged (nearest pixel) to about this size in the movies
+MOVIE_SIZE = 720
+# a stamp sheet shows this many stamps, evenly spread over the frames
+SHEET_COLUMNS, SHEET_ROWS = 8, 4
+
+
+def extract_cutout(record: ImageRecord, fitsdir, crop: int, border: int = CUTOUT_BORDER) -> np.ndarray:
+    """
+    the crop x crop stamp centred on (record.x, record.y) of the frame record.file in fitsdir, rotated by
+    record.rotation. Pixels outside the frame get the mean of the stamp
+    """
+    with FitsFrame(Path(fitsdir, record.file)) as frame:
+        return _cut(frame, record, crop, border)
+
+
+def _cut(frame: FitsFrame, record: ImageRecord, crop: int, border: int) -> np.ndarray:
+    stamp = frame.cutout(record.x, record.y, crop + border, dtype=np.float32)
+    rotated = ndimage.rotate(stamp, record.rotation)
+    return crop_center(rotated, crop, crop)
+
+
+def extract_frame_cutouts(
+    file_stamps: Tuple[str, List[Tuple[int, int, ImageRecord]]], fitsdir, crop: int, border: int = CUTOUT_BORDER
+) -> List[Tuple[int, int, np.ndarray]]:
+    """ opens the frame file once and cuts all its stamps, given and returned as (cube index, frame index, ...) """
+    file, stamps = file_stamps
+    with FitsFrame(Path(fitsdir, file)) as fits_file:
+        return [(cube, frame, _cut(fits_file, record, crop, border)) for cube, frame, record in stamps]
+
+
+def crop_center(img, cropx, cropy):
+    y, x = img.shape
+    startx = x // 2 - (cropx // 2)
+    starty = y // 2 - (cropy // 2)
+    return img[starty : starty + cropy, startx : startx + cropx]
+
+
+def cutout_cube(
+    records: List[ImageRecord], fitsdir, crop: int, path: Path, nr_threads=None, border: int = CUTOUT_BORDER
+) -> np.ndarray:
+    """ the stamps of records in a memory mapped cube, written to path (.npy) and the JD's to jds_path(path) """
+    return cutout_cubes([records], [path], fitsdir, crop, nr_threads, border)[0]
+
+
+def cutout_cubes(
+    records: List[List[ImageRecord]], paths: List[Path], fitsdir, crop: int, nr_threads=None, border=CUTOUT_BORDER
+) -> List[np.ndarray]:
+    """
+    The cubes of many lists of records (see cutout_cube) in one sweep over the frames: every frame is opened once, by
+    one worker, which cuts all the stamps on it
+    """
+    cubes = [
+        np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(cube_records), crop, crop))
+        for cube_records, path in zip(records, paths)
+    ]
+    files = {}
+    for cube_index, cube_records in enumerate(records):
+        for frame_index, record in enumerate(cube_records):
+            files.setdefault(record.file, []).append((cube_index, frame_index, record))
+    func = partial(extract_frame_cutouts, fitsdir=fitsdir, crop=crop, border=border)
+    nr_threads = worker_pool.auto_threads() if nr_threads is None else nr_threads
+    with worker_pool.get_pool(nr_threads) as pool:
+        frames = pool.imap_unordered(func, files.items(), chunksize=max(len(files) // (4 * nr_threads), 1))
+        for stamps in tqdm.tqdm(frames, total=len(files), desc="Cutting stamps", unit="frames"):
+            for cube_index, frame_index, stamp in stamps:
+                cubes[cube_index][frame_index] = stamp
+    for cube, cube_records, path in zip(cubes, records, paths):
+        cube.flush()
+        np.save(jds_path(path), np.array([record.jd for record in cube_records]))
+    logging.info(f"Cut {sum(len(cube) for cube in cubes)} stamps of {crop}x{crop} from {len(files)} frames")
+    return cubes
+
+
+def jds_path(path: Path) -> Path:
+    return Path(path).with_name(f"{Path(path).stem}_jds.npy")
+
+
+def load_cube(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """ the memory mapped cube at path and the JD of every stamp """
+    return np.load(path, mmap_mode="r"), np.load(jds_path(path))
+
+
+def cube_path(starid: int, crop: int, resultdir) -> Path:
+    return Path(resultdir, f"cutouts-{starid:05}-{crop}.npy")
+
+
+def star_cube(
+    starid: int, vastdir: str, fitsdir, crop: int, resultdir, nr_threads=None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The cube of stamps of star starid on all its frames, sorted on JD, and their JD's. A cube of the same frames and
+    crop in the resultdir is reused
+    """
+    return star_cubes([starid], vastdir, fitsdir, crop, resultdir, nr_threads)[starid]
+
+
+def star_cubes(
+    starids: List[int], vastdir: str, fitsdir, crop: int, resultdir, nr_threads=None, border: int = CUTOUT_BORDER
+) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """
+    The cubes of stamps of many stars (see star_cube) by star id, cut in one sweep over the frames
+    """
+    result = {}
+    todo = []
+    for starid in starids:
+        path = cube_path(starid, crop, resultdir)
+        image_records, _ = reading.get_star_jd_xy_rot(starid, vastdir)
+        records = sorted(image_records, key=lambda record: record.jd)
+        jds = np.array([record.jd for record in records])
+        if path.exists() and jds_path(path).exists():
+            cube, cube_jds = load_cube(path)
+            if np.array_equal(jds, cube_jds):
+                logging.info(f"Reusing the stamps in {path}")
+                result[starid] = cube, cube_jds
+                continue
+        todo.append((starid, path, records, jds))
+    if not todo:
+        return result
+    cubes = cutout_cubes(
+        [records for _, _, records, _ in todo], [path for _, path, _, _ in todo], fitsdir, crop, nr_threads, border
+    )
+    for cube, (starid, _, _, jds) in zip(cubes, todo):
+        result[starid] = cube, jds
+    return result
+
+
+def movie_frames(cube: np.ndarray, vmin=MOVIE_VMIN, vmax=MOVIE_VMAX, scale: int = 1):
+    """ the stamps of the cube as gray 8 bit images with even sides, enlarged scale times, origin lower left """
+    for stamp in cube:
+        gray = ((np.clip(stamp, vmin, vmax) - vmin) * (255 / (vmax - vmin))).astype(np.uint8)[::-1]
+        gray = gray.repeat(scale, axis=0).repeat(scale, axis=1)
+        # most encoders need even sides
+        yield np.pad(gray, ((0, gray.shape[0] % 2), (0, gray.shape[1] % 2)), mode="edge")
+
+
+def ffmpeg_command(path: Path, width: int, height: int, fps: int, subtitles: Path = None) -> List[str]:
+    """ ffmpeg reading gray 8 bit frames on stdin and encoding them to path, with the subtitles as a text track """
+    command = ["ffmpeg", "-y", "-loglevel", "error"]
+    command += ["-f", "rawvideo", "-pix_fmt", "gray", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"]
+    if subtitles is not None:
+        command += ["-i", str(subtitles), "-c:s", "mov_text"]
+    return command + ["-c:v", "libx264", "-pix_fmt", "yuv420p", str(path)]
+
+
+def write_subtitles(path: Path, jds, fps: int):
+    """ an SRT file showing the JD of every frame """
+
+    def timestamp(seconds: float) -> str:
+        milliseconds = round(seconds * 1000)
+        return (
+            f"{milliseconds // 3600000:02}:{milliseconds // 60000 % 60:02}:{milliseconds // 1000 % 60:02},"
+            f"{milliseconds % 1000:03}"
+        )
+
+    with open(path, "w") as fp:
+        for index, jd in enumerate(jds):
+            fp.write(f"{index + 1}\n{timestamp(index / fps)} --> {timestamp((index + 1) / fps)}\nJD: {jd}\n\n")
+
+
+def write_movie(cube: np.ndarray, jds, path: Path, fps: int, vmin=MOVIE_VMIN, vmax=MOVIE_VMAX):
+    """ encodes the stamps of the cube to the movie at path, the frames are piped straight into ffmpeg """
+    if len(cube) == 0:
+        logging.info(f"No stamps for {path}")
+        return
+    scale = max(MOVIE_SIZE // cube.shape[1], 1)
+    frames = movie_frames(cube, vmin, vmax, scale)
+    first = next(frames)
+    subtitles = Path(path).with_suffix(".srt")
+    write_subtitles(subtitles, jds, fps)
+    command = ffmpeg_command(path, first.shape[1], first.shape[0], fps, subtitles)
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE)
+    try:
+        encoder.stdin.write(first.tobytes())
+        for frame in frames:
+            encoder.stdin.write(frame.tobytes())
+    finally:
+        encoder.stdin.close()
+        encoder.wait()
+    if encoder.returncode != 0:
+        logging.error(f"ffmpeg failed with exit code {encoder.returncode} for {path}")
+    else:
+        logging.info(f"Wrote {len(cube)} frames to {path}")
+
+
+def stamp_sheet(cube: np.ndarray, columns=SHEET_COLUMNS, rows=SHEET_ROWS, vmin=MOVIE_VMIN, vmax=MOVIE_VMAX):
+    """
+    Evenly spread stamps of the cube tiled in rows, the first stamp top left, as a gray 8 bit image with a black line
+    between the stamps, and the indexes of the stamps
+    """
+    indexes = np.unique(np.linspace(0, len(cube) - 1, min(columns * rows, len(cube))).round().astype(int))
+    crop = cube.shape[1]
+    nr_rows = -(-len(indexes) // columns)
+    sheet = np.zeros((nr_rows * (crop + 1) - 1, columns * (crop + 1) - 1), dtype=np.uint8)
+    for nr, frame in enumerate(movie_frames(cube[indexes], vmin, vmax)):
+        row, column = divmod(nr, columns)
+        sheet[row * (crop + 1) : row * (crop + 1) + crop, column * (crop + 1) : column * (crop + 1) + crop] = frame[
+            :crop, :crop
+        ]
+    return sheet, indexes
+
+
+def write_stamp_sheet(cube: np.ndarray, jds, path: Path, vmin=MOVIE_VMIN, vmax=MOVIE_VMAX):
+    """ saves the stamp_sheet of the cube to path (.png) and the JD of every stamp on it, row by row, to a .txt """
+    if len(cube) == 0:
+        logging.info(f"No stamps for {path}")
+        return
+    sheet, indexes = stamp_sheet(cube, vmin=vmin, vmax=vmax)
+    plt.imsave(path, sheet, cmap="gray", vmin=0, vmax=255)
+    np.savetxt(Path(path).with_suffix(".txt"), np.asarray(jds)[indexes], fmt="%.5f")
+    logging.info(f"Wrote {len(indexes)} of {len(cube)} stamps to {path}")
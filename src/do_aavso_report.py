@@ -1,5 +1,7 @@
 import aavso
+import airmass
 import logging
+import numpy as np
 from star_description import StarDescription
 import argparse
 import read_camera_filters
@@ -37,6 +39,16 @@ def calculate_airmass(coord, location, jd):
     return alt_azs.secz
 
 
+def chunk_filenames(target_dir: Path, filename_no_ext: str, nr_rows: int, chunk_size=None) -> List[Path]:
+    """ the files of a report of nr_rows observations, split in chunks of chunk_size rows """
+    if chunk_size is None:
+        chunk_size = nr_rows
+    nr_chunks = len(range(0, nr_rows, chunk_size)) if nr_rows > 0 else 0
+    if nr_chunks == 1:
+        return [Path(target_dir, f"{filename_no_ext}_ext.txt")]
+    return [Path(target_dir, f"{filename_no_ext}_ext_{index}.txt") for index in range(1, nr_chunks + 1)]
+
+
 def report(
     star: StarDescription,
     df_curve: DataFrame,
@@ -49,6 +61,9 @@ def report(
     camera_filter=None,
     observer="RMH",
     chunk_size=None,
+    airmass_table: airmass.AirmassTable = None,
+    fitsdir: str = None,
+    fits_index_file: str = None,
 ):
     df = df_curve.sort_values("JD")
     star_match_ucac4 = (
@@ -61,28 +76,47 @@ def report(
     )
     # utils.replace_spaces(f"{star.local_id:05}" if star.aavso_id is None else star.aavso_id)
     starui = utils.get_star_or_catalog_name(star)
-    earth_location = EarthLocation(lat=sitelat, lon=sitelong, height=sitealt * u.m)
+    if airmass_table is None:
+        earth_location = EarthLocation(lat=sitelat, lon=sitelong, height=sitealt * u.m)
+        airmass_table = airmass.AirmassTable(star.coords, earth_location)
     logging.debug(f"Starting aavso report with star:{star}")
     if chunk_size is None:
         chunk_size = df.shape[0]
-    star_chunks = [df[i : i + chunk_size] for i in range(0, df.shape[0], chunk_size)]
-    chunk_counters = 0
+    filenames = chunk_filenames(target_dir, starui.filename_no_ext, df.shape[0], chunk_size)
     kname = check_star.star_descriptions[0].get_metadata("UCAC4").catalog_id
     notes = f"Standard mag: K = {check_star.comp_catalogmags[0]:.3f}"
 
-    filterdict = None
-    # Setting up the filter value
+    # Setting up the filter value, without a camera_filter the one in the header of the fits file of every frame. The
+    # index of those headers is kept in fits_index_file, by default in the fitsdir
     if camera_filter is None:
-        filterdict = read_camera_filters.read_filters()
-        # print(filterdict)
-        filterlambda = lambda x: filterdict[x]
+        filters = read_camera_filters.lookup_filters(fitsdir, df["JD"].astype(float), fits_index_file)
     else:
-        filterlambda = lambda x: camera_filter
+        filters = camera_filter
+    # the check star by frame, adding an offset of 30 to get instrumental mags to be positive (recommended by aavso)
+    check_mags = check_star.get_observation_matrix(df["JD"])[0][:, 0] + 30
+    observations = DataFrame(
+        {
+            "name": var_display_name,
+            "date": df["JD"].to_numpy(),
+            "magnitude": df["realV"].to_numpy(),
+            "magnitude_error": df["realErr"].to_numpy(),
+            "filter": filters,
+            "transformed": "NO",
+            "magnitude_type": "STD",
+            "comparison_name": "ENSEMBLE",
+            "comparison_magnitude": "na",
+            "check_name": kname,
+            "check_magnitude": np.where(np.isnan(check_mags), "na", np.char.mod("%.3f", check_mags)),
+            # floatJD can be heliocentric, the airmass is at the frame JD
+            "airmass": airmass_table.get_airmass(df["JD"].astype(float), star.coords),
+            "group": "na",
+            "chart": "na",
+            "notes": notes,
+        },
+        index=range(df.shape[0]),
+    )
 
-    for chunk in star_chunks:
-        chunk_counters += 1
-        suffix = f"_{chunk_counters}.txt" if len(star_chunks) != 1 else ".txt"
-        filename = Path(target_dir, f"{starui.filename_no_ext}_ext{suffix}")
+    for start, filename in zip(range(0, df.shape[0], chunk_size), filenames):
         with open(filename, "w") as fp:
             writer = aavso.ExtendedFormatWriter(
                 fp,
@@ -92,38 +126,9 @@ def report(
                 type="EXTENDED",
                 obstype="CCD",
             )
-            for _, row in chunk.iterrows():
-                # logging.info(row, type(row))
-                jd = row["JD"]
-                if jd in check_star.observations[0]:
-                    # adding an offset of 30 to get instrumental mags to be positive (recommended by aavso)
-                    check_mag = f"{check_star.observations[0][jd][0] + 30:.3f}"
-                else:
-                    check_mag = "na"
-
-                writer.addrow(
-                    {
-                        "name": var_display_name,
-                        "date": jd,
-                        "magnitude": row["realV"],
-                        "magnitude_error": row["realErr"],
-                        "filter": filterlambda(row["JD"]),
-                        "transformed": "NO",
-                        "magnitude_type": "STD",
-                        "comparison_name": "ENSEMBLE",
-                        "comparison_magnitude": "na",
-                        "check_name": kname,
-                        "check_magnitude": check_mag,
-                        "airmass": calculate_airmass(
-                            star.coords, earth_location, row["floatJD"]
-                        ).value,
-                        "group": "na",
-                        "chart": "na",
-                        "notes": notes,
-                    }
-                )
-            writer.flush()
-    return Path(target_dir, f"{starui.filename_no_ext}_ext.txt")
+            writer.addrows(observations.iloc[start : start + chunk_size])
+    # the first file of a split report
+    return filenames[0] if filenames else Path(target_dir, f"{starui.filename_no_ext}_ext.txt")
 
 
 if __name__ == "__main__":
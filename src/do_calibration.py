@@ -27,11 +27,8 @@ from star_metadata import StarMetaData
 
 
 def get_wcs(wcs_file):
-    hdulist = fits.open(wcs_file)
-    # data = hdulist[0].data.astype(float)
-    header = hdulist[0].header
-    wcs = WCS(header)
-    return wcs
+    # only the header, the file is closed again
+    return WCS(fits.getheader(wcs_file))
 
 
 ############# star description utils #################
@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 from photutils import CircularAperture
 import numpy as np
 
+import fits_frame
 import reading
 import star_metadata
 import utils
@@ -16,11 +17,33 @@ import random
 import do_compstars
 import gc
 import tqdm
+import copy
+import tempfile
+from collections import namedtuple
+from functools import partial
+from pathlib import Path
+import worker_pool
 
 StarDescriptionList = List[StarDescription]
 gc.enable()
 PADDING = 200
 Shape = Tuple[int, int]
+# the reference frame is block averaged to about the number of pixels of the chart (36 inch at 80 dpi)
+CHART_PIXELS = 2880
+# the reference frame behind a chart: data is block averaged over factor x factor pixels (None for no background),
+# shape is the shape of the frame itself
+Background = namedtuple("Background", "data factor shape")
+# a background stretched to gray levels once and padded, data is uint8 with 0 black (None for no background). The
+# raster pixel (0, 0) starts at chart pixel (offset, offset), shape is the shape of the padded frame in chart pixels
+Raster = namedtuple("Raster", "data factor offset shape")
+# the finder chart of a star shows at least this many frame pixels around it, and all its comparison stars
+FINDER_WIDTH = 600
+FINDER_MARGIN = 50
+FINDER_INCHES = 12
+FINDER_SIZES = [7.0, 5.0, 3.0, 4.0]
+FINDER_RANDOM_OFFSET = [True, False, True, False]
+# one finder chart: the star lists are plotted around centre, half is half the width of the window in chart pixels
+FinderChart = namedtuple("FinderChart", "star_lists centre half title path")
 
 
 def set_local_id_label(star_descriptions):
@@ -98,18 +121,28 @@ def plot_it(
     star_lists: List[StarDescriptionList],
     sizes: List[float],
     random_offset: List[bool],
-    fits_data: List[float],
+    raster: Raster,
     wcs,
     title,
     padding: int = PADDING,
     annotate=True,
 ):
-    fig, data = get_plot_with_background_data(fits_data, padding, title)
+    fig, data = get_plot_with_background_data(raster, title)
     logging.debug(f"plotting {[len(x) for x in star_lists]} stars per color")
-    positions = []
     for stars in star_lists:
-        stars = add_pixels(stars, wcs, PADDING)
-        positions.append([(o.xpos, o.ypos) for o in stars])
+        add_pixels(stars, wcs, PADDING)
+    plot_stars(star_lists, sizes, random_offset, annotate)
+    return fig
+
+
+# apertures and labels at the xpos/ypos of the stars, see add_pixels
+def plot_stars(
+    star_lists: List[StarDescriptionList],
+    sizes: List[float],
+    random_offset: List[bool],
+    annotate=True,
+):
+    positions = [[(o.xpos, o.ypos) for o in stars] for stars in star_lists]
     from itertools import cycle
 
     cycol = cycle("rgbcmyk")
@@ -123,21 +156,111 @@ def plot_it(
     if annotate:
         for idx, star in enumerate(star_lists):
             annotate_it(star, -10, 15, random_offset=random_offset[idx], size=10)
-    return fig
 
 
-#  plot_fits is false if no background needs to be plotted, in that case all zeros are used as data
-def get_plot_with_background_data(fits_data: List[float], padding: int, title: str):
-    fig = plt.figure(figsize=(36, 32), dpi=80, facecolor="w", edgecolor="k")
-    plt.title(title, fontsize=40)
-    median = np.median(fits_data)
+def read_background(reference_fits_frame) -> Background:
+    """ the reference frame downsampled for the charts, read in strips instead of as a whole """
+    with fits_frame.FitsFrame(reference_fits_frame) as frame:
+        factor = max(max(frame.shape) // CHART_PIXELS, 1)
+        return Background(frame.downsampled(factor), factor, frame.shape)
+
+
+def rasterize(background: Background, padding: int) -> Raster:
+    """ the background padded and stretched from 0 (white) to 5x the median (black), ready to show on many charts """
+    height, width = background.shape
+    shape = (height + 2 * padding, width + 2 * padding)
+    if background.data is None:
+        return Raster(None, background.factor, 0, shape)
+    factor = background.factor
+    vmax = min(np.median(background.data) * 5, 65536)
+    # the padding in blocks, rounded up
+    pad = -(-padding // factor)
     fits_data = np.pad(
-        fits_data, (padding, padding), "constant", constant_values=(100, 100)
+        background.data, (pad, pad), "constant", constant_values=(100, 100)
     )
-    plt.imshow(
-        fits_data, cmap="gray_r", origin="lower", vmin=0, vmax=min(median * 5, 65536)
-    )
-    return fig, fits_data
+    level = np.clip(fits_data / vmax, 0, 1) if vmax > 0 else np.zeros(fits_data.shape)
+    data = np.round(255 * (1 - level)).astype(np.uint8)
+    return Raster(data, factor, padding - pad * factor, shape)
+
+
+def show_raster(raster: Raster, window: Tuple[float, float, float, float] = None):
+    """
+    Shows the raster in chart pixels, limited to the window (x0, x1, y0, y1) if given. Only the raster pixels in the
+    window are drawn. A raster without data only sets the axes
+    """
+    height, width = raster.shape
+    x0, x1, y0, y1 = (-0.5, width - 0.5, -0.5, height - 0.5) if window is None else window
+    if raster.data is not None:
+        factor, offset = raster.factor, raster.offset
+        rows, columns = raster.data.shape
+        column0 = min(max(int((x0 - offset) // factor), 0), columns)
+        column1 = min(max(int((x1 - offset) // factor) + 1, column0), columns)
+        row0 = min(max(int((y0 - offset) // factor), 0), rows)
+        row1 = min(max(int((y1 - offset) // factor) + 1, row0), rows)
+        # the blocks in the pixels of the frame (shifted by the padding), where the stars are plotted
+        extent = (
+            offset + column0 * factor - 0.5,
+            offset + column1 * factor - 0.5,
+            offset + row0 * factor - 0.5,
+            offset + row1 * factor - 0.5,
+        )
+        plt.imshow(
+            np.asarray(raster.data[row0:row1, column0:column1]),
+            cmap="gray",
+            origin="lower",
+            vmin=0,
+            vmax=255,
+            extent=extent,
+        )
+    plt.xlim(x0, x1)
+    plt.ylim(y0, y1)
+    plt.gca().set_aspect("equal")
+
+
+#  a raster without data gives an empty chart with the axes of the frame
+def get_plot_with_background_data(raster: Raster, title: str):
+    fig = plt.figure(figsize=(36, 32), dpi=80, facecolor="w", edgecolor="k")
+    plt.title(title, fontsize=40)
+    show_raster(raster)
+    return fig, raster.data
+
+
+def finder_chart(
+    star: StarDescription,
+    vsx_stars: StarDescriptionList,
+    comp_stars: StarDescriptionList,
+    check_stars: StarDescriptionList,
+    wcs,
+    title,
+    path,
+) -> FinderChart:
+    """
+    The finder chart of star: a window around it with all comp_stars and check_stars, and the vsx_stars in it. The
+    stars are copies, so their labels can't change before the chart is plotted
+    """
+    star_lists = [[star], list(vsx_stars), list(comp_stars), list(check_stars)]
+    for stars in star_lists:
+        add_pixels(stars, wcs, PADDING)
+    centre = star.xpos, star.ypos
+    half = FINDER_WIDTH // 2
+    for other in star_lists[2] + star_lists[3]:
+        half = max(half, abs(other.xpos - centre[0]) + FINDER_MARGIN, abs(other.ypos - centre[1]) + FINDER_MARGIN)
+    star_lists[1] = [
+        vsx for vsx in star_lists[1] if abs(vsx.xpos - centre[0]) <= half and abs(vsx.ypos - centre[1]) <= half
+    ]
+    star_lists = [[copy.copy(sd) for sd in stars] for stars in star_lists]
+    return FinderChart(star_lists, centre, half, title, path)
+
+
+def plot_finder_chart(chart: FinderChart, raster: Raster):
+    """ saves the finder chart, the data of the raster is the path of its .npy file (memory mapped) """
+    raster = raster._replace(data=np.load(raster.data, mmap_mode="r"))
+    fig = plt.figure(figsize=(FINDER_INCHES, FINDER_INCHES), dpi=80, facecolor="w", edgecolor="k")
+    plt.title(chart.title, fontsize=16)
+    x, y = chart.centre
+    show_raster(raster, (x - chart.half, x + chart.half, y - chart.half, y + chart.half))
+    plot_stars(chart.star_lists, FINDER_SIZES, FINDER_RANDOM_OFFSET)
+    save(fig, chart.path)
 
 
 def save(fig, path):
@@ -151,13 +274,20 @@ def run_standard_field_charts(
     fieldchartsdirs,
     reference_fits_frame,
     comp_stars: ComparisonStars,
+    nr_threads=None,
 ):
+    """
+    The field charts of the field and a finder chart per selected star. The reference frame is read and stretched
+    once, the finder charts are windows of that raster, plotted by nr_threads processes
+    """
     trash_and_recreate_dir(fieldchartsdirs)
 
     # setting the font size for titles/axes
     plt.rcParams.update({"axes.titlesize": "large", "axes.labelsize": "large"})
-    fits_data, _, _ = reading.get_fits_data(reference_fits_frame)
-    fits_data_blank, _, _ = reading.get_fits_data(reference_fits_frame, blank_data=True)
+    background = read_background(reference_fits_frame)
+    raster = rasterize(background, PADDING)
+    # no data, only the shape of the frame
+    blank_raster = rasterize(background._replace(data=None), PADDING)
     SHOW_UPSILON = False
 
     # if SHOW_UPSILON:
@@ -184,7 +314,7 @@ def run_standard_field_charts(
         [all_stars_no_label],
         [4.0],
         [False],
-        fits_data,
+        raster,
         wcs,
         "All detected stars",
         PADDING,
@@ -201,7 +331,7 @@ def run_standard_field_charts(
     # field chart with all vsx stars
     logging.info("Plotting field chart with all VSX variable stars...")
     fig = plot_it(
-        [vsx_labeled], [10.0], [False], fits_data, wcs, "All VSX stars", PADDING
+        [vsx_labeled], [10.0], [False], raster, wcs, "All VSX stars", PADDING
     )
     save(fig, fieldchartsdirs + "vsx_stars_{}".format(len(vsx_labeled)))
 
@@ -213,7 +343,7 @@ def run_standard_field_charts(
         [vsx_labeled],
         [10.0],
         [False],
-        fits_data_blank,
+        blank_raster,
         wcs,
         "VSX without background",
         PADDING,
@@ -222,7 +352,7 @@ def run_standard_field_charts(
 
     # field chart with only the background
     logging.info("Plotting field chart with only the reference field...")
-    fig, _ = get_plot_with_background_data(fits_data, 0, "Reference frame")
+    fig, _ = get_plot_with_background_data(rasterize(background, 0), "Reference frame")
     save(fig, fieldchartsdirs + "only_ref")
 
     # candidate stars get their local id label
@@ -248,7 +378,7 @@ def run_standard_field_charts(
         [vsx_labeled, candidate_labeled],
         [10.0, 5.0],
         [False, True],
-        fits_data,
+        raster,
         wcs,
         "VSX stars + candidate stars",
         PADDING,
@@ -267,7 +397,7 @@ def run_standard_field_charts(
         [vsx_labeled, selected_no_vsx_labeled],
         [10.0, 5.0],
         [False, True],
-        fits_data,
+        raster,
         wcs,
         "VSX stars + selected stars",
         PADDING,
@@ -287,7 +417,8 @@ def run_standard_field_charts(
     )
     # Plotting finder charts for the site
     # field charts for each individually selected starfile star
-    for star in tqdm.tqdm(selected_desc, desc="Field chart for each star"):
+    charts = []
+    for star in selected_desc:
         filtered_compstars, check_star = do_compstars.filter_comparison_stars(
             star, comp_stars
         )
@@ -301,17 +432,29 @@ def run_standard_field_charts(
             check_star_sd, f"Kmag={check_star_sd[0].get_metadata('UCAC4').vmag}"
         )
         starui: utils.StarUI = utils.get_star_or_catalog_name(star, suffix="")
-        fig = plot_it(
-            [[star], vsx_labeled, compstars_labeled, checkstar_labeled],
-            [7.0, 5.0, 3.0, 4.0],
-            [True, False, True, False],
-            fits_data,
-            wcs,
-            f"VSX stars + comp stars + {starui.catalog_name} (star {star.local_id})",
-            PADDING,
+        charts.append(
+            finder_chart(
+                star,
+                vsx_labeled,
+                compstars_labeled,
+                checkstar_labeled,
+                wcs,
+                f"VSX stars + comp stars + {starui.catalog_name} (star {star.local_id})",
+                f"{fieldchartsdirs}vsx_and_star_{starui.filename_no_ext}",
+            )
         )
-        save(fig, f"{fieldchartsdirs}vsx_and_star_{starui.filename_no_ext}")
-        gc.collect()
+    if not charts:
+        return
+    # the workers memory map the raster instead of getting a copy with every chart
+    with tempfile.TemporaryDirectory() as tempdir:
+        raster_file = Path(tempdir, "raster.npy")
+        np.save(raster_file, raster.data)
+        func = partial(plot_finder_chart, raster=raster._replace(data=raster_file))
+        with worker_pool.get_pool(nr_threads) as pool:
+            for _ in tqdm.tqdm(
+                pool.imap_unordered(func, charts), total=len(charts), desc="Field chart for each star"
+            ):
+                pass
 
 
 if __name__ == "__main__":
@@ -1,3 +1,5 @@
+""" Create charts showing statistics on the detected stars, variables, ... """
+
 import matplotlib
 import numpy as np
 import matplotlib.pyplot as plt
@@ -11,16 +13,12 @@ import reading
 from pathlib import Path
 from typing import List, Dict
 import utils
-import do_aavso_report
+import airmass
 from star_description import StarDescription
 from star_metadata import CompStarData
 import re
-import toml
-from astropy.coordinates import SkyCoord, EarthLocation
-from astropy import units as u
 from utils import StarDict
-
-""" Create charts showing statistics on the detected stars, variables, ... """
+from result_store import ResultStore
 
 
 def get_fig_and_ax():
@@ -165,19 +163,24 @@ def get_aperture_and_jd(vastdir: str, jdfilter: List[float]):
     return utils.jd_filter_array(x, y, jdfilter)
 
 
-def plot_merr_vs_jd(chartsdir: str, stars: List[StarDescription], jdfilter):
-    dfs = reading.read_lightcurve_sds(stars)
+def plot_merr_vs_jd(chartsdir: str, stars: List[StarDescription], jdfilter, store: ResultStore = None):
+    """ the magnitude errors of the lightcurves in the result store, stars not in the store are read from disk """
+    stored = [x for x in stars if store is not None and x.local_id in store]
+    not_stored = [x for x in stars if store is None or x.local_id not in store]
+    dfs = [store.get_lightcurve(x.local_id) for x in stored]
+    for df in reading.read_lightcurve_sds(not_stored) if not_stored else []:
+        df["floatJD"] = df["JD"].astype(float)
+        df["realErr"] = df["err"]
+        dfs.append(utils.jd_filter_df(df, jdfilter))
     for star, df in tqdm(
-        zip(stars, dfs),
+        zip(stored + not_stored, dfs),
         desc="Plotting magnitude error vs jd",
         unit="star",
         total=len(stars),
     ):
-        df["floatJD"] = df["JD"].astype(np.float)
-        df = utils.jd_filter_df(df, jdfilter)
         starui: utils.StarUI = utils.get_star_or_catalog_name(star)
         fig, ax = get_fig_and_ax()
-        ax.plot(df["floatJD"], df["err"], "*r", markersize=2)
+        ax.plot(df["floatJD"], df["realErr"], "*r", markersize=2)
         ax.set_title("Magnitude error vs JD")
         plt.xlabel("JD (day)")
         plt.ylabel("Mag error (mag)")
@@ -203,23 +206,14 @@ def get_jd_aperture_from_catinfo(filename):
     return None
 
 
-def plot_aperture_vs_airmass(chartsdir: str, vastdir: str, wcs, jdfilter: List[float]):
+def plot_aperture_vs_airmass(
+    chartsdir: str, vastdir: str, wcs, jdfilter: List[float], airmass_table: airmass.AirmassTable = None
+):
     x, y = get_aperture_and_jd(vastdir, jdfilter)
-    settings = toml.load("settings.txt")
-    sitelat = settings["sitelat"]
-    sitelong = settings["sitelong"]
-    sitealt = settings["sitealt"]
-    earth_location = EarthLocation(lat=sitelat, lon=sitelong, height=sitealt * u.m)
-
-    xair = []
-    central_coord = SkyCoord.from_pixel(
-        wcs.pixel_shape[0] / 2.0, wcs.pixel_shape[1] / 2.0, wcs=wcs, origin=0
-    )
-    for entry in tqdm(x, total=len(x), desc="Calculating airmass", unit="JD"):
-        result = do_aavso_report.calculate_airmass(
-            central_coord, earth_location, entry
-        ).value
-        xair.append(result)
+    if airmass_table is None:
+        airmass_table = airmass.AirmassTable.of_settings(airmass.wcs_centre(wcs))
+    central_coord = airmass_table.centre
+    xair = airmass_table.get_airmass(np.asarray(x, dtype=float))
 
     fig, ax = get_fig_and_ax()
     ax.plot(xair, y, "*r", markersize=2)
@@ -1,26 +1,38 @@
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 
 import toml
 from matplotlib.ticker import FormatStrFormatter
 
-import main_vast
 import do_compstars
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import matplotlib as mplotlib
-import multiprocessing as mp
 import tqdm
 import numpy as np
+import airmass
 import do_aavso_report
 import do_calibration
+import periodogram
+import lightcurve_cleaning
+import figure_templates
+import period_engines
 import reading
+import scheduler
+import time_correction
 import utils
+import worker_pool
 import math
+import os
+import shutil
 import logging
 import gc
 from collections import namedtuple
-from multiprocessing import cpu_count, Manager
+from multiprocessing import cpu_count
 from comparison_stars import ComparisonStars
+from calibrated_lightcurves import CalibratedLightcurves
+from period_cache import PeriodCache
+from result_store import ResultStore
+from run_manifest import RunManifest
 from functools import partial
 from gatspy.periodic import LombScargleFast
 from gatspy.periodic import TrendedLombScargle
@@ -31,13 +43,21 @@ from pathlib import Path
 import pandas as pd
 from pandas import DataFrame, Series
 
-# from aovgui import aovcli
 from star_metadata import SiteData, CatalogData, CompStarData
 
 gc.enable()
 mplotlib.use("Agg")  # needs no X server
-Period = namedtuple("period", "period origin")
-TITLE_PAD = 40
+# err is the 1 sigma uncertainty of the period, if known
+Period = namedtuple("Period", "period origin err", defaults=(None,))
+# the stars of one pass of run (e.g. the vsx stars) and the dirs of their outputs, relative to the resultdir
+ChartGroup = namedtuple("ChartGroup", "stars phasepart chartspart aavsopart")
+# the output dirs of a ChartGroup
+ChartDirs = namedtuple("ChartDirs", "phasedir chartsdir aavsodir")
+# the manifest of a resumable run is written after every this many rendered stars
+MANIFEST_FLUSH = 20
+# the stars which were killed for exceeding their budget, in the resultdir
+FAILURES_FILE = "failed_stars.csv"
+
 
 def interact():
     import code
@@ -132,60 +152,36 @@ def _plot_lightcurve(star: StarDescription, curve: DataFrame, chartsdir, suffix=
             curve["realJD"] = curve["floatJD"]
         else:
             curve['realJD'] = jd_adjusting_func(curve['floatJD'])
-        fig = plt.figure(figsize=(plot_width, plot_height), dpi=plot_dpi, facecolor='w', edgecolor='k')
-        if errorbars:
-            plt.errorbar(
-                curve["realJD"],
-                curve["realV"],
-                yerr=curve["realErr"],
-                linestyle="none",
-                marker="o",
-                ecolor="gray",
-                elinewidth=1,
-                ms=markersize,
-            )
-        else:
-            plt.plot(
-                curve["realJD"],
-                curve["realV"],
-                linestyle="none",
-                linewidth="1",
-                marker="o",
-                ms=markersize,
-            )
-        plt.xlabel(xlabel, labelpad=TITLE_PAD)
+        template = figure_templates.get_template(
+            width=plot_width,
+            height=plot_height,
+            dpi=plot_dpi,
+            xlabel=xlabel,
+            markersize=markersize,
+            errorbars=errorbars,
+            rotate=rotate,
+            integer_x=True,
+        )
         curve_max = curve["realV"].max()
         curve_min = curve["realV"].min()
         jd_min = curve["realJD"].min()
         jd_max = curve["realJD"].max()
         plot_max = curve_max + 0.1
         plot_min = curve_min - 0.1
-        plt.ylim(plot_min, plot_max)
-        plt.xlim(jd_min, jd_max)
-        # plt.xticks(range(math.floor(jd_min), math.ceil(jd_max)))
-
-        # nop = lambda *a, **k: None
-        # print("limits are here:", star_id, "min:", curve['realJD'].min(), "max", curve['realJD'].max(),
-        #       "first 10", curve['realJD'][:10], "first 10 orig:", curve['floatJD'][:10], "len", len(curve['realJD']),
-        #       "describe", curve['realJD'].describe()) \
-        #     if curve['realJD'].max() == 0 else nop()
-
-        plt.gca().invert_yaxis()
-        plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-        plt.title(plot_title, pad=TITLE_PAD)
-        plt.ticklabel_format(useOffset=False, style="plain")
-        if rotate:
-            plt.xticks(rotation=25)
-        plt.tight_layout()
-
+        start = timer()
+        template.render(
+            curve["realJD"],
+            curve["realV"],
+            curve["realErr"],
+            plot_title,
+            xlim=(jd_min, jd_max),
+            ylim=(plot_min, plot_max),
+            save_location=save_location if write_plot else None,
+        )
         if write_plot:
-            start = timer()
-            fig.savefig(save_location)
-            end = timer()
-            logging.debug(f"timing saving fig {end - start}")
-            plt.close(fig)
-            plt.clf()
+            logging.debug(f"timing saving fig {timer() - start}")
             return save_location
+        plt.figure(template.fig.number)
         return plt, curve["realJD"], curve["realV"]
     except Exception as ex:
         template = "An exception of type {0} occurred. Arguments:\n{1!r}"
@@ -365,10 +361,14 @@ def write_toml(
             ] = f"{sitedata.var_min:.2f}-{sitedata.var_max:.2f} ({sitedata.source})"
         if sitedata.period_err is not None and not aperiodic:
             tomldict["period_err"] = sitedata.period_err
+    if period.err is not None and tomldict["period"] is not None:
+        tomldict["period_err"] = float(period.err)
 
     outputfile = f"{fullphasedir}/txt/{filename_no_ext}.txt"
     logging.debug(f"Writing toml to {outputfile}")
-    toml.dump(tomldict, open(outputfile, "w"))
+    with open(outputfile, "w") as fp:
+        toml.dump(tomldict, fp)
+    return tomldict
 
 def define_colors(normal_color, special_color, location, color_len):
     """ Create array of same colors, except on different color on a location (if location is not None) """
@@ -391,40 +391,24 @@ def _plot_phase_diagram(
     period: Period,
     upsilon_text,
 ):
-    fig = plt.figure(figsize=(18, 16), dpi=80, facecolor="w", edgecolor="k")
-    plt.xlabel("Phase", labelpad=TITLE_PAD)
-    plt.ylabel("Magnitude", labelpad=TITLE_PAD)
-    plt.title(
+    template = figure_templates.get_template(
+        width=18, height=16, dpi=80, xlabel="Phase", ylabel="Magnitude", plain_x_only=True
+    )
+    title = (
         f"{catalog_title}\nStar {star.local_id}, p: {period.period:.5f} d ({period.origin}) "
-        # f"{upsilon_text}\n{utils.get_hms_dms_matplotlib(star.coords)}", pad=TITLE_PAD)
-        f"{upsilon_text}",
-        pad=TITLE_PAD,
+        f"{upsilon_text}"
     )
-    plt.ticklabel_format(style="plain", axis="x")
-    plt.tight_layout()
-
-    plt.gca().invert_yaxis()
-    plt.errorbar(
+    template.render(
         phased_t_final,
         phased_lc_final,
-        yerr=phased_err,
-        linestyle="none",
-        marker="o",
-        ecolor="gray",
-        elinewidth=1,
-        color='C0',
-        mfc='C0',
-        zorder=0
+        phased_err,
+        title,
+        save_location=save_location if write_plot else None,
     )
-    # print(f"loc = {location}, shape {phased_t_final.shape}, shape2 {phased_t_final[location].shape} t loc = {phased_t_final[location]}, lc = {phased_lc_final[location]}")
-    # if location is not None:
-    #     plt.scatter(phased_t_final[location], phased_lc_final[location], color='r', zorder=100)
     if write_plot:
-        logging.debug(f"Saving phase plot to {save_location}")
-        fig.savefig(save_location, format="png")
-        plt.close(fig)
-        plt.clf()
+        logging.debug(f"Saved phase plot to {save_location}")
     else:
+        plt.figure(template.fig.number)
         return plt
 
 
@@ -449,55 +433,34 @@ def write_compstars(star, filename_no_ext, fullphasedir, compstars, check_star)
         return outputfile
 
 
-def read_vast_lightcurves(
-    star: StarDescription,
-    compstarproxy,
-    star_result_dict,
-    do_light,
-    do_light_raw,
-    do_phase,
-    do_aavso,
-    aavso_limit,
-    basedir: str,
-    chartsdir: Path,
-    phasedir: Path,
-    aavsodir: Path,
-    jdfilter: List[float] = None,
-    jd_excl_stop: float = None,
+def compute_star(
+    star_curve_period_dirs: Tuple[StarDescription, DataFrame, Period, List[ChartDirs]],
+    comp_stars: ComparisonStars,
+    store: ResultStore,
+    max_err: float = None,
+    search_settings: period_engines.SearchSettings = period_engines.SearchSettings(),
 ):
+    """
+    First stage of run: period, epoch, cleaning and min/max of one star. Writes the toml and comp stars files and
+    puts the cleaned lightcurve and the results in the store, for the render stage. The files are written to the
+    first dirs and linked into the others. Returns the star and its result files (see StarDescription.result) on success
+    """
     start = timer()
-    if star.local_id not in star_result_dict:
-        star_result_dict[star.local_id] = {}
-    temp_dict = star_result_dict[star.local_id]
+    star, df, batch_period, dirs = star_curve_period_dirs
+    phasedir = dirs[0].phasedir
+    temp_dict = {}
     if star.path == "":
         logging.debug(f"Path for {star.local_id} is empty")
         return
-    if not do_light and not do_phase:
-        logging.debug("Nothing to do, no charts or phase needed")
-
-    logging.debug(
-        f"Reading lightcurves for star {star.local_id} at path {star.path} for {star}..."
-    )
-    # comp_mags = [x.vmag for x in comparison_stars]
-
+    logging.debug(f"Computing star {star.local_id} at path {star.path} for {star}...")
     try:
-        df = reading.read_lightcurve_vast(star.path)
-        df["floatJD"] = df["JD"].astype(np.float)
-        df = utils.jd_filter_df(df, jdfilter)
+        # df is the calibrated lightcurve (JD, floatJD, realV, realErr) from the batch ensemble photometry
         if df is None or len(df) == 0:
             logging.info(f"No lightcurve found for {star.path}")
             return
-        comp_stars = compstarproxy.value
         filtered_compstars, check_star = do_compstars.filter_comparison_stars(
             star, comp_stars
         )
-        comp_stars = None
-        df["realV"], df["realErr"] = do_compstars.calculate_ensemble_photometry(
-            df, filtered_compstars, do_compstars.weighted_value_ensemble_method
-        )
-        df = df.dropna(
-            subset=["realV", "realErr"]
-        )  # drop rows where the ensemble photometry failed
         do_calibration.add_catalog_data_to_sd(
             star,
             df["realV"].mean(),
@@ -507,20 +470,28 @@ def read_vast_lightcurves(
             star.coords,
         )
         starui: utils.StarUI = utils.get_star_or_catalog_name(star, suffix="")
-        period, epoch = determine_period_and_epoch(df, star)
+        period, epoch = determine_period_and_epoch(df, star, period=batch_period)
+        period = add_bootstrap_error(df, star, period, search_settings)
         # override user calculated epoch with user-supplied epoch
         if(star.has_metadata("SITE") and star.get_metadata("SITE").epoch is not None):
             epoch = star.get_metadata("SITE").epoch
 
-        # filter depending on phase diagram
-        df, points_removed = phase_dependent_outlier_removal(df, period)
+        # the jdfilter was applied to the frame JDs by the batch photometry, floatJD may be HJD/BJD
+        mask, removed = lightcurve_cleaning.clean_lightcurve(
+            df["floatJD"].to_numpy(),
+            df["realV"].to_numpy(),
+            df["realErr"].to_numpy(),
+            None if period is None else period.period,
+            max_err=max_err,
+        )
+        # the sigma clipped outliers, as always
+        df, points_removed = df[mask], removed.outliers
         temp_dict["compstars"] = write_compstars(
             star, starui.filename_no_ext, phasedir, filtered_compstars, check_star
         )
         ymin, ymax, epoch_min, epoch_max, t_start, t_end = *calculate_min_max_epochs(df["floatJD"], df["realV"]),
-        print("Debug for the min/max percentiles:", ymin, ymax, epoch_min, epoch_max, t_start, t_end)
         logging.debug(f"Calculating min/max/epochs: {ymin}, {ymax}, not used: {epoch_min}, {epoch_max}")
-        write_toml(
+        info = write_toml(
             starui.filename_no_ext,
             phasedir,
             period,
@@ -530,15 +501,56 @@ def read_vast_lightcurves(
             ymin, ymax,
             t_start, t_end
         )
+        link_to_groups([Path(phasedir, "txt", f"{starui.filename_no_ext}.txt"), temp_dict["compstars"]], dirs)
+        store.put(star.local_id, df, period, epoch, info)
+        return star, temp_dict
+    except Exception as ex:
+        template = "An exception of type {0} occurred. Arguments:\n{1!r}"
+        message = template.format(type(ex).__name__, ex.args)
+        logging.error(message)
+        import traceback
+
+        print(traceback.print_exc())
+        logging.error(
+            f"Exception during compute_star for {star.path}, size JD: {len(df['floatJD'])},"
+            f"size V:  {len(df['realV'])}"
+        )
+    finally:
+        logging.debug(f"Computing star: {timer() - start}")
+
 
+def render_star(
+    star_dirs: Tuple[StarDescription, List[ChartDirs]],
+    comp_stars: ComparisonStars,
+    store: ResultStore,
+    do_light,
+    do_light_raw,
+    do_phase,
+    do_aavso,
+    aavso_limit,
+    airmass_table: airmass.AirmassTable = None,
+):
+    """
+    Second stage of run: the plots and the AAVSO report of one star, from its results in the store. The files are
+    written to the first dirs and linked into the others, the airmass of the report is read from the airmass_table of
+    the field. Returns the local id of the star and its result files on success
+    """
+    start = timer()
+    star, dirs = star_dirs
+    phasedir, chartsdir, aavsodir = dirs[0]
+    computed = store.get_computed(star.local_id)
+    if computed is None:
+        logging.debug(f"No computed results for star {star.local_id}, nothing to render")
+        return
+    temp_dict = {}
+    df = store.get_lightcurve(star.local_id)
+    period = Period(computed["period"], computed["origin"], computed["err"])
+    epoch = computed["epoch"]
+    try:
         if do_phase and "phase" not in star.result:
             temp_dict["phase"] = plot_phase_diagram(
                 star, df.copy(), phasedir, period=period, epoch=epoch, suffix=""
             )
-            # anova_period, epoch = determine_period_and_epoch(df, star, method=anova_period_calculate)
-            # logging.info(f"anova period is {anova_period}")
-            # temp_dict['phase'] = plot_phase_diagram(star, df.copy(), phasedir, period=anova_period,
-            #                                         epoch=epoch, suffix="b")
         if do_light and "lightpa" not in star.result:
             temp_dict["lightpa"] = plot_lightcurve_pa(
                 star, df.copy(), chartsdir, period
@@ -553,6 +565,9 @@ def read_vast_lightcurves(
         if do_light_raw and "light" not in star.result:
                 temp_dict["light"] = plot_lightcurve_raw(star, df.copy(), chartsdir)
         if do_aavso and "aavso" not in star.result:
+            filtered_compstars, check_star = do_compstars.filter_comparison_stars(
+                star, comp_stars
+            )
             settings = toml.load("settings.txt")
             temp_dict["aavso"] = do_aavso_report.report(
                 star,
@@ -566,9 +581,15 @@ def read_vast_lightcurves(
                 camera_filter="V",
                 observer=settings["observer"],
                 chunk_size=aavso_limit,
+                airmass_table=airmass_table,
             )
-            filtered_compstars = None
-        star_result_dict[star.local_id] = temp_dict
+        files = [value for key, value in temp_dict.items() if key != "aavso"]
+        if "aavso" in temp_dict:
+            files += do_aavso_report.chunk_filenames(
+                aavsodir, utils.get_star_or_catalog_name(star).filename_no_ext, len(df), aavso_limit
+            )
+        link_to_groups(files, dirs)
+        return star.local_id, temp_dict
     except Exception as ex:
         template = "An exception of type {0} occurred. Arguments:\n{1!r}"
         message = template.format(type(ex).__name__, ex.args)
@@ -576,30 +597,9 @@ def read_vast_lightcurves(
         import traceback
 
         print(traceback.print_exc())
-        logging.error(
-            f"Exception during read_lightcurve for {star.path}, size JD: {len(df['floatJD'])},"
-            f"size V:  {len(df['realV'])}"
-        )
-
-    end = timer()
-    logging.debug(f"Full lightcurve/phase: {end - start}")
-
-
-def phase_dependent_outlier_removal(
-    df: DataFrame, period: Period, stdev=5
-) -> Tuple[DataFrame, int]:
-    phased_t = np.fmod(df["floatJD"] / period.period, 1)
-    # array of times rounded to 1 decimal, results in 11 buckets which cover the phase diagram from 0.0 to 1.0
-    grouper = np.round(phased_t, 1)
-    df_v_grouped = df.groupby(grouper)
-    maskresult = pd.DataFrame()
-    for bucket_label, bucket_all in df_v_grouped:
-        bucket = bucket_all["realV"]
-        bucketmean = bucket.median()
-        bucketstd = bucket.std()
-        mask = abs(bucket - bucketmean) < stdev * bucketstd
-        maskresult = maskresult.append(bucket_all[mask])
-    return maskresult, len(df) - len(maskresult)
+        logging.error(f"Exception during render_star for {star.path}")
+    finally:
+        logging.debug(f"Rendering star: {timer() - start}")
 
 
 def lombscargle_period_calculate(
@@ -611,17 +611,13 @@ def lombscargle_period_calculate(
     return period, epoch
 
 
-# def anova_period_calculate(df: DataFrame, star: StarDescription) -> Tuple[Period, str]:
-#     aov = aovcli.AOVClass()
-#     period: Period = Period(aov.run(df.copy())[0], 'ANOVA')
-#     logging.debug(f"Using ANOVA period for star {star.local_id}: {period}")
-#     epoch = None
-#     return period, epoch
-
-
 def determine_period_and_epoch(
-    df: DataFrame, star: StarDescription, method=lombscargle_period_calculate
+    df: DataFrame, star: StarDescription, method=lombscargle_period_calculate, period: Period = None
 ) -> Tuple[Period, str]:
+    # period already calculated for this star, e.g. by calculate_batch_periods
+    if period is not None:
+        logging.debug(f"Using precalculated period for star {star.local_id}: {period}")
+        return period, None
     if star.has_metadata("SITE") and star.get_metadata("SITE").period is not None:
         return _preset_period(star)
     return method(df.copy(), star)
@@ -638,12 +634,235 @@ def _preset_period(star):
     return period, epoch
 
 
+def relocate(path, fromdirs: ChartDirs, todirs: ChartDirs) -> Path:
+    """ the path of an output file in fromdirs, in todirs """
+    path = Path(path)
+    for fromdir, todir in zip(fromdirs, todirs):
+        if fromdir in path.parents:
+            return Path(todir, path.relative_to(fromdir))
+    raise ValueError(f"{path} is not in the output dirs {fromdirs}")
+
+
+def link_to_groups(files, dirs: List[ChartDirs]):
+    """ hard links (or copies) the output files of a star in the first dirs into the other dirs """
+    for file in files:
+        if file is None:
+            continue
+        for todirs in dirs[1:]:
+            target = relocate(file, dirs[0], todirs)
+            if target.exists():
+                target.unlink()
+            try:
+                os.link(file, target)
+            except OSError:
+                shutil.copy2(file, target)
+
+
+def manifest_key(star: StarDescription, df: DataFrame, *params) -> str:
+    """ key of the inputs of a star: its lightcurve, comparison stars, SITE data (e.g. a known period) and params """
+    compstars: CompStarData = star.get_metadata("COMPSTARS")
+    comp_set = None if compstars is None else (sorted(compstars.compstar_ids), compstars.extra_id)
+    return RunManifest.key(df, comp_set, star.get_metadata("SITE"), *params)
+
+
+def skip_completed_stars(
+    star_descriptions: List[StarDescription],
+    keys: Dict[int, str],
+    star_manifests: Dict[int, List[RunManifest]],
+    store: ResultStore,
+) -> Tuple[List[StarDescription], Dict[int, dict]]:
+    """
+    The stars which still have to be charted, and the result files of the others. A star is completed when it is done
+    in the manifests of all of its groups, its result files are those of its first group
+    """
+    remaining, completed = [], {}
+    for star in star_descriptions:
+        manifests = star_manifests[star.local_id]
+        if star.local_id in store and all(
+            manifest.is_done(star.local_id, keys[star.local_id]) for manifest in manifests
+        ):
+            completed[star.local_id] = manifests[0].get_outputs(star.local_id)
+        else:
+            remaining.append(star)
+    logging.info(
+        f"Resuming: skipping {len(star_descriptions) - len(remaining)} completed stars, "
+        f"{len(remaining)} stars remaining"
+    )
+    return remaining, completed
+
+
+def add_bootstrap_error(
+    df: DataFrame, star: StarDescription, period: Period, search_settings: period_engines.SearchSettings
+) -> Period:
+    """ adds a bootstrap error to a calculated period without error, preset (SITE) periods are left alone """
+    if (
+        search_settings.bootstrap_resamples < 1
+        or period is None
+        or period.err is not None
+        or (star.has_metadata("SITE") and star.get_metadata("SITE").period is not None)
+    ):
+        return period
+    err = periodogram.bootstrap_period_error(
+        df["floatJD"].to_numpy(),
+        df["realV"].to_numpy(),
+        df["realErr"].to_numpy(),
+        period.period,
+        search_settings.bootstrap_resamples,
+        search_settings.bootstrap_seconds,
+        # the same resamples on every run
+        np.random.default_rng(star.local_id),
+    )
+    logging.debug(f"Bootstrap period error for star {star.local_id}: {err}")
+    return period if np.isnan(err) else period._replace(err=err)
+
+
 def calculate_ls_period_from_df(df: DataFrame) -> Period:
     return calculate_ls_period(
         df["floatJD"], df["realV"].to_numpy(), df["realErr"].to_numpy()
     )
 
 
+def calculate_batch_periods(
+    star_descriptions: List[StarDescription],
+    calibrated: CalibratedLightcurves,
+    cache: PeriodCache = None,
+    period_engine: str = "LS",
+    vartype_engines: Dict[str, str] = None,
+    search_settings: period_engines.SearchSettings = period_engines.SearchSettings(),
+) -> Dict[int, Period]:
+    """
+    Periods of all stars without a preset period, in one pass per period engine over a coarse frequency grid shared
+    by all stars, refined per star around the highest peaks. The engine of a star is chosen by its var type
+    (see period_engines.select_engine_name).
+    With search_settings.refine_priors, stars with a SITE or VSX period are first searched in a narrow window
+    around that period. Only VSX stars without a significant peak there get the full search, SITE stars keep their
+    preset period
+    """
+    priors = {}
+    if search_settings.refine_priors:
+        for star in star_descriptions:
+            prior = get_prior_period(star)
+            if prior is not None and star.local_id in calibrated:
+                priors[star.local_id] = prior
+    star_engines = {
+        star.local_id: period_engines.select_engine_name(
+            star.get_metadata("SITE").var_type if star.has_metadata("SITE") else None,
+            period_engine,
+            vartype_engines,
+        )
+        for star in star_descriptions
+        if star.local_id in calibrated
+        and not (star.has_metadata("SITE") and star.get_metadata("SITE").period is not None)
+    }
+    star_ids = list(dict.fromkeys(list(priors.keys()) + list(star_engines.keys())))
+    if len(star_ids) == 0:
+        return {}
+    star_index = {star_id: idx for idx, star_id in enumerate(star_ids)}
+    columns = [calibrated.get_star_index(star_id) for star_id in star_ids]
+    mags, errs = calibrated.mags[:, columns], calibrated.errs[:, columns]
+    # frames on which none of these stars are measured don't contribute
+    frames = ~np.isnan(mags).all(axis=1)
+    t, mags, errs = calibrated.floatjds[frames], mags[frames], errs[frames]
+    start = timer()
+    periods = {}
+    if len(priors) > 0:
+        prior_idx = [star_index[star_id] for star_id in priors]
+        refined, refined_errs, significant = periodogram.refine_prior_periods(
+            t, mags[:, prior_idx], errs[:, prior_idx], [x.period for x in priors.values()]
+        )
+        for idx, star_id in enumerate(priors):
+            if significant[idx]:
+                periods[star_id] = Period(
+                    refined[idx], f"{priors[star_id].origin} refined", refined_errs[idx]
+                )
+        logging.info(f"Refined {len(periods)} of {len(priors)} prior periods")
+    frequencies = period_engines.get_coarse_grid(t, search_settings)
+    result = {}
+    keys = {}
+    search_ids = [star_id for star_id in star_engines if star_id not in periods]
+    if cache is not None:
+        for star_id in search_ids:
+            idx = star_index[star_id]
+            keys[star_id] = cache.key(
+                t, mags[:, idx], errs[:, idx], frequencies,
+                f"{star_engines[star_id]} top_peaks={search_settings.top_peaks}",
+            )
+            cached = cache.get(keys[star_id])
+            if cached is not None:
+                result[star_id] = cached[0]
+    nr_cached = len(result)
+    for engine_name in sorted(set(star_engines.values())):
+        todo_ids = [
+            star_id
+            for star_id in search_ids
+            if star_id not in result and star_engines[star_id] == engine_name
+        ]
+        if len(todo_ids) == 0 or len(frequencies) == 0:
+            continue
+        todo = [star_index[star_id] for star_id in todo_ids]
+        todo_mags, todo_errs = mags[:, todo], errs[:, todo]
+        # without a max_period the period of every star is limited to the baseline of its own observations, like the
+        # search of a single star
+        min_frequencies = None
+        if search_settings.max_period is None:
+            min_frequencies = periodogram.baseline_min_frequencies(t, todo_mags, search_settings.min_period)
+        for stars, frequency, power, powers in period_engines.coarse_to_fine(
+            engine_name, t, todo_mags, todo_errs, frequencies, min_frequencies, search_settings.top_peaks
+        ):
+            for batch_idx, star_id in enumerate(todo_ids[stars]):
+                result[star_id] = 1.0 / frequency[batch_idx]
+                if cache is not None:
+                    cache.put(
+                        keys[star_id], result[star_id], power[batch_idx], frequencies, powers[batch_idx]
+                    )
+    logging.info(
+        f"Batch periods of {len(star_ids)} stars ({nr_cached} cached) in {timer() - start:.1f} s"
+    )
+    for star_id, period in result.items():
+        if not np.isnan(period):
+            periods[star_id] = Period(period, star_engines[star_id])
+    return periods
+
+
+def get_prior_period(star: StarDescription) -> Period:
+    """ the period of the SITE metadata (selected file or VSX), or else the catalog period of the VSX match """
+    if star.has_metadata("SITE") and star.get_metadata("SITE").period is not None:
+        sitedata = star.get_metadata("SITE")
+        return Period(sitedata.period, sitedata.source)
+    vsx = star.get_metadata("VSX")
+    if vsx is None or vsx.extradata is None:
+        return None
+    try:
+        period = float(vsx.extradata["Period"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return Period(period, "VSX") if period > 0 else None
+
+
+def engine_period_calculate(
+    df: DataFrame,
+    star: StarDescription,
+    engine_name: str = "LS",
+    search_settings: period_engines.SearchSettings = period_engines.SearchSettings(),
+) -> Tuple[Period, str]:
+    """ the period of one star with one of the period_engines, usable as method of determine_period_and_epoch """
+    t = df["floatJD"].to_numpy()
+    frequencies = period_engines.get_coarse_grid(t, search_settings)
+    _, frequency, _, _ = next(
+        period_engines.coarse_to_fine(
+            engine_name,
+            t,
+            df["realV"].to_numpy(),
+            df["realErr"].to_numpy(),
+            frequencies,
+            top_peaks=search_settings.top_peaks,
+        )
+    )
+    period: Period = Period(1.0 / frequency[0], engine_name)
+    logging.debug(f"Using {engine_name} period for star {star.local_id}: {period}")
+    return period, None
+
+
 def calculate_ls_period(t_np, y_np, dy_np) -> Period:
     period_max = np.max(t_np) - np.min(t_np)
     if period_max <= 0.01:
@@ -663,13 +882,10 @@ def calculate_ls_period(t_np, y_np, dy_np) -> Period:
 
 # reads lightcurves and passes them to lightcurve plot or phase plot
 def run(
-    star_descriptions,
+    groups: List[ChartGroup],
     comp_stars: ComparisonStars,
     basedir: str,
     resultdir: str,
-    phasepart: str,
-    chartspart: str,
-    aavso_part: str,
     do_light=False,
     do_light_raw=False,
     do_phase=True,
@@ -677,53 +893,226 @@ def run(
     aavsolimit=None,
     nr_threads=cpu_count(),
     jdfilter=None,
+    max_err=None,
     desc="Writing light curve charts/phase diagrams",
-):
-    chunk: int = 1  # max(1, len(star_descriptions) // nr_threads*10)
+    store_periodograms=False,
+    period_engine="LS",
+    vartype_engines: Dict[str, str] = None,
+    search_settings: period_engines.SearchSettings = period_engines.SearchSettings(),
+    nr_render_threads=None,
+    resume=False,
+    max_worker_rss_mb=None,
+    task_budget: scheduler.TaskBudget = None,
+    airmass_table: airmass.AirmassTable = None,
+    time_reference: str = "JD",
+) -> List[scheduler.TaskFailure]:
+    """
+    Charts the stars of all groups in two stages, see compute_star and render_star. A star which is in several groups
+    is computed and rendered once, in the dirs of its first group, and its files are linked into the dirs of the
+    others. With resume the output dirs are kept and the stars which were completed by an earlier run with the same
+    inputs are skipped, otherwise the output dirs are emptied first. A star which exceeds the task_budget in a stage
+    is killed, the failed stars are returned and written to FAILURES_FILE in the resultdir. The airmass of the AAVSO
+    reports comes from airmass_table, which is extended with the JDs of the frames. Without it, a table centred on
+    the stars is made. With time_reference HJD or BJD, the stars are computed and plotted in heliocentric or
+    barycentric time, like the VSX epochs
+    """
     set_font_size()
-    pool = mp.Pool(nr_threads, maxtasksperchild=10)
-    phasedir = Path(resultdir, phasepart)
-    chartsdir = Path(resultdir, chartspart)
-    aavsodir = Path(resultdir, aavso_part)
+    # warm workers, they are only replaced when they use too much memory
+    pool = worker_pool.get_pool(nr_threads, max_worker_rss_mb, initializer=set_font_size)
     logging.debug(
         f"Using {nr_threads} threads for lightcurve, phase plotting and aavso reporting."
     )
+    group_dirs = [
+        ChartDirs(Path(resultdir, group.phasepart), Path(resultdir, group.chartspart), Path(resultdir, group.aavsopart))
+        for group in groups
+    ]
+    manifests = [RunManifest.of_resultdir(resultdir, Path(group.phasepart).name) for group in groups]
+    prepare_dir = reading.create_dir if resume else trash_and_recreate_dir
+    for dirs, manifest in zip(group_dirs, manifests):
+        if not resume:
+            manifest.clear()
+        if do_phase:
+            prepare_dir(dirs.phasedir)
+            prepare_dir(Path(dirs.phasedir, Path("txt")))
+        if do_light or do_light_raw:
+            prepare_dir(dirs.chartsdir)
+        if do_aavso:
+            prepare_dir(dirs.aavsodir)
+
+    # the union of the groups, every star once with the indexes of the groups it is in
+    star_groups: Dict[int, List[int]] = {}
+    star_descriptions = []
+    for index, group in enumerate(groups):
+        for star in group.stars:
+            if star.local_id not in star_groups:
+                star_groups[star.local_id] = []
+                star_descriptions.append(star)
+            if index not in star_groups[star.local_id]:
+                star_groups[star.local_id].append(index)
+    logging.info(
+        f"Charting {len(star_descriptions)} stars, {sum(len(group.stars) for group in groups)} in "
+        f"{len(groups)} groups"
+    )
+    star_dirs = {star_id: [group_dirs[index] for index in indexes] for star_id, indexes in star_groups.items()}
+    calibrated = do_compstars.calculate_batch_ensemble_photometry(
+        star_descriptions,
+        comp_stars,
+        do_compstars.weighted_value_ensemble_method,
+        jdfilter=jdfilter,
+        pool=pool,
+    )
+    logging.info(f"Batch ensemble photometry: {calibrated}")
+    if time_reference != "JD":
+        calibrated.time_correction = time_correction.TimeCorrection(
+            calibrated.floatjds, time_reference, None if airmass_table is None else airmass_table.location
+        )
+    if do_aavso and star_descriptions:
+        if airmass_table is None:
+            airmass_table = airmass.AirmassTable.of_settings(
+                airmass.coords_centre([star.coords for star in star_descriptions])
+            )
+        # once for all frames, the workers only look up the airmass of their stars
+        airmass_table.extend(calibrated.floatjds)
+    store = ResultStore.of_resultdir(resultdir)
+    params = (
+        jdfilter, max_err, period_engine, vartype_engines, search_settings,
+        do_light, do_light_raw, do_phase, do_aavso, aavsolimit, time_reference,
+    )
+    # one lightcurve at a time, for the key of its inputs and its number of observations
+    keys, nr_obs = {}, {}
+    for star in star_descriptions:
+        df = calibrated.get_star_df(star.local_id, star.coords)
+        keys[star.local_id] = manifest_key(star, df, *params)
+        nr_obs[star.local_id] = star.obs if star.obs is not None else (0 if df is None else len(df))
+    star_results = {}
+    if resume:
+        star_manifests = {
+            star_id: [manifests[index] for index in indexes] for star_id, indexes in star_groups.items()
+        }
+        star_descriptions, star_results = skip_completed_stars(star_descriptions, keys, star_manifests, store)
+    period_cache = PeriodCache(Path(resultdir, "period_cache"), store_periodograms)
+    periods = calculate_batch_periods(
+        star_descriptions, calibrated, period_cache, period_engine, vartype_engines, search_settings
+    )
+    # the most expensive stars first, the selected stars before all others
+    compute_products = ["compute"] + (["bootstrap"] if search_settings.bootstrap_resamples > 0 else [])
+    render_products = [
+        product
+        for product, requested in (
+            ("phase", do_phase), ("light", do_light), ("light_raw", do_light_raw), ("aavso", do_aavso)
+        )
+        if requested
+    ]
+    failures = []
+    compute_func = partial(
+        compute_star,
+        comp_stars=comp_stars,
+        store=store,
+        max_err=max_err,
+        search_settings=search_settings,
+    )
+    computed_stars = []
 
-    if do_phase:
-        trash_and_recreate_dir(phasedir)
-        trash_and_recreate_dir(Path(phasedir, Path("txt")))
-    if do_light or do_light_raw:
-        trash_and_recreate_dir(chartsdir)
-    if do_aavso:
-        trash_and_recreate_dir(aavsodir)
-    with Manager() as manager:
-        comp_stars_proxy = manager.Value("comp_stars", comp_stars)
-        star_result_dict = manager.dict({})
-
-        func = partial(
-            read_vast_lightcurves,
-            basedir=basedir,
-            compstarproxy=comp_stars_proxy,
-            star_result_dict=star_result_dict,
-            do_light=do_light,
-            do_light_raw=do_light_raw,
-            do_phase=do_phase,
-            do_aavso=do_aavso,
-            aavso_limit=aavsolimit,
-            phasedir=phasedir,
-            chartsdir=chartsdir,
-            aavsodir=aavsodir,
-            jdfilter=jdfilter,
+    def star_curve_period_dirs(star):
+        """ the work item of compute_star, made when its batch is dispatched """
+        return (
+            star,
+            calibrated.get_star_df(star.local_id, star.coords),
+            periods.get(star.local_id),
+            star_dirs[star.local_id],
         )
-        with tqdm.tqdm(total=len(star_descriptions), desc=desc, unit="stars") as pbar:
-            for _ in pool.imap_unordered(func, star_descriptions, chunksize=chunk):
-                pbar.update(1)
-                pass
+
+    with tqdm.tqdm(total=len(star_descriptions), desc=f"{desc} (compute)", unit="stars") as pbar:
+        for result in scheduler.imap_scheduled(
+            pool,
+            compute_func,
+            star_descriptions,
+            [scheduler.estimate_cost(nr_obs[star.local_id], compute_products) for star in star_descriptions],
+            [star.has_metadata("SELECTEDTAG") for star in star_descriptions],
+            nr_threads,
+            task_budget,
+            [star.local_id for star in star_descriptions],
+            "compute",
+            failures,
+            star_curve_period_dirs,
+        ):
+            if result is not None:
+                star, temp_dict = result
+                computed_stars.append(star)
+                star_results[star.local_id] = temp_dict
+            pbar.update(1)
+
+    # the render stage only needs the store, it gets its own pool if it is sized differently
+    render_threads = nr_threads if nr_render_threads is None else nr_render_threads
+    logging.debug(f"Using {render_threads} threads for rendering")
+    if render_threads != nr_threads:
         pool.close()
         pool.join()
-        stardict = main_vast.get_localid_to_sd_dict(star_descriptions)
-        for key, value in star_result_dict.items():
-            star_result = stardict[key].result
-            for key2, value2 in value.items():
-                if key2 not in star_result:
-                    star_result[key2] = value2
+        pool = worker_pool.get_pool(render_threads, max_worker_rss_mb, initializer=set_font_size)
+    render_func = partial(
+        render_star,
+        comp_stars=comp_stars,
+        store=store,
+        do_light=do_light,
+        do_light_raw=do_light_raw,
+        do_phase=do_phase,
+        do_aavso=do_aavso,
+        aavso_limit=aavsolimit,
+        airmass_table=airmass_table,
+    )
+    # only the stars which were computed now, a resumed run can have older results of the others in the store
+    with pool, tqdm.tqdm(total=len(computed_stars), desc=f"{desc} (render)", unit="stars") as pbar:
+        rendered = scheduler.imap_scheduled(
+            pool,
+            render_func,
+            [(star, star_dirs[star.local_id]) for star in computed_stars],
+            [scheduler.estimate_cost(nr_obs[star.local_id], render_products) for star in computed_stars],
+            [star.has_metadata("SELECTEDTAG") for star in computed_stars],
+            render_threads,
+            task_budget,
+            [star.local_id for star in computed_stars],
+            "render",
+            failures,
+        )
+        for index, result in enumerate(rendered, start=1):
+            if result is not None:
+                star_id, temp_dict = result
+                star_results[star_id] = {**star_results[star_id], **temp_dict}
+                dirs = star_dirs[star_id]
+                for group_index, todirs in zip(star_groups[star_id], dirs):
+                    manifests[group_index].mark_done(
+                        star_id,
+                        keys[star_id],
+                        {
+                            name: relocate(output, dirs[0], todirs)
+                            for name, output in star_results[star_id].items()
+                            if output is not None
+                        },
+                    )
+            if index % MANIFEST_FLUSH == 0:
+                for manifest in manifests:
+                    manifest.flush()
+            pbar.update(1)
+    for manifest in manifests:
+        manifest.flush()
+    # the results of the first group of a star, for all star descriptions of the star
+    for group in groups:
+        for star in group.stars:
+            for key, value in star_results.get(star.local_id, {}).items():
+                if key not in star.result:
+                    star.result[key] = value
+    write_failures(resultdir, failures)
+    return failures
+
+
+def write_failures(resultdir: str, failures: List[scheduler.TaskFailure]):
+    """ the run summary of the stars which were killed for exceeding their budget, as csv """
+    if failures:
+        logging.error(
+            f"{len(failures)} stars exceeded their budget and were skipped: "
+            + ", ".join(f"{failure.item_id} ({failure.stage}: {failure.reason})" for failure in failures)
+        )
+    with open(Path(resultdir, FAILURES_FILE), "w") as fp:
+        fp.write("local_id,stage,reason\n")
+        for failure in failures:
+            fp.write(f"{failure.item_id},{failure.stage},{failure.reason}\n")
@@ -9,10 +9,11 @@ import star_description
 from star_description import StarDescription
 from star_metadata import CompStarData
 from ucac4 import UCAC4
-import math
 from comparison_stars import ComparisonStars
+from calibrated_lightcurves import CalibratedLightcurves
 from pathlib import PurePath
 import operator
+import pandas as pd
 from pandas import DataFrame
 import tqdm
 import reading
@@ -119,37 +120,25 @@ def calculate_ensemble_photometry(
         f"Start calculate_real with {df.shape[0]} rows and {len(comp_stars.observations)} comp stars."
     )
 
+    # (rows, comp stars) matrices, missing comparison star observations are masked
+    comp_obs, comp_err = comp_stars.get_observation_matrix(df["JD"].to_numpy())
+    comp_obs = np.ma.masked_invalid(comp_obs)
+    comp_err = np.ma.array(comp_err, mask=np.ma.getmaskarray(comp_obs))
+    comp_real = np.asarray(comp_stars.comp_catalogmags, dtype=float)
+    vrel = df["Vrel"].to_numpy(dtype=float)
     # error = sqrt((vsig**2+(1/n sum(sigi)**2)))
-    realV = []
-    realErr = []
-    for index, row in df.iterrows():
-        # logging.debug(f"row is {row}, comp_mags is {comp_stars.comp_catalogmags}")
-        comp_obs = []
-        comp_err = []
-        comp_real = []
-        for idx, compstar in enumerate(comp_stars.observations):
-            jd = row["JD"]
-            if jd in compstar:
-                comp_obs.append(compstar[jd][0])
-                comp_err.append(compstar[jd][1])
-                comp_real.append(comp_stars.comp_catalogmags[idx])
-            else:
-                logging.debug(f"Key error for {row['JD']}, {comp_stars.ids}")
-
-        if len(comp_obs) > 0 and len(comp_obs) == len(comp_err):
-            v = ensemble_method(row["Vrel"], comp_obs, comp_err, comp_real)
-            err = math.sqrt(math.pow(row["err"], 2) + math.pow(np.mean(comp_err), 2))
-            realV.append(v)
-            realErr.append(err)
-        else:  # error in the comparison stars
-            # logging.error(f"len comp obs: {len(comp_obs)}, len(comperr): {len(comp_err)}, obs:{comp_obs},
-            # err:{comp_err}, index:{index} , row:{row},\ndf.describe: {df.describe()}, df.info: {df.info()},
-            # comp_stars: {comp_stars}")
-            logging.warning(
-                f"During ensemble, all comparison stars {comp_stars.ids} for JD {jd} have no observations."
-            )
-            realV.append(None)
-            realErr.append(None)
+    realV = ensemble_method(vrel[:, np.newaxis], comp_obs, comp_err, comp_real)
+    realErr = np.ma.sqrt(
+        np.square(df["err"].to_numpy(dtype=float)) + np.square(comp_err.mean(axis=1))
+    )
+    missing = np.ma.getmaskarray(comp_obs).all(axis=1)
+    if missing.any():
+        logging.warning(
+            f"During ensemble, all comparison stars {comp_stars.ids} have no observations "
+            f"for {missing.sum()} JD's: {df['JD'].to_numpy()[missing][:10]}"
+        )
+    realV = np.ma.filled(np.ma.array(realV, dtype=float), np.nan)
+    realErr = np.ma.filled(np.ma.array(realErr, dtype=float), np.nan)
     logging.debug(
         f"Returning len(realv) and len(realErr): {len(realV)}, {len(realErr)}"
     )
@@ -157,24 +146,104 @@ def calculate_ensemble_photometry(
 
 
 # DF should have JD, Vrel, err
+# comp_obs/comp_err are (masked) arrays with the comparison stars on the last axis, vrel broadcasts against them
 def mean_value_ensemble_method(vrel, comp_obs, comp_err, comp_real):
     # Vobs - Cobs + Creal = V
-    return np.mean(
-        np.add(np.subtract(np.repeat(vrel, len(comp_obs)), comp_obs), comp_real)
-    )
+    return np.ma.mean(np.ma.add(np.ma.subtract(vrel, comp_obs), comp_real), axis=-1)
 
 
 def weighted_value_ensemble_method(vrel, comp_obs, comp_err, comp_real):
-    vx = np.add(np.subtract(np.repeat(vrel, len(comp_obs)), comp_obs), comp_real)
-    sum_vx_divided_by_errors = np.sum(np.divide(vx, comp_err))
-    sum_inverse_errors = np.sum(np.divide(np.ones(len(comp_err)), comp_err))
-    logging.debug(
-        f"summags: {sum_vx_divided_by_errors}, sum inverse: {sum_inverse_errors}"
-    )
-    vw = np.divide(sum_vx_divided_by_errors, sum_inverse_errors)  # eq 6
+    vx = np.ma.add(np.ma.subtract(vrel, comp_obs), comp_real)
+    sum_vx_divided_by_errors = np.ma.sum(np.ma.divide(vx, comp_err), axis=-1)
+    sum_inverse_errors = np.ma.sum(np.ma.divide(1.0, comp_err), axis=-1)
+    vw = np.ma.divide(sum_vx_divided_by_errors, sum_inverse_errors)  # eq 6
     return vw
 
 
+def calculate_ensemble_zeropoint(
+    jds, comp_stars: ComparisonStars, ensemble_method
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ per frame offset between instrumental and calibrated magnitude, and its error. NaN if no comp star is there """
+    comp_obs, comp_err = comp_stars.get_observation_matrix(jds)
+    comp_obs = np.ma.masked_invalid(comp_obs)
+    comp_err = np.ma.array(comp_err, mask=np.ma.getmaskarray(comp_obs))
+    comp_real = np.asarray(comp_stars.comp_catalogmags, dtype=float)
+    # the ensemble methods are linear in Vrel, so the zero point is the ensemble of a star with Vrel = 0
+    zeropoint = ensemble_method(np.zeros((len(jds), 1)), comp_obs, comp_err, comp_real)
+    zeropoint_err = comp_err.mean(axis=1)
+    return (
+        np.ma.filled(np.ma.array(zeropoint, dtype=float), np.nan),
+        np.ma.filled(np.ma.array(zeropoint_err, dtype=float), np.nan),
+    )
+
+
+def group_stars_by_compstars(
+    stars: List[StarDescription], comp_stars: ComparisonStars
+) -> Dict[Tuple[int, ...], List[StarDescription]]:
+    """ stars sharing the same comparison stars end up in the same group. Stars without COMPSTARS use all of them """
+    groups = {}
+    for star in stars:
+        compstar_match: CompStarData = star.get_metadata("COMPSTARS")
+        ids = compstar_match.compstar_ids if compstar_match is not None else comp_stars.ids
+        groups.setdefault(tuple(sorted(ids)), []).append(star)
+    return groups
+
+
+def calculate_batch_ensemble_photometry(
+    stars: List[StarDescription],
+    comp_stars: ComparisonStars,
+    ensemble_method,
+    jdfilter: List[float] = None,
+    pool=None,
+) -> CalibratedLightcurves:
+    """ Reads the lightcurves of all stars into a frames x stars matrix and calibrates them group per comp star set """
+    stars = [x for x in stars if x.path != ""]
+    paths = [x.path for x in stars]
+    lightcurves = list(
+        tqdm.tqdm(
+            pool.imap(reading.read_lightcurve_arrays, paths, chunksize=10)
+            if pool is not None
+            else map(reading.read_lightcurve_arrays, paths),
+            total=len(paths),
+            desc="Reading lightcurves for ensemble photometry",
+            unit="stars",
+        )
+    )
+    if len(lightcurves) > 0:
+        jds = np.unique(np.concatenate([x[0] for x in lightcurves]))
+    else:
+        jds = np.array([], dtype=str)
+    jds = jds[np.argsort(jds.astype(float), kind="stable")]
+    floatjds = jds.astype(float)
+    jds = jds[utils.jd_filter_mask(floatjds, jdfilter)]
+    frame_index = pd.Index(jds)
+
+    # float32 keeps the matrices of --allstars runs in memory
+    mags = np.full((len(jds), len(stars)), np.nan, dtype=np.float32)
+    errs = np.full((len(jds), len(stars)), np.nan, dtype=np.float32)
+    for column, (star_jds, vrel, err) in enumerate(lightcurves):
+        rows = frame_index.get_indexer(star_jds)
+        valid = rows >= 0
+        mags[rows[valid], column] = vrel[valid]
+        errs[rows[valid], column] = err[valid]
+
+    columns = {star.local_id: column for column, star in enumerate(stars)}
+    groups = group_stars_by_compstars(stars, comp_stars)
+    logging.info(
+        f"Calibrating {len(stars)} stars on {len(jds)} frames in {len(groups)} comparison star groups"
+    )
+    for ids, members in groups.items():
+        zeropoint, zeropoint_err = calculate_ensemble_zeropoint(
+            jds, comp_stars.get_filtered_comparison_stars(list(ids)), ensemble_method
+        )
+        member_columns = [columns[x.local_id] for x in members]
+        mags[:, member_columns] += zeropoint[:, np.newaxis]
+        errs[:, member_columns] = np.sqrt(
+            np.square(errs[:, member_columns]) + np.square(zeropoint_err[:, np.newaxis])
+        )
+    return CalibratedLightcurves(jds, list(columns.keys()), mags, errs)
+
+
 def add_closest_compstars(
     stars: List[StarDescription], comp_stars: ComparisonStars, limit=10
 ):
@@ -0,0 +1,135 @@
+"""
+Pre-configured figures which are reused for every star. Creating a figure, its axes, fonts and locators and
+running tight_layout costs about as much as drawing it, so every process keeps one figure per plot type and
+only swaps the data, the limits and the title before saving.
+"""
+
+import logging
+from typing import Dict, Tuple
+import numpy as np
+import matplotlib as mplotlib
+import matplotlib.pyplot as plt
+from matplotlib.ticker import MaxNLocator
+
+mplotlib.use("Agg")  # needs no X server
+
+TITLE_PAD = 40
+# margin around the data of autoscaled axes, same as matplotlib's default axes.xmargin/ymargin
+AUTOSCALE_MARGIN = 0.05
+
+# the templates of this process, per plot type
+_templates: Dict[Tuple, "ErrorbarTemplate"] = {}
+
+
+class ErrorbarTemplate:
+    """
+    A figure with one series of points, optionally with error bars. The layout (tight_layout) is computed on the
+    first render and reused for later stars, until the number of title lines or the length of the tick labels changes
+    """
+
+    def __init__(
+        self,
+        width,
+        height,
+        dpi,
+        xlabel,
+        ylabel=None,
+        markersize=6,
+        errorbars=True,
+        rotate=False,
+        integer_x=False,
+        plain_x_only=False,
+    ):
+        self.fig = plt.figure(figsize=(width, height), dpi=dpi, facecolor="w", edgecolor="k")
+        self.ax = self.fig.gca()
+        # the _layout_key of the current layout, None before the first render
+        self.layout_key = None
+        self.ax.set_xlabel(xlabel, labelpad=TITLE_PAD)
+        if ylabel is not None:
+            self.ax.set_ylabel(ylabel, labelpad=TITLE_PAD)
+        if errorbars:
+            container = self.ax.errorbar(
+                [0, 1],
+                [0, 1],
+                yerr=[0, 0],
+                linestyle="none",
+                marker="o",
+                ecolor="gray",
+                elinewidth=1,
+                ms=markersize,
+                color="C0",
+                mfc="C0",
+                zorder=0,
+            )
+            self.line = container.lines[0]
+            self.bars = container.lines[2][0]
+        else:
+            (self.line,) = self.ax.plot(
+                [0, 1], [0, 1], linestyle="none", linewidth="1", marker="o", ms=markersize
+            )
+            self.bars = None
+        if integer_x:
+            self.ax.xaxis.set_major_locator(MaxNLocator(integer=True))
+        if plain_x_only:
+            self.ax.ticklabel_format(style="plain", axis="x")
+        else:
+            self.ax.ticklabel_format(useOffset=False, style="plain")
+        if rotate:
+            self.ax.tick_params(axis="x", labelrotation=25)
+
+    def render(self, x, y, err, title: str, xlim=None, ylim=None, save_location=None):
+        """
+        Swaps in the points (x, y, err) and the title. xlim and ylim default to the data plus a 5% margin, the y axis
+        is inverted (magnitudes). Saves to save_location if given
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        self.line.set_data(x, y)
+        low, high = y, y
+        if self.bars is not None:
+            err = np.asarray(err, dtype=float)
+            low, high = y - err, y + err
+            self.bars.set_segments(np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1))
+        self.ax.set_title(title, pad=TITLE_PAD)
+        self.ax.set_xlim(*(xlim if xlim is not None else _with_margin(np.min(x), np.max(x))))
+        ylim = ylim if ylim is not None else _with_margin(np.min(low), np.max(high))
+        # magnitudes: brighter is up
+        self.ax.set_ylim(max(ylim), min(ylim))
+        layout_key = self._layout_key(title)
+        if layout_key != self.layout_key:
+            self.fig.tight_layout()
+            # the placeholder engine left by tight_layout makes every savefig draw the figure twice
+            self.fig.set_layout_engine(None)
+            # the formatter of a figure which was never drawn can give other labels, tight_layout has drawn it
+            self.layout_key = self._layout_key(title)
+        if save_location is not None:
+            self.fig.savefig(save_location, format="png")
+        return self.fig
+
+    def _layout_key(self, title: str):
+        """ what the margins of tight_layout depend on: the lines of the title and the longest tick labels """
+        return (title.count("\n"),) + tuple(
+            max((len(label) for label in axis.get_major_formatter().format_ticks(axis.get_majorticklocs())), default=0)
+            for axis in (self.ax.xaxis, self.ax.yaxis)
+        )
+
+
+def _with_margin(low, high):
+    margin = (high - low) * AUTOSCALE_MARGIN
+    if margin == 0:
+        margin = 0.5
+    return low - margin, high + margin
+
+
+def get_template(**kwargs) -> ErrorbarTemplate:
+    """ the template of this process for this plot type, created on first use. See ErrorbarTemplate for kwargs """
+    key = tuple(sorted(kwargs.items()))
+    if key not in _templates:
+        logging.debug(f"Creating figure template {key}")
+        _templates[key] = ErrorbarTemplate(**kwargs)
+    return _templates[key]
+
+
+def close_templates():
+    for template in _templates.values():
+        plt.close(template.fig)
+    _templates.clear()
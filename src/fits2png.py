@@ -1,4 +1,3 @@
-import astropy_helper
 import logging
 import argparse
 import utils
@@ -6,19 +5,18 @@ from pathlib import PurePath, Path
 from datetime import datetime
 import glob
 import subprocess
+import fits_index
+from fits_index import FitsIndex
 
 
 def process_fits(
     data_dir: Path, result_dir: Path, start: str, end: str, extension="*.fit"
 ):
-    selected_fits = data_dir.glob(extension)
-    # print("first 10 fits:", list(selected_fits)[:10])
-    result = []
-    for fits in selected_fits:
-        _, _, _, _, jd = astropy_helper.get_data_from_fits_header(open(fits, "rb"))
-        result.append((float(jd), fits))
-    result = sorted(result, key=lambda x: x[0])
-    within_date_range = list(filter(lambda x: start <= x[0] <= end, result))
+    # the JD's of the fits files come from the index, only new or changed files are opened. The index is kept with
+    # the results, the data dir is only read
+    index_file = Path(result_dir, fits_index.INDEX_FILE)
+    with FitsIndex.of_fitsdir(data_dir, patterns=(extension,), index_file=index_file) as index:
+        within_date_range = [(header.jd, Path(data_dir, header.name)) for header in index.select(start, end)]
     for entry in within_date_range:
         print("processing", entry)
         subprocess.run(
@@ -28,7 +26,7 @@ def process_fits(
                 "log",
                 entry[1],
                 "-o",
-                resultdir / f"{str(entry[0])}_{entry[1].with_suffix('.png').name}",
+                result_dir / f"{str(entry[0])}_{entry[1].with_suffix('.png').name}",
             ]
         )
 
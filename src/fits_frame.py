@@ -0,0 +1,98 @@
+"""
+Reading FITS frames without more memory than needed. The file is memory mapped, so only the pixels which are used get
+read, and the data is converted to float32 (the float64 of astropy is twice the size and 16 bit data doesn't need
+it) or kept in the dtype of the file. Sections and cutouts read only their rows, the downsampled reads for display
+block average strips of rows, so a 60 megapixel frame is never in memory as a whole.
+"""
+
+from pathlib import Path
+from typing import Tuple
+import numpy as np
+from astropy.io import fits
+
+# the dtype of the pixels for calculations and display
+DEFAULT_DTYPE = np.float32
+# the downsampled reads process this many rows of the frame at once
+STRIP_ROWS = 512
+
+
+class FitsFrame:
+    """ the image in the primary HDU of a FITS file, memory mapped. Close it or use it as a context manager """
+
+    def __init__(self, path, hdu_index: int = 0):
+        self.path = Path(path)
+        # memory mapped, without the strict memmap=True which refuses scaled (BZERO) data such as unsigned 16 bit
+        self._hdulist = fits.open(self.path)
+        self.hdu = self._hdulist[hdu_index]
+
+    @property
+    def header(self) -> fits.Header:
+        return self.hdu.header
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """ (rows, columns), like the data """
+        return self.hdu.shape
+
+    def data(self, dtype=DEFAULT_DTYPE) -> np.ndarray:
+        """ the whole image in dtype, dtype None keeps the dtype of the data (and the memory map if it's unscaled) """
+        data = self.hdu.data
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def section(self, y0: int, y1: int, x0: int, x1: int, dtype=DEFAULT_DTYPE) -> np.ndarray:
+        """ data[y0:y1, x0:x1] reading only those pixels, the part outside the frame is left out """
+        height, width = self.shape
+        section = self.hdu.section[max(y0, 0) : max(min(y1, height), 0), max(x0, 0) : max(min(x1, width), 0)]
+        return np.asarray(section, dtype=dtype)
+
+    def cutout(self, x: int, y: int, half: int, fill=None, dtype=DEFAULT_DTYPE) -> np.ndarray:
+        """ the 2*half x 2*half square around pixel (x, y), pixels outside the frame get fill (default the mean) """
+        y0, x0 = y - half, x - half
+        section = self.section(y0, y + half, x0, x + half, dtype)
+        if fill is None:
+            fill = section.mean() if section.size else 0
+        result = np.full((2 * half, 2 * half), fill, dtype=section.dtype)
+        result[max(-y0, 0) : max(-y0, 0) + section.shape[0], max(-x0, 0) : max(-x0, 0) + section.shape[1]] = section
+        return result
+
+    def downsampled(self, factor: int, dtype=DEFAULT_DTYPE) -> np.ndarray:
+        """
+        The mean of every factor x factor block of pixels, read in strips of rows. The last rows and columns which
+        don't fill a block are left out, block (i, j) covers the pixels [i * factor, (i + 1) * factor) of the frame
+        """
+        height, width = self.shape
+        rows, columns = height // factor, width // factor
+        result = np.empty((rows, columns), dtype=dtype)
+        strip = max(STRIP_ROWS // factor, 1)
+        for start in range(0, rows, strip):
+            end = min(start + strip, rows)
+            pixels = self.section(start * factor, end * factor, 0, columns * factor, np.float32)
+            result[start:end] = pixels.reshape(end - start, factor, columns, factor).mean(axis=(1, 3))
+        return result
+
+    def close(self):
+        self._hdulist.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_data(path, dtype=DEFAULT_DTYPE) -> np.ndarray:
+    """ the whole image of the FITS file at path in dtype, see FitsFrame.data """
+    with FitsFrame(path) as frame:
+        return frame.data(dtype)
+
+
+def read_shape(path) -> Tuple[int, int]:
+    """ the (rows, columns) of the image, from the header only """
+    header = fits.getheader(path)
+    return header["NAXIS2"], header["NAXIS1"]
+
+
+def read_downsampled(path, factor: int, dtype=DEFAULT_DTYPE) -> np.ndarray:
+    """ the image block averaged over factor x factor pixels, see FitsFrame.downsampled """
+    with FitsFrame(path) as frame:
+        return frame.downsampled(factor, dtype)
@@ -0,0 +1,171 @@
+"""
+An index of the headers of the FITS files of a directory. Reading the JD, filter and dimensions of thousands of
+frames means opening every file, the index does that once, in parallel, and keeps the result in an SQLite file. Later
+runs only read the files which are new or changed (by mtime and size) and the lookups are queries.
+"""
+
+import fnmatch
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+import tqdm
+from astropy.io import fits
+from astropy.time import Time
+import worker_pool
+
+INDEX_FILE = "fits_index.sqlite"
+# the index_file of an index which is not kept, e.g. of a read-only fitsdir
+MEMORY_INDEX = ":memory:"
+FITS_PATTERNS = ("*.fit", "*.fits", "*.fts")
+# a frame JD matches a header JD if they are this close (days), e.g. start vs mid exposure
+FILTER_JD_TOLERANCE = 0.005
+# fewer new files than this are read without a pool
+MIN_PARALLEL_FILES = 50
+
+# the indexed header of one file, name is relative to the fitsdir, shape is (NAXIS2, NAXIS1) like the data
+FitsHeader = namedtuple("FitsHeader", "name mtime size jd filter naxis1 naxis2 exptime")
+
+
+def read_header(path: Path) -> FitsHeader:
+    """ the indexed keys of the primary header of the FITS file at path, missing keys are None """
+    stat = os.stat(path)
+    header = fits.getheader(path)
+    jd = header.get("JD")
+    if jd is None and "DATE-OBS" in header:
+        jd = Time(header["DATE-OBS"], format="isot", scale="utc").jd
+    result_filter = header.get("FILTER")
+    return FitsHeader(
+        Path(path).name,
+        stat.st_mtime,
+        stat.st_size,
+        None if jd is None else float(jd),
+        None if result_filter is None else str(result_filter).strip(),
+        header.get("NAXIS1"),
+        header.get("NAXIS2"),
+        header.get("EXPTIME"),
+    )
+
+
+def _default_index_file(fitsdir: Path):
+    """ INDEX_FILE in fitsdir if it can be written, otherwise MEMORY_INDEX """
+    path = Path(fitsdir, INDEX_FILE)
+    if os.access(path if path.exists() else fitsdir, os.W_OK):
+        return path
+    logging.info(f"{fitsdir} is not writable, the FITS index is kept in memory")
+    return MEMORY_INDEX
+
+
+def _read_header_or_none(path: Path) -> Optional[FitsHeader]:
+    try:
+        return read_header(path)
+    except (OSError, ValueError) as ex:
+        logging.warning(f"Could not read the FITS header of {path}: {ex}")
+        return None
+
+
+class FitsIndex:
+    """
+    The headers of the FITS files in fitsdir, kept in index_file. By default that is INDEX_FILE in the fitsdir, or
+    only in memory if the fitsdir (e.g. a shared archive) is not writable
+    """
+
+    def __init__(self, fitsdir, index_file=None, patterns: Sequence[str] = FITS_PATTERNS):
+        self.fitsdir = Path(fitsdir)
+        self.index_file = _default_index_file(self.fitsdir) if index_file is None else index_file
+        self.patterns = patterns
+        self._connection = sqlite3.connect(str(self.index_file))
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS frames (name TEXT PRIMARY KEY, mtime REAL, size INTEGER, jd REAL, "
+            "filter TEXT, naxis1 INTEGER, naxis2 INTEGER, exptime REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS frames_jd ON frames (jd)")
+        self._connection.commit()
+
+    @classmethod
+    def of_fitsdir(cls, fitsdir, nr_threads=None, patterns: Sequence[str] = FITS_PATTERNS, index_file=None):
+        """ the index of fitsdir, brought up to date """
+        index = cls(fitsdir, index_file, patterns)
+        index.update(nr_threads)
+        return index
+
+    def update(self, nr_threads=None) -> int:
+        """ reads the headers of the new and changed files and forgets the removed files, returns the number read """
+        on_disk = {}
+        for pattern in self.patterns:
+            for path in self.fitsdir.glob(pattern):
+                stat = path.stat()
+                on_disk[path.name] = (stat.st_mtime, stat.st_size)
+        rows = self._connection.execute("SELECT name, mtime, size FROM frames")
+        indexed = {name: (mtime, size) for name, mtime, size in rows}
+        # files of other patterns stay indexed
+        removed = [(name,) for name in indexed if name not in on_disk and not Path(self.fitsdir, name).exists()]
+        todo = [Path(self.fitsdir, name) for name, stat in on_disk.items() if indexed.get(name) != stat]
+        logging.info(f"FITS index of {self.fitsdir}: {len(on_disk)} files, reading {len(todo)} headers")
+        if len(todo) < MIN_PARALLEL_FILES:
+            headers = [_read_header_or_none(path) for path in todo]
+        else:
+            with worker_pool.get_pool(nr_threads) as pool:
+                headers = list(
+                    tqdm.tqdm(pool.imap_unordered(_read_header_or_none, todo, 20), total=len(todo), unit="files")
+                )
+        with self._connection:
+            self._connection.executemany("DELETE FROM frames WHERE name = ?", removed)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO frames VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [header for header in headers if header is not None],
+            )
+        return len(todo)
+
+    def get(self, name: str) -> Optional[FitsHeader]:
+        """ the header of the file name (without directory), or None """
+        row = self._connection.execute("SELECT * FROM frames WHERE name = ?", (Path(name).name,)).fetchone()
+        return None if row is None else FitsHeader(*row)
+
+    def select(self, start_jd: float = None, end_jd: float = None) -> List[FitsHeader]:
+        """ the headers of the files matching the patterns with start_jd <= JD <= end_jd, sorted on JD """
+        rows = self._connection.execute(
+            "SELECT * FROM frames WHERE jd >= ? AND jd <= ? ORDER BY jd",
+            (-np.inf if start_jd is None else start_jd, np.inf if end_jd is None else end_jd),
+        )
+        return [FitsHeader(*row) for row in rows if self._matches(row[0])]
+
+    def get_filters(self) -> Dict[float, str]:
+        """ the filter of every frame by JD """
+        return {header.jd: header.filter for header in self.select()}
+
+    def lookup_filters(self, jds, tolerance=FILTER_JD_TOLERANCE) -> np.ndarray:
+        """ the filter of the frame closest to every jd, None if there is none within tolerance days """
+        jds = np.asarray(jds, dtype=float)
+        result = np.full(len(jds), None, dtype=object)
+        if len(jds) == 0:
+            return result
+        rows = self.select(jds.min() - tolerance, jds.max() + tolerance)
+        if not rows:
+            return result
+        frame_jds = np.array([row.jd for row in rows])
+        frame_filters = np.array([row.filter for row in rows], dtype=object)
+        index = np.searchsorted(frame_jds, jds)
+        left, right = (index - 1).clip(0, len(frame_jds) - 1), index.clip(0, len(frame_jds) - 1)
+        nearest = np.where(np.abs(frame_jds[left] - jds) <= np.abs(frame_jds[right] - jds), left, right)
+        found = np.abs(frame_jds[nearest] - jds) <= tolerance
+        result[found] = frame_filters[nearest[found]]
+        return result
+
+    def _matches(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -12,6 +12,7 @@ import pytz
 from datetime import datetime
 import utils
 from star_metadata import SiteData
+from result_store import ResultStore
 
 UNKNOWN = "Unknown"
 
@@ -91,17 +92,9 @@ def block(star: StarDescription, resultdir: str, images_prefix: str):
     try:
         is_vsx = star.has_metadata("VSX")
         starui: utils.StarUI = utils.get_star_or_catalog_name(star, suffix="_phase")
-        txt_path = Path(
-            Path(star.result["phase"]).parent,
-            "txt",
-            starui.filename_no_suff_no_ext + ".txt",
-        )
-        try:
-            parsed_toml = toml.load(txt_path)
-        except FileNotFoundError:
-            logging.error(
-                f"Could not load txt file with phase information from {txt_path}"
-            )
+        parsed_toml = ResultStore.of_resultdir(resultdir).get_info(star.local_id)
+        if parsed_toml is None:
+            raise FileNotFoundError(f"No results of star {star.local_id} in the result store")
 
         ucac4 = star.get_metadata("UCAC4")
         if ucac4 is None:
@@ -202,7 +195,7 @@ def block(star: StarDescription, resultdir: str, images_prefix: str):
         print(traceback.print_exc())
         logging.error(message)
         logging.error("File not found error in store and curve for star" + star.path)
-        return f'<div class="fl w-100 pa2 ba">Could not load {txt_path}</div>'
+        return f'<div class="fl w-100 pa2 ba">Could not load the results of star {star.local_id}</div>'
 
 
 def get_header(title: str, ref_frame: str):
@@ -0,0 +1,82 @@
+"""
+Cleaning of one lightcurve on plain numpy arrays: JD filter, missing values, large errors and phase dependent
+outliers. Every step only updates a boolean mask of the points which are kept, nothing is copied.
+"""
+
+import logging
+from collections import namedtuple
+from typing import List, Tuple
+import numpy as np
+import utils
+
+# the phase diagram is split in buckets of a tenth of the phase, rounded like np.round(phase, 1): 11 buckets
+PHASE_BUCKETS = 10
+
+# nr of points removed by each step of clean_lightcurve, every point is counted by the first step removing it
+CleaningCounts = namedtuple("CleaningCounts", "jd_filtered missing large_errors outliers")
+
+
+def phase_bucket_medians_stds(buckets: np.ndarray, values: np.ndarray, nr_buckets: int):
+    """
+    median and standard deviation (ddof=1) of the values per bucket, in one sort and a few bincounts.
+    Buckets with fewer than 2 values get a NaN standard deviation
+    """
+    counts = np.bincount(buckets, minlength=nr_buckets)
+    order = np.lexsort((values, buckets))
+    sorted_values = values[order]
+    starts = np.cumsum(counts) - counts
+    filled = counts > 0
+    medians = np.full(nr_buckets, np.nan)
+    lower = starts[filled] + (counts[filled] - 1) // 2
+    upper = starts[filled] + counts[filled] // 2
+    medians[filled] = (sorted_values[lower] + sorted_values[upper]) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.bincount(buckets, weights=values, minlength=nr_buckets) / counts
+        squares = np.bincount(buckets, weights=np.square(values - means[buckets]), minlength=nr_buckets)
+        stds = np.sqrt(squares / (counts - 1))
+    stds[counts < 2] = np.nan
+    return medians, stds
+
+
+def phase_outlier_mask(t: np.ndarray, mags: np.ndarray, period: float, stdev: float = 5) -> np.ndarray:
+    """
+    True for the points within stdev standard deviations of the median of their phase bucket.
+    Buckets with fewer than 2 points have no spread and keep their points
+    """
+    buckets = np.rint(np.fmod(t / period, 1) * PHASE_BUCKETS).astype(int)
+    # negative JD's give negative phases
+    buckets[buckets < 0] += PHASE_BUCKETS + 1
+    medians, stds = phase_bucket_medians_stds(buckets, mags, PHASE_BUCKETS + 1)
+    deviation = np.abs(mags - medians[buckets])
+    return ~(deviation > stdev * stds[buckets])
+
+
+def clean_lightcurve(
+    t,
+    mags,
+    errs,
+    period: float = None,
+    jdfilter: List[float] = None,
+    stdev: float = 5,
+    max_err: float = None,
+) -> Tuple[np.ndarray, CleaningCounts]:
+    """
+    Returns the mask of the points to keep and the nr of points removed per step. Steps: the JD ranges of jdfilter
+    (see utils.jd_filter_mask), NaN's, errors above max_err and, when a period is given, phase dependent outliers
+    """
+    t, mags, errs = (np.asarray(x, dtype=float) for x in (t, mags, errs))
+    mask = utils.jd_filter_mask(t, jdfilter)
+    jd_filtered = len(t) - np.count_nonzero(mask)
+    mask &= ~(np.isnan(t) | np.isnan(mags) | np.isnan(errs))
+    missing = len(t) - jd_filtered - np.count_nonzero(mask)
+    kept = np.count_nonzero(mask)
+    if max_err is not None:
+        mask &= errs <= max_err
+    large_errors = kept - np.count_nonzero(mask)
+    kept = np.count_nonzero(mask)
+    if period is not None and period > 0 and kept > 0:
+        indices = np.flatnonzero(mask)
+        mask[indices] = phase_outlier_mask(t[indices], mags[indices], period, stdev)
+    counts = CleaningCounts(jd_filtered, missing, large_errors, kept - np.count_nonzero(mask))
+    logging.debug(f"Cleaned lightcurve of {len(t)} points: {counts}")
+    return mask, counts
@@ -6,14 +6,19 @@ import sys
 import numpy as np
 import time
 from collections import namedtuple
+import airmass
 import do_calibration
 import do_charts_vast
 import do_charts_field
 import do_charts_stats
 import do_compstars
+import period_engines
 import reading
+import result_store
+import scheduler
 import utils
 import utils_sd
+import worker_pool
 from utils import get_localid_to_sd_dict
 from star_description import StarDescription
 from astropy.coordinates import SkyCoord
@@ -37,7 +42,7 @@ ucac4 = UCAC4()
 
 
 def run_do_rest(args):
-    thread_count = args.threads
+    thread_count = args.threads if args.threads is not None else worker_pool.auto_threads(args.workermemory)
     vastdir = utils.add_trailing_slash(args.datadir)
     resultdir = clean_and_create_resultdir(args.resultdir, vastdir)
     fieldchartsdir = resultdir + "fieldcharts/"
@@ -57,9 +62,7 @@ def run_do_rest(args):
     # Log filtering settings + check that reference frame is not inside of filter
     if args.jdfilter:
         logging.info(f"Filtering JD's: {args.jdfilter}")
-        ref_inside_filter = (
-            float(ref_jd) > args.jdfilter[0] and float(ref_jd) > args.jdfilter[1]
-        )
+        ref_inside_filter = not utils.jd_filter_mask([float(ref_jd)], args.jdfilter)[0]
         if ref_inside_filter:
             if not args.jdrefignore:
                 assert not ref_inside_filter, "Reference frame JD is filtered"
@@ -127,77 +130,74 @@ def run_do_rest(args):
         do_compstars.add_closest_compstars(compstar_needing_stars, comp_stars, 10)
 
     logging.info(f"Using {thread_count} threads for phase plots, lightcurves, ...")
+    period_engines.get_engine(args.periodengine)
+    vartype_engines = period_engines.parse_vartype_engines(args.vartypeengines)
+    search_settings = period_engines.SearchSettings(
+        args.minperiod,
+        args.maxperiod,
+        args.oversampling,
+        args.toppeaks,
+        args.refineperiods,
+        args.bootstrap,
+        args.bootstrapseconds,
+    )
+    # the results of this run, read by the selected files, the stats and the site. A resumed run adds to them
+    if not args.resume:
+        reading.trash_and_recreate_dir(Path(resultdir, result_store.STORE_DIR))
+    # every star is charted once, also when it is in several groups
+    groups = []
     if args.allstars:
+        groups.append(do_charts_vast.ChartGroup(star_descriptions, "phase_all/", "light_all/", "aavso_all/"))
+    else:
+        if args.vsx:
+            logging.info(f"Plotting {len(vsx_stars)} vsx stars...")
+            groups.append(do_charts_vast.ChartGroup(vsx_stars, "phase_vsx/", "light_vsx/", "aavso_vsx/"))
+        if args.radeccatalog or args.localidcatalog:
+            groups.append(
+                do_charts_vast.ChartGroup(selected_stars, "phase_selected/", "light_selected/", "aavso_selected")
+            )
+        if args.candidates:
+            logging.info(f"Plotting {len(candidate_stars)} candidates...")
+            groups.append(
+                do_charts_vast.ChartGroup(
+                    candidate_stars, "phase_candidates/", "light_candidates/", "aavso_candidates/"
+                )
+            )
+    # one airmass table of the field for the AAVSO reports and the stats
+    airmass_table = (
+        airmass.AirmassTable.of_settings(airmass.wcs_centre(wcs)) if (do_aavso or args.stats) and wcs is not None else None
+    )
+    # stars are only killed for taking too long or using too much memory when asked for
+    task_budget = (
+        scheduler.TaskBudget(args.taskseconds, args.taskmemory)
+        if args.taskseconds is not None or args.taskmemory is not None
+        else None
+    )
+    if groups:
         do_charts_vast.run(
-            star_descriptions,
+            groups,
             comp_stars,
             vastdir,
             resultdir,
-            "phase_all/",
-            "light_all/",
-            "aavso_all/",
             do_phase=do_phase,
             do_light=do_light,
             do_light_raw=do_light,
             do_aavso=do_aavso,
             nr_threads=thread_count,
             jdfilter=args.jdfilter,
-            desc="Phase/light/aavso of ALL stars",
+            max_err=args.maxerr,
+            store_periodograms=args.periodograms,
+            period_engine=args.periodengine,
+            vartype_engines=vartype_engines,
+            search_settings=search_settings,
+            nr_render_threads=args.renderthreads,
+            resume=args.resume,
+            max_worker_rss_mb=args.workermemory,
+            task_budget=task_budget,
+            airmass_table=airmass_table,
+            time_reference=args.timeref,
+            desc="Phase/light/aavso",
         )
-    else:
-        if args.vsx:
-            logging.info(f"Plotting {len(vsx_stars)} vsx stars...")
-            do_charts_vast.run(
-                vsx_stars,
-                comp_stars,
-                vastdir,
-                resultdir,
-                "phase_vsx/",
-                "light_vsx/",
-                "aavso_vsx/",
-                do_phase=do_phase,
-                do_light=do_light,
-                do_light_raw=do_light,
-                do_aavso=do_aavso,
-                nr_threads=thread_count,
-                jdfilter=args.jdfilter,
-                desc="Phase/light/aavso of VSX stars",
-            )
-        if args.radeccatalog or args.localidcatalog:
-            do_charts_vast.run(
-                selected_stars,
-                comp_stars,
-                vastdir,
-                resultdir,
-                "phase_selected/",
-                "light_selected/",
-                "aavso_selected",
-                do_phase=do_phase,
-                do_light=do_light,
-                do_light_raw=do_light,
-                do_aavso=do_aavso,
-                nr_threads=thread_count,
-                jdfilter=args.jdfilter,
-                desc="Phase/light/aavso of selected stars",
-            )
-        if args.candidates:
-            logging.info(f"Plotting {len(candidate_stars)} candidates...")
-            do_charts_vast.run(
-                candidate_stars,
-                comp_stars,
-                vastdir,
-                resultdir,
-                "phase_candidates/",
-                "light_candidates/",
-                "aavso_candidates/",
-                do_phase=do_phase,
-                do_light=do_light,
-                do_light_raw=do_light,
-                do_aavso=do_aavso,
-                nr_threads=thread_count,
-                jdfilter=args.jdfilter,
-                desc="Phase/light/aavso of candidates",
-            )
 
     # starfiledata is filled in during the phase plotting, so should come after it. Without phase it will be incomplete
     ids = [x.local_id for x in selected_stars]
@@ -207,7 +207,7 @@ def run_do_rest(args):
     write_selected_files(resultdir, vastdir, selected_stars)
     if args.field:
         do_charts_field.run_standard_field_charts(
-            star_descriptions, wcs, fieldchartsdir, wcs_file, comp_stars
+            star_descriptions, wcs, fieldchartsdir, wcs_file, comp_stars, thread_count
         )
 
     if args.stats:
@@ -216,9 +216,11 @@ def run_do_rest(args):
         )
         do_charts_stats.plot_aperture_vs_jd(fieldchartsdir, vastdir, args.jdfilter)
         do_charts_stats.plot_aperture_vs_airmass(
-            fieldchartsdir, vastdir, wcs, args.jdfilter
+            fieldchartsdir, vastdir, wcs, args.jdfilter, airmass_table
+        )
+        do_charts_stats.plot_merr_vs_jd(
+            fieldchartsdir, selected_stars, args.jdfilter, result_store.ResultStore.of_resultdir(resultdir)
         )
-        do_charts_stats.plot_merr_vs_jd(fieldchartsdir, selected_stars, args.jdfilter)
 
     if args.site:
         ids = [x.local_id for x in selected_stars]
@@ -359,6 +361,7 @@ def write_selected_files(
         f"Writing {radec_catalog} and {localid_catalog} and {aavso_vsx_catalog} with {len(selected_stars)} stars..."
     )
     sorted_stars = utils.sort_selected(selected_stars)
+    store = result_store.ResultStore.of_resultdir(resultdir)
     vsx_stars_len = len(utils.get_stars_with_metadata(selected_stars, "VSX"))
     no_vsx_len = len(
         utils.get_stars_with_metadata(selected_stars, "SELECTEDTAG", exclude=["VSX"])
@@ -377,6 +380,12 @@ def write_selected_files(
     def format_float_1(atoml, arg: str):
         return format_float_arg(atoml, arg, 1)
 
+    def format_err(atoml, arg: str):
+        # errors of calculated periods are often below the 5 decimals of the period
+        if arg not in atoml or not isinstance(atoml[arg], float):
+            return format_float_5(atoml, arg)
+        return f"{atoml[arg]:.2g}"
+
     def format_string(arg: str, atoml):
         if arg in atoml:
             return atoml[arg]
@@ -410,11 +419,9 @@ def write_selected_files(
                 if not ucac4
                 else f"{ucac4.coords.ra.deg:.7f},{ucac4.coords.dec.deg:.7f}"
             )
-            starui: utils.StarUI = utils.get_star_or_catalog_name(star)
-            txt_path = Path(Path(star.result["phase"]).parent, "txt", starui.filename_no_ext + ".txt")
-            try:
-                parsed_toml = toml.load(txt_path)
-                postfix = f"{format_string('minmax', parsed_toml)},{format_float_1(parsed_toml, 'min')},{format_float_1(parsed_toml, 'max')},{metadata.var_type},{format_float_5(parsed_toml, 'period')},{format_float_5(parsed_toml, 'period_err')},{format_string('epoch', parsed_toml)}"
+            parsed_toml = store.get_info(star.local_id)
+            if parsed_toml is not None:
+                postfix = f"{format_string('minmax', parsed_toml)},{format_float_1(parsed_toml, 'min')},{format_float_1(parsed_toml, 'max')},{metadata.var_type},{format_float_5(parsed_toml, 'period')},{format_err(parsed_toml, 'period_err')},{format_string('epoch', parsed_toml)}"
 
                 out_radec_catalog.write(
                     f"{metadata.our_name},{star.coords.ra.deg:.7f},{star.coords.dec.deg:.7f},{ucac4_name},False,{postfix}\n"
@@ -425,9 +432,9 @@ def write_selected_files(
                 out_aavso_vsx_catalog.write(
                     f"{metadata.our_name},{ucac4_name},{ucac4_coords},{postfix}\n"
                 )
-            except FileNotFoundError:
+            else:
                 logging.error(
-                    f"While writing selected files, Could not find {txt_path}"
+                    f"While writing selected files, Could not find the results of star {star.local_id}"
                 )
 
 
@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+
+
+# Stores period search results on disk, keyed on the lightcurve and the search parameters.
+# A rerun with the same calibrated lightcurve and frequency grid finds the result without searching again.
+class PeriodCache:
+    def __init__(self, cachedir, store_periodograms: bool = False):
+        self.cachedir = Path(cachedir)
+        # also store the (compressed) periodogram of every star, for re-analysis without recomputing
+        self.store_periodograms = store_periodograms
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(t, mags, errs, frequencies, method: str = "LS") -> str:
+        """ hash of the observations of one star (NaN's are skipped), the frequency grid and the search method """
+        t, mags, errs = (np.asarray(x, dtype=np.float64) for x in (t, mags, errs))
+        valid = ~(np.isnan(mags) | np.isnan(errs))
+        sha = hashlib.sha1()
+        for array in (t[valid], mags[valid], errs[valid]):
+            sha.update(np.ascontiguousarray(array).tobytes())
+        grid = (frequencies[0], frequencies[-1], len(frequencies)) if len(frequencies) > 0 else ()
+        sha.update(f"{method} {grid}".encode())
+        return sha.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return Path(self.cachedir, key[:2], f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Tuple[float, float]]:
+        """ (period, power) or None on a cache miss. A stored period of NaN means the star has no period """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                if self.store_periodograms and "periodogram" not in data:
+                    return None
+                return float(data["period"]), float(data["power"])
+        except (OSError, ValueError, KeyError) as ex:
+            logging.warning(f"Ignoring unreadable period cache entry {path}: {ex}")
+            return None
+
+    def get_periodogram(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """ (frequencies, power) of a stored periodogram, or None """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if "periodogram" not in data:
+                return None
+            f0, df, n = data["grid"]
+            return f0 + df * np.arange(int(n)), data["periodogram"].astype(float)
+
+    def put(self, key: str, period: float, power: float, frequencies=None, periodogram=None):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        arrays = {"period": np.float64(period), "power": np.float64(power)}
+        if self.store_periodograms and periodogram is not None and len(frequencies) > 1:
+            # power is between 0 and 1, half precision is plenty for re-analysis
+            arrays["grid"] = np.array([frequencies[0], frequencies[1] - frequencies[0], len(frequencies)])
+            arrays["periodogram"] = np.asarray(periodogram, dtype=np.float16)
+        # write to a temporary file first, concurrent runs never see a half written entry
+        tmp_path = path.with_name(f"{key}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fp:
+            np.savez_compressed(fp, **arrays)
+        os.replace(tmp_path, path)
@@ -0,0 +1,263 @@
+"""
+Period search engines. Every engine searches the periods of many stars at once on a shared frequency grid:
+engine(t, mags, errs, frequencies, min_frequencies) yields (slice of stars, best frequency, its statistic, periodogram)
+per batch of stars, see periodogram.search_frequencies. In every periodogram higher values are better.
+"""
+
+import logging
+from collections import namedtuple
+from typing import Callable, Dict, Iterator, Tuple
+import numpy as np
+from scipy import sparse
+import periodogram
+
+# number of phase bins of PDM and AoV
+PHASE_BINS = 10
+# number of phase bins of the box search, and the longest box (eclipse) in bins
+BOX_BINS = 100
+BOX_MAX_BINS = 10
+# max number of elements (frames x frequencies) of one block of phases
+MAX_BLOCK_ELEMENTS = 4_000_000
+# max number of statistics (stars x frequencies) computed with the same binning matrices, 400 MB
+MAX_RESULT_ELEMENTS = 50_000_000
+# the refined grid around a peak of the coarse grid is this much finer, and spans one coarse step on either side
+REFINE_FACTOR = 10
+
+# the coarse grid runs from 1/max_period (default: the baseline) to 1/min_period with a step of
+# 1/(oversampling * baseline), the best period is refined around the top_peaks highest peaks of the coarse grid.
+# refine_priors searches around known (SITE/VSX) periods first, see do_charts_vast.calculate_batch_periods.
+# Calculated periods get a bootstrap error from bootstrap_resamples resamples, in at most bootstrap_seconds per star
+SearchSettings = namedtuple(
+    "SearchSettings",
+    "min_period max_period oversampling top_peaks refine_priors bootstrap_resamples bootstrap_seconds",
+    defaults=(0.01, None, 2, 5, False, 0, 10.0),
+)
+
+Engine = Callable[..., Iterator[Tuple[slice, np.ndarray, np.ndarray, np.ndarray]]]
+
+
+def _binning_matrix(t, frequencies, nr_bins) -> sparse.csr_matrix:
+    """
+    The sparse (frequency, bin) x frames matrix which sums the frames per phase bin for every frequency. It only
+    depends on the frame times, so one matrix serves all stars
+    """
+    phases = np.multiply.outer(t, frequencies) % 1.0
+    bins = np.minimum((phases * nr_bins).astype(int), nr_bins - 1)
+    rows = (bins + nr_bins * np.arange(len(frequencies))).ravel()
+    cols = np.repeat(np.arange(len(t)), len(frequencies))
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(frequencies) * nr_bins, len(t)))
+
+
+def _phase_bin_sums(binning: sparse.csr_matrix, nr_bins, values) -> np.ndarray:
+    """ sums of values (frames, stars) per phase bin, shape (len(values), frequencies, bins, stars) """
+    return np.stack([binning @ value for value in values]).reshape(len(values), -1, nr_bins, values[0].shape[1])
+
+
+def _statistic_batches(t, mags, errs, frequencies, nr_bins, statistic):
+    """
+    yields (slice of stars, statistic with shape (stars, frequencies)) for every batch of stars. The stars are done in
+    rounds of several batches (at most MAX_RESULT_ELEMENTS statistics), in which the binning matrix of every block of
+    frequencies is built once and used for all batches of the round
+    """
+    t = np.asarray(t, dtype=float)
+    t = t - np.nanmin(t)
+    mags = np.asarray(mags, dtype=float).reshape(len(t), -1)
+    errs = np.asarray(errs, dtype=float).reshape(len(t), -1)
+    frequencies = np.asarray(frequencies, dtype=float)
+    block_size = max(1, MAX_BLOCK_ELEMENTS // max(1, len(t)))
+    batch_size = max(1, periodogram.MAX_BLOCK_ELEMENTS // max(1, len(frequencies)))
+    round_size = max(batch_size, MAX_RESULT_ELEMENTS // max(1, len(frequencies)) // batch_size * batch_size)
+    blocks = [slice(start, start + block_size) for start in range(0, len(frequencies), block_size)]
+    for round_start in range(0, mags.shape[1], round_size):
+        batches = [
+            slice(start, min(start + batch_size, mags.shape[1]))
+            for start in range(round_start, min(round_start + round_size, mags.shape[1]), batch_size)
+        ]
+        valids = [~(np.isnan(mags[:, stars]) | np.isnan(errs[:, stars])) & (errs[:, stars] > 0) for stars in batches]
+        results = [np.empty((valid.shape[1], len(frequencies))) for valid in valids]
+
+        def evaluate(block):
+            binning = _binning_matrix(t, frequencies[block], nr_bins)
+            for stars, valid, result in zip(batches, valids, results):
+                result[:, block] = statistic(binning, nr_bins, mags[:, stars], errs[:, stars], valid).T
+
+        # the blocks of long lightcurves are evaluated in parallel threads, each fills its own columns
+        periodogram.map_blocks(evaluate, blocks, periodogram.get_threads(len(t)))
+        for stars, result in zip(batches, results):
+            yield stars, np.nan_to_num(result, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def _within_between(binning, nr_bins, mags, valid):
+    """ unweighted sums of squares within and between the phase bins, and the nr of filled bins and points """
+    n = valid.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = np.where(valid, mags - np.nansum(np.where(valid, mags, 0), axis=0) / n, 0.0)
+    counts, sums = _phase_bin_sums(binning, nr_bins, [valid.astype(float), y])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = np.where(counts > 0, np.square(sums) / counts, 0.0).sum(axis=1)
+    within = np.square(y).sum(axis=0) - between
+    filled_bins = (counts > 0).sum(axis=1)
+    return within, between, filled_bins, n
+
+
+def _aov_statistic(binning, nr_bins, mags, errs, valid):
+    # Schwarzenberg-Czerny 1989, MNRAS 241, 153
+    within, between, filled_bins, n = _within_between(binning, nr_bins, mags, valid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (between / (filled_bins - 1)) / (within / (n - filled_bins))
+
+
+def _pdm_statistic(binning, nr_bins, mags, errs, valid):
+    # Stellingwerf 1978, ApJ 224, 953. Theta is lowest at the best period, 1 - theta keeps higher is better
+    within, between, filled_bins, n = _within_between(binning, nr_bins, mags, valid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta = (within / (n - filled_bins)) / ((within + between) / (n - 1))
+    return 1 - theta
+
+
+def _box_statistic(binning, nr_bins, mags, errs, valid):
+    # box least squares, Kovacs, Zucker & Mazeh 2002, A&A 391, 369. Only boxes fainter than the mean count
+    weights, y = periodogram.normalized_weights(np.where(valid, mags, np.nan), errs)
+    y = np.where(valid, y - (weights * y).sum(axis=0), 0.0)
+    bin_weights, bin_sums = _phase_bin_sums(binning, nr_bins, [weights, weights * y])
+    # boxes may wrap around phase 1.0
+    bin_weights = np.concatenate([bin_weights, bin_weights[:, :BOX_MAX_BINS]], axis=1)
+    bin_sums = np.concatenate([bin_sums, bin_sums[:, :BOX_MAX_BINS]], axis=1)
+    cum_weights = np.cumsum(bin_weights, axis=1)
+    cum_sums = np.cumsum(bin_sums, axis=1)
+    best = np.zeros((bin_sums.shape[0], mags.shape[1]))
+    for width in range(1, BOX_MAX_BINS + 1):
+        r = cum_weights[:, width : width + nr_bins] - cum_weights[:, :nr_bins]
+        s = cum_sums[:, width : width + nr_bins] - cum_sums[:, :nr_bins]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sr = np.where((s > 0) & (r > 0) & (r < 1), np.square(s) / (r * (1 - r)), 0.0)
+        best = np.maximum(best, sr.max(axis=1))
+    return best
+
+
+def _binned_engine(statistic, nr_bins) -> Engine:
+    def engine(t, mags, errs, frequencies, min_frequencies: np.ndarray = None):
+        batches = _statistic_batches(t, mags, errs, frequencies, nr_bins, statistic)
+        return periodogram.best_of_batches(batches, np.asarray(frequencies), min_frequencies)
+
+    return engine
+
+
+ENGINES: Dict[str, Engine] = {
+    "LS": periodogram.search_frequencies,
+    "PDM": _binned_engine(_pdm_statistic, PHASE_BINS),
+    "AOV": _binned_engine(_aov_statistic, PHASE_BINS),
+    "BLS": _binned_engine(_box_statistic, BOX_BINS),
+}
+
+
+def get_coarse_grid(t, settings: SearchSettings) -> np.ndarray:
+    return periodogram.get_frequency_grid(
+        t, settings.min_period, settings.max_period, settings.oversampling
+    )
+
+
+def top_peak_frequencies(power: np.ndarray, frequencies: np.ndarray, nr_peaks: int) -> np.ndarray:
+    """ the frequencies of the nr_peaks highest local maxima of every periodogram, (stars, nr_peaks), NaN padded """
+    is_peak = np.zeros(power.shape, dtype=bool)
+    is_peak[:, 1:-1] = (power[:, 1:-1] >= power[:, :-2]) & (power[:, 1:-1] > power[:, 2:])
+    is_peak[:, 0] = power[:, 0] > power[:, 1]
+    is_peak[:, -1] = power[:, -1] >= power[:, -2]
+    peak_power = np.where(is_peak & (power > 0), power, -np.inf)
+    nr_peaks = min(nr_peaks, power.shape[1])
+    indices = np.argpartition(-peak_power, nr_peaks - 1, axis=1)[:, :nr_peaks]
+    result = frequencies[indices]
+    result[np.isinf(np.take_along_axis(peak_power, indices, axis=1))] = np.nan
+    return result
+
+
+def coarse_to_fine(
+    engine_name: str, t, mags, errs, frequencies, min_frequencies: np.ndarray = None, top_peaks: int = 5
+):
+    """
+    Runs an engine on the coarse, evenly spaced grid frequencies and refines the best frequency of every star on a
+    fine grid around the top_peaks highest peaks of its coarse periodogram. Yields like an engine, with the coarse
+    periodograms
+    """
+    engine = get_engine(engine_name)
+    t = np.asarray(t, dtype=float)
+    mags = np.asarray(mags, dtype=float).reshape(len(t), -1)
+    errs = np.asarray(errs, dtype=float).reshape(len(t), -1)
+    batches = engine(t, mags, errs, frequencies, min_frequencies)
+    if top_peaks < 1 or len(frequencies) < 2:
+        yield from batches
+        return
+    step = frequencies[1] - frequencies[0]
+    offsets = np.linspace(-step, step, 2 * REFINE_FACTOR + 1)
+    for stars, frequency, power, coarse_power in batches:
+        peaks = top_peak_frequencies(coarse_power, frequencies, top_peaks)
+        batch_min_frequencies = None if min_frequencies is None else min_frequencies[stars]
+        if engine is periodogram.search_frequencies:
+            fine_frequency, fine_power = periodogram.refine_peaks(
+                t, mags[:, stars], errs[:, stars], peaks, offsets, batch_min_frequencies
+            )
+        else:
+            fine_frequency, fine_power = _refine_peaks_per_star(
+                engine, t, mags[:, stars], errs[:, stars], peaks, offsets, batch_min_frequencies
+            )
+        refined = ~np.isnan(fine_frequency)
+        frequency[refined], power[refined] = fine_frequency[refined], fine_power[refined]
+        yield stars, frequency, power, coarse_power
+
+
+def _refine_peaks_per_star(engine, t, mags, errs, peaks, offsets, min_frequencies):
+    """ runs the engine per star on its own fine grid, for engines without a batched refinement """
+    fine_frequency = np.full(mags.shape[1], np.nan)
+    fine_power = np.full(mags.shape[1], np.nan)
+    for star in range(mags.shape[1]):
+        star_peaks = peaks[star][~np.isnan(peaks[star])]
+        if len(star_peaks) == 0:
+            continue
+        fine = np.unique(np.add.outer(star_peaks, offsets))
+        fine = fine[fine > 0]
+        valid = ~(np.isnan(mags[:, star]) | np.isnan(errs[:, star]))
+        star_min_frequency = None if min_frequencies is None else min_frequencies[star : star + 1]
+        _, frequency, power, _ = next(
+            engine(t[valid], mags[valid, star], errs[valid, star], fine, star_min_frequency)
+        )
+        fine_frequency[star], fine_power[star] = frequency[0], power[0]
+    return fine_frequency, fine_power
+
+
+def register_engine(name: str, engine: Engine):
+    """ adds an engine (or replaces one) which can then be selected by name """
+    ENGINES[name.upper()] = engine
+
+
+def get_engine(name: str) -> Engine:
+    engine = ENGINES.get(name.upper())
+    if engine is None:
+        raise ValueError(f"Unknown period engine '{name}', choose one of {sorted(ENGINES.keys())}")
+    return engine
+
+
+def select_engine_name(var_type: str, default_engine: str, vartype_engines: Dict[str, str] = None) -> str:
+    """
+    The engine for a var type: the entry of vartype_engines with the longest var type which starts var_type,
+    so 'EA' also matches 'EA/SD'. Falls back to default_engine
+    """
+    if var_type is None or not vartype_engines:
+        return default_engine
+    var_type = str(var_type).upper()
+    matches = [key for key in vartype_engines if var_type.startswith(key.upper())]
+    if len(matches) == 0:
+        return default_engine
+    return vartype_engines[max(matches, key=len)]
+
+
+def parse_vartype_engines(entries) -> Dict[str, str]:
+    """ ['EA=BLS', 'RR=PDM'] to {'EA': 'BLS', 'RR': 'PDM'}, checking that the engines exist """
+    result = {}
+    for entry in entries or []:
+        var_type, _, name = entry.partition("=")
+        if not var_type or not name:
+            raise ValueError(f"Expected VARTYPE=ENGINE, got '{entry}'")
+        get_engine(name)
+        result[var_type.strip()] = name.strip().upper()
+    logging.debug(f"Period engines per var type: {result}")
+    return result
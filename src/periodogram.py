@@ -0,0 +1,413 @@
+"""
+Lomb-Scargle periodograms of many stars at once, evaluated on one frequency grid shared by all stars.
+The stars share their frames, so everything which only depends on the frame times is computed once and the
+periodograms of all stars follow from matrix products with the per star weights.
+"""
+
+import logging
+import math
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Tuple
+import numpy as np
+from scipy import sparse
+
+# oversampling of the FFT grid w.r.t. the frequency grid, and the order of the extirpolation (Press & Rybicki 1989)
+FFT_OVERSAMPLING = 3
+EXTIRPOLATION_ORDER = 4
+# grids with fewer frequencies, or which are not evenly spaced and ascending, are evaluated directly
+FFT_MIN_FREQUENCIES = 1000
+# max number of complex elements held in memory for one batch of stars or one block of frequencies
+MAX_BLOCK_ELEMENTS = 4_000_000
+# lightcurves with at least this many frames split the frequency grid over MAX_THREADS threads. numpy's FFT and
+# array operations and scipy's sparse products release the GIL, so a single giant star doesn't stall a run
+PARALLEL_MIN_POINTS = 20000
+MAX_THREADS = os.cpu_count() or 1
+# a prior period is refined within +/- this many frequency resolutions (1 / baseline), in steps of a tenth of one
+PRIOR_WINDOW_RESOLUTIONS = 5
+# the refined prior needs a false alarm probability below this, otherwise the prior is not confirmed
+PRIOR_FALSE_ALARM = 0.01
+# bootstrap resamples are evaluated this many at a time, on a fine grid of +/- one frequency resolution around the
+# period in BOOTSTRAP_STEPS steps per side. Fewer than BOOTSTRAP_MIN_RESAMPLES resamples give no error
+BOOTSTRAP_BATCH = 50
+BOOTSTRAP_STEPS = 100
+BOOTSTRAP_MIN_RESAMPLES = 20
+
+
+def get_frequency_grid(
+    t, min_period: float = 0.01, max_period: float = None, oversampling: int = 5
+) -> np.ndarray:
+    """ evenly spaced frequencies (1/d) between 1/max_period and 1/min_period, max_period defaults to the baseline """
+    baseline = np.nanmax(t) - np.nanmin(t)
+    max_period = baseline if max_period is None else max_period
+    if baseline <= 0 or max_period <= min_period:
+        return np.array([])
+    df = 1.0 / (oversampling * baseline)
+    return np.arange(1.0 / max_period, 1.0 / min_period, df)
+
+
+def _is_evenly_spaced(frequencies: np.ndarray) -> bool:
+    """ True for ascending grids with a constant step """
+    if len(frequencies) < 3:
+        return False
+    steps = np.diff(frequencies)
+    return steps[0] > 0 and np.allclose(steps, steps[0], rtol=1e-6, atol=0)
+
+
+def normalized_weights(mags: np.ndarray, errs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ per star weights 1/err^2 summing to 1, missing points get weight 0. Arrays are (frames, stars) """
+    valid = ~(np.isnan(mags) | np.isnan(errs)) & (errs > 0)
+    weights = np.where(valid, 1.0 / np.square(np.where(valid, errs, 1.0)), 0.0)
+    weight_sum = weights.sum(axis=0)
+    weights = np.divide(weights, weight_sum, out=np.zeros_like(weights), where=weight_sum > 0)
+    return weights, np.where(valid, mags, 0.0)
+
+
+def get_threads(nr_points: int) -> int:
+    """ the nr of threads over which the frequencies of lightcurves with nr_points frames are split """
+    return MAX_THREADS if nr_points >= PARALLEL_MIN_POINTS else 1
+
+
+def map_blocks(function, blocks, threads: int = 1) -> list:
+    """ [function(block) for block in blocks], in parallel threads if threads > 1 """
+    blocks = list(blocks)
+    if threads <= 1 or len(blocks) <= 1:
+        return [function(block) for block in blocks]
+    with ThreadPoolExecutor(min(threads, len(blocks))) as executor:
+        return list(executor.map(function, blocks))
+
+
+def _split_grid(frequencies: np.ndarray, threads: int) -> list:
+    """ contiguous chunks of the grid, one per thread, big enough to keep using the FFT """
+    if _is_evenly_spaced(frequencies):
+        threads = min(threads, len(frequencies) // FFT_MIN_FREQUENCIES)
+    return np.array_split(frequencies, max(1, min(threads, len(frequencies))))
+
+
+class _TrigSums:
+    """
+    Computes sum_i h[i, star] * exp(2 pi j f t[i]) for every star and every frequency f of the grid.
+    Evenly spaced grids use a sparse extirpolation matrix (frames to FFT grid) followed by an FFT,
+    other grids multiply with the phasors of the frames directly.
+    """
+
+    def __init__(self, t: np.ndarray, frequencies: np.ndarray):
+        self.t = t
+        self.frequencies = frequencies
+        self.use_fft = len(frequencies) >= FFT_MIN_FREQUENCIES and _is_evenly_spaced(frequencies)
+        if self.use_fft:
+            f0, df = frequencies[0], frequencies[1] - frequencies[0]
+            self.nfft = 1 << int(math.ceil(math.log2(len(frequencies) * FFT_OVERSAMPLING)))
+            self.start_phasors = np.exp(2j * np.pi * f0 * t)
+            self.extirpolation = _extirpolation_matrix((t * self.nfft * df) % self.nfft, self.nfft)
+
+    def __call__(self, h: np.ndarray) -> np.ndarray:
+        """ h is (frames, stars), returns (stars, frequencies) """
+        if self.use_fft:
+            grid = self.extirpolation @ (self.start_phasors[:, np.newaxis] * h)
+            return (np.fft.ifft(grid, axis=0)[: len(self.frequencies)] * self.nfft).T
+        result = np.empty((h.shape[1], len(self.frequencies)), dtype=complex)
+        block_size = max(1, MAX_BLOCK_ELEMENTS // max(1, len(self.t)))
+        for start in range(0, len(self.frequencies), block_size):
+            block = slice(start, start + block_size)
+            phasors = np.exp(2j * np.pi * np.multiply.outer(self.t, self.frequencies[block]))
+            result[:, block] = h.T @ phasors
+        return result
+
+
+def _extirpolation_matrix(x: np.ndarray, n: int, order: int = EXTIRPOLATION_ORDER) -> sparse.csr_matrix:
+    """
+    (n, len(x)) matrix which spreads a value at the non integer position x onto the order nearest grid points,
+    such that sums of exp(2 pi j k x / n) are preserved. Same coefficients as astropy's extirpolate
+    """
+    rows, cols, values = [], [], []
+    frames = np.arange(len(x))
+    integers = x % 1 == 0
+    rows.append(x[integers].astype(int))
+    cols.append(frames[integers])
+    values.append(np.ones(np.count_nonzero(integers)))
+    x, frames = x[~integers], frames[~integers]
+    ilo = np.clip((x - order // 2).astype(int), 0, n - order)
+    numerator = np.prod(x - ilo - np.arange(order)[:, np.newaxis], 0)
+    denominator = float(math.factorial(order - 1))
+    for j in range(order):
+        if j > 0:
+            denominator *= j / (j - order)
+        index = ilo + (order - 1 - j)
+        rows.append(index)
+        cols.append(frames)
+        values.append(numerator / (denominator * (x - index)))
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n, len(integers))
+    )
+
+
+def _power(weights, y, sums, double_sums) -> np.ndarray:
+    """ generalized Lomb-Scargle power (Zechmeister & Kuerster 2009, A&A 496, 577) of a batch of stars """
+    weighted_y = weights * y
+    return _power_from_sums(weights, y, sums(weights), sums(weighted_y), double_sums(weights))
+
+
+def _power_from_sums(weights, y, Z, Zy, Z2) -> np.ndarray:
+    """
+    weights and y are (frames, stars), Z, Zy and Z2 are the weighted sums of exp(jwt), y exp(jwt) and exp(2jwt)
+    with shape (stars, frequencies)
+    """
+    weighted_y = weights * y
+    Y = weighted_y.sum(axis=0)[:, np.newaxis]
+    YY = (weighted_y * y).sum(axis=0)[:, np.newaxis] - np.square(Y)
+    C, S = Z.real, Z.imag
+    YC = Zy.real - Y * C
+    YS = Zy.imag - Y * S
+    # cos^2 = (1 + cos 2wt) / 2 and the weights sum to 1
+    CC_raw = 0.5 * (1 + Z2.real)
+    CC = CC_raw - np.square(C)
+    SS = (1 - CC_raw) - np.square(S)
+    CS = 0.5 * Z2.imag - C * S
+    D = CC * SS - np.square(CS)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        power = (SS * np.square(YC) + CC * np.square(YS) - 2 * CS * YC * YS) / (YY * D)
+    return np.nan_to_num(power, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def refine_peaks(
+    t, mags, errs, peak_frequencies: np.ndarray, offsets: np.ndarray, min_frequencies: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best frequency and power of every star on the fine grids peak + offsets around its peak frequencies
+    (stars, peaks), NaN peaks are skipped. exp(jwt) at peak + offset is exp(jwt) at the peak times exp(jwt) at the
+    offset, so the phasors of the offsets are shared by all stars and peaks
+    """
+    t = np.asarray(t, dtype=float)
+    t = t - np.nanmin(t)
+    mags = np.asarray(mags, dtype=float).reshape(len(t), -1)
+    errs = np.asarray(errs, dtype=float).reshape(len(t), -1)
+    weights, y = normalized_weights(mags, errs)
+    offset_phasors = np.exp(2j * np.pi * np.multiply.outer(t, offsets))
+    double_offset_phasors = np.square(offset_phasors)
+    best_frequency = np.full(mags.shape[1], np.nan)
+    best_power = np.full(mags.shape[1], np.nan)
+    for peak in np.asarray(peak_frequencies).T:
+        has_peak = ~np.isnan(peak)
+        if not has_peak.any():
+            continue
+        peak_phasors = np.exp(2j * np.pi * np.multiply.outer(t, np.where(has_peak, peak, 0.0)))
+        weighted_phasors = weights * peak_phasors
+        power = _power_from_sums(
+            weights,
+            y,
+            weighted_phasors.T @ offset_phasors,
+            (weighted_phasors * y).T @ offset_phasors,
+            (weighted_phasors * peak_phasors).T @ double_offset_phasors,
+        )
+        frequencies = peak[:, np.newaxis] + offsets[np.newaxis, :]
+        excluded = ~has_peak[:, np.newaxis] | (frequencies <= 0)
+        if min_frequencies is not None:
+            excluded |= frequencies < min_frequencies[:, np.newaxis]
+        power[excluded] = 0
+        argmax = np.argmax(power, axis=1)
+        peak_power = power[np.arange(len(argmax)), argmax]
+        better = (peak_power > 0) & ~(peak_power <= best_power)
+        best_power[better] = peak_power[better]
+        best_frequency[better] = frequencies[better, argmax[better]]
+    return best_frequency, best_power
+
+
+def power_batches(t, mags, errs, frequencies):
+    """
+    Yields (slice of stars, power of those stars with shape (stars, frequencies)).
+    t is (frames,), mags and errs are (frames, stars) with NaN where a star has no observation
+    """
+    t = np.asarray(t, dtype=float)
+    t = t - np.nanmin(t)
+    mags = np.asarray(mags, dtype=float).reshape(len(t), -1)
+    errs = np.asarray(errs, dtype=float).reshape(len(t), -1)
+    frequencies = np.asarray(frequencies, dtype=float)
+    threads = get_threads(len(t))
+    # everything depending only on the frame times is shared by all stars. Long lightcurves evaluate a chunk of the
+    # grid per thread, the chunks are concatenated into one periodogram
+    chunks = [(_TrigSums(t, chunk), _TrigSums(t, 2 * chunk)) for chunk in _split_grid(frequencies, threads)]
+    grid_size = sum(
+        double_sums.nfft if double_sums.use_fft else len(double_sums.frequencies) for _, double_sums in chunks
+    )
+    batch_size = max(1, MAX_BLOCK_ELEMENTS // max(1, grid_size, len(t)))
+    for start in range(0, mags.shape[1], batch_size):
+        stars = slice(start, min(start + batch_size, mags.shape[1]))
+        weights, y = normalized_weights(mags[:, stars], errs[:, stars])
+        powers = map_blocks(lambda chunk: _power(weights, y, *chunk), chunks, threads)
+        yield stars, np.concatenate(powers, axis=1)
+
+
+def false_alarm_probability(power, nr_points, nr_frequencies):
+    """
+    probability that noise reaches this normalized power in one of nr_frequencies independent frequencies,
+    Zechmeister & Kuerster 2009, eq. 24
+    """
+    with np.errstate(invalid="ignore"):
+        single = np.power(1 - np.clip(power, 0, 1), np.maximum(nr_points - 3, 0) / 2)
+    return 1 - np.power(1 - single, nr_frequencies)
+
+
+def period_uncertainty(period, power, nr_points, baseline):
+    """
+    1 sigma error of a period from a sinusoid fit with normalized power (Montgomery & O'Donoghue 1999):
+    sigma_f = sqrt(6 / N) * noise / (pi * T * amplitude), with amplitude^2 / 2 and noise^2 in the ratio power : 1 - power
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_frequency = np.sqrt(6 / nr_points) * np.sqrt((1 - power) / (2 * power)) / (np.pi * baseline)
+    return np.square(period) * sigma_frequency
+
+
+def refine_prior_periods(t, mags, errs, prior_periods) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Searches narrow windows around the prior period of every star and around its half and double (aliases).
+    Returns the refined period, its uncertainty and whether the peak is significant, per star.
+    Stars without observations or prior (NaN) are not significant
+    """
+    t = np.asarray(t, dtype=float)
+    mags = np.asarray(mags, dtype=float).reshape(len(t), -1)
+    errs = np.asarray(errs, dtype=float).reshape(len(t), -1)
+    prior_frequencies = 1.0 / np.asarray(prior_periods, dtype=float)
+    candidates = np.column_stack([prior_frequencies, 2 * prior_frequencies, prior_frequencies / 2])
+    valid = ~(np.isnan(mags) | np.isnan(errs))
+    nr_points = valid.sum(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        t_valid = np.where(valid, t[:, np.newaxis], np.nan)
+        baselines = np.nanmax(t_valid, axis=0) - np.nanmin(t_valid, axis=0)
+    baseline = np.nanmax(baselines) if np.any(baselines > 0) else 0
+    if baseline <= 0:
+        nothing = np.full(mags.shape[1], np.nan)
+        return nothing, nothing, np.zeros(mags.shape[1], dtype=bool)
+    resolution = 1.0 / baseline
+    offsets = np.arange(-10 * PRIOR_WINDOW_RESOLUTIONS, 10 * PRIOR_WINDOW_RESOLUTIONS + 1) * resolution / 10
+    frequency, power = refine_peaks(t, mags, errs, candidates, offsets)
+    # every window spans 2 * PRIOR_WINDOW_RESOLUTIONS independent frequencies
+    nr_independent = candidates.shape[1] * 2 * PRIOR_WINDOW_RESOLUTIONS
+    significant = false_alarm_probability(power, nr_points, nr_independent) < PRIOR_FALSE_ALARM
+    periods = 1.0 / frequency
+    return periods, period_uncertainty(periods, power, nr_points, baselines), significant
+
+
+def bootstrap_period_error(
+    t, mags, errs, period: float, nr_resamples: int = 200, time_budget: float = None, rng=None
+) -> float:
+    """
+    1 sigma error of the period of one star: the scatter of the best period of its lightcurve resampled with
+    replacement. A resample is the lightcurve with every frame weighted by the nr of times it was drawn, so the
+    resamples share the frame times and a batch of them is one refine_peaks call. Stops early after time_budget
+    seconds, NaN when too few resamples were done
+    """
+    t, mags, errs = (np.asarray(x, dtype=float).ravel() for x in (t, mags, errs))
+    valid = ~(np.isnan(t) | np.isnan(mags) | np.isnan(errs)) & (errs > 0)
+    t, mags, errs = t[valid], mags[valid], errs[valid]
+    if len(t) < 4 or not period > 0 or np.ptp(t) <= 0:
+        return np.nan
+    rng = np.random.default_rng() if rng is None else rng
+    offsets = np.linspace(-1, 1, 2 * BOOTSTRAP_STEPS + 1) / np.ptp(t)
+    start = time.perf_counter()
+    frequencies = []
+    done = 0
+    while done < nr_resamples:
+        size = min(BOOTSTRAP_BATCH, nr_resamples - done)
+        counts = rng.multinomial(len(t), np.full(len(t), 1.0 / len(t)), size=size).T
+        with np.errstate(divide="ignore"):
+            resampled_errs = np.where(counts > 0, errs[:, np.newaxis] / np.sqrt(counts), np.nan)
+        resampled_mags = np.repeat(mags[:, np.newaxis], size, axis=1)
+        frequency, _ = refine_peaks(
+            t, resampled_mags, resampled_errs, np.full((size, 1), 1.0 / period), offsets
+        )
+        frequencies.append(frequency[~np.isnan(frequency)])
+        done += size
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            break
+    periods = 1.0 / np.concatenate(frequencies)
+    if len(periods) < BOOTSTRAP_MIN_RESAMPLES:
+        logging.debug(f"Only {len(periods)} bootstrap resamples within {time_budget} s, no period error")
+        return np.nan
+    return float(np.std(periods, ddof=1))
+
+
+def lombscargle_power(t, mags, errs, frequencies) -> np.ndarray:
+    """ the full periodogram of every star, shape (stars, frequencies) """
+    batches = [power for _, power in power_batches(t, mags, errs, frequencies)]
+    return np.concatenate(batches, axis=0)
+
+
+def search_frequencies(
+    t, mags, errs, frequencies, min_frequencies: np.ndarray = None
+) -> Iterator[Tuple[slice, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yields (slice of stars, best frequency, its power, periodogram) per batch of stars. The best frequency and power
+    are NaN for stars without a peak. min_frequencies optionally limits the search of every star to frequencies
+    >= its min frequency
+    """
+    return best_of_batches(power_batches(t, mags, errs, frequencies), frequencies, min_frequencies)
+
+
+def best_of_batches(
+    batches, frequencies, min_frequencies: np.ndarray = None
+) -> Iterator[Tuple[slice, np.ndarray, np.ndarray, np.ndarray]]:
+    """ the best frequency of batches of (slice of stars, periodogram) in which higher values are better """
+    for stars, power in batches:
+        if min_frequencies is not None:
+            power[frequencies[np.newaxis, :] < min_frequencies[stars, np.newaxis]] = 0
+        argmax = np.argmax(power, axis=1)
+        best_power = power[np.arange(len(argmax)), argmax]
+        best_frequency = frequencies[argmax]
+        no_peak = ~(best_power > 0)
+        best_frequency[no_peak] = np.nan
+        best_power[no_peak] = np.nan
+        yield stars, best_frequency, best_power, power
+
+
+def best_frequencies(
+    t, mags, errs, frequencies, min_frequencies: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ the frequency with the highest power for every star, and that power. See search_frequencies """
+    nr_stars = np.asarray(mags).reshape(len(t), -1).shape[1]
+    best_power = np.full(nr_stars, np.nan)
+    best_frequency = np.full(nr_stars, np.nan)
+    if len(frequencies) == 0:
+        return best_frequency, best_power
+    for stars, frequency, power, _ in search_frequencies(t, mags, errs, frequencies, min_frequencies):
+        best_frequency[stars] = frequency
+        best_power[stars] = power
+    return best_frequency, best_power
+
+
+def baseline_min_frequencies(t, mags, min_period: float = 0.01) -> np.ndarray:
+    """
+    1 / baseline of the observations of every star. Stars with a baseline shorter than min_period or without
+    observations get infinity, so no frequency is searched for them
+    """
+    t = np.asarray(t, dtype=float)
+    observed = ~np.isnan(np.asarray(mags, dtype=float).reshape(len(t), -1))
+    t_observed = np.where(observed, t[:, np.newaxis], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        min_frequencies = 1.0 / (np.nanmax(t_observed, axis=0) - np.nanmin(t_observed, axis=0))
+    min_frequencies[~(min_frequencies < 1.0 / min_period)] = np.inf
+    return min_frequencies
+
+
+def best_periods(
+    t, mags, errs, min_period: float = 0.01, max_period: float = None, oversampling: int = 5,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    best Lomb-Scargle period and its power for every column of mags, on a grid covering all stars.
+    Without max_period, the period of every star is limited to the baseline of its own observations
+    """
+    t = np.asarray(t, dtype=float)
+    frequencies = get_frequency_grid(t, min_period, max_period, oversampling)
+    min_frequencies = None
+    if max_period is None:
+        min_frequencies = baseline_min_frequencies(t, mags, min_period)
+    logging.info(
+        f"Batch Lomb-Scargle of {np.asarray(mags).reshape(len(t), -1).shape[1]} stars, "
+        f"{len(t)} frames and {len(frequencies)} frequencies"
+    )
+    frequency, power = best_frequencies(t, mags, errs, frequencies, min_frequencies)
+    return 1.0 / frequency, power
@@ -1,47 +1,29 @@
-from astropy.io import fits
-from functools import partial
-import glob
 import logging
-import multiprocessing as mp
-import tqdm
+from typing import Dict
+import numpy as np
+from fits_index import FitsIndex
 
 # TODO all C's need to be changed into CV
 
 # read the filter value for each fits file, to be used in aavso reporting
 
 
-def read_filters(files=None, inputdir: str = None):
-    if inputdir is None:
-        inputdir = settings.convfitsdir
-    if files is None:
-        files = glob.glob(inputdir + "*.fts")
-    logging.info(f"Reading filters for {len(files)} files...")
-    pool = mp.Pool(init.nr_threads * 2, maxtasksperchild=100)
-    func = partial(read_fits_header)
-    result = {}
-    logging.debug(f"files: {files}")
-    for filter_tuple in tqdm.tqdm(
-        pool.imap_unordered(func, files, 5), total=len(files)
-    ):
-        result[filter_tuple[0]] = filter_tuple[1]
+def read_filters(inputdir: str, nr_threads=None, index_file=None) -> Dict[float, str]:
+    """ the filter of every fits file in inputdir by JD, from its FitsIndex (kept in index_file if given) """
+    with FitsIndex.of_fitsdir(inputdir, nr_threads, index_file=index_file) as index:
+        result = index.get_filters()
     logging.debug(f"read_filters result: {result}")
     return result
 
 
-def read_fits_header(file):
-    fts = fits.open(file)
-    jd = fts[0].header["JD"]
-    result_filter = fts[0].header["FILTER"]
-    return jd, result_filter.strip()
+def lookup_filters(inputdir: str, jds, index_file=None) -> np.ndarray:
+    """ the filter of the fits file in inputdir closest to every jd, None if no file is close """
+    with FitsIndex.of_fitsdir(inputdir, index_file=index_file) as index:
+        return index.lookup_filters(jds)
 
 
 if __name__ == "__main__":
-    print("not implemented yet")
-    # init_loader.meta_init('./current/')
-    # # global init
-    # init = init_loader.init
-    # settings = init_loader.settings
-    # logger = logging.getLogger()
-    # logger.setLevel(logging.DEBUG)
-    # logging.basicConfig(format="%(asctime)s %(name)s: %(levelname)s %(message)s")
-    # result = read_filters()
+    import sys
+
+    logging.basicConfig(format="%(asctime)s %(name)s: %(levelname)s %(message)s", level=logging.INFO)
+    print(read_filters(sys.argv[1]))
@@ -7,11 +7,11 @@ import re
 import glob
 import logging
 from pathlib import Path
-from astropy.io import fits
 from astropy.wcs import WCS
 from collections import namedtuple
 
 import do_calibration
+import fits_frame
 import utils
 from utils import StarDict
 from star_description import StarDescription
@@ -36,6 +36,16 @@ def read_lightcurve_vast(starpath: str):
     )
 
 
+# JD (as string), Vrel and err of a VaST lightcurve as numpy arrays
+def read_lightcurve_arrays(starpath: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    df = read_lightcurve_vast(starpath)
+    return (
+        df["JD"].to_numpy(),
+        df["Vrel"].to_numpy(dtype=float),
+        df["err"].to_numpy(dtype=float),
+    )
+
+
 def read_lightcurve_ids(star_ids: List[int], stardict: StarDict):
     result = []
     for star_id in star_ids:
@@ -141,14 +151,15 @@ def read_magdict_for_star(vastdir, star_id):
 
 
 #  blank_data is false if no background needs to be plotted, in that case all zeros are used as data
+#  see fits_frame for reads in float32, of sections or downsampled
 def get_fits_data(
-    fits_file: str, blank_data: bool = False
+    fits_file: str, blank_data: bool = False, dtype=float
 ) -> Tuple[List[float], float, float]:
-    hdulist = fits.open(fits_file)
-    data = hdulist[0].data.astype(float)
-    shapex, shapey = hdulist[0].shape
     if blank_data:
-        data = np.zeros(data.shape)
+        shapex, shapey = fits_frame.read_shape(fits_file)
+        return np.zeros((shapex, shapey), dtype=dtype), shapex, shapey
+    data = fits_frame.read_data(fits_file, dtype)
+    shapex, shapey = data.shape
     return data, shapex, shapey
 
 
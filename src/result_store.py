@@ -0,0 +1,93 @@
+"""
+The computed results of every star of a run: the cleaned, calibrated lightcurve, the period and epoch, and the
+dict which is also written as the star's toml file. The compute stage of do_charts_vast.run writes it, the render
+stage, the selected files, the stats and the site read it, so nothing is computed twice and a failing plot doesn't
+lose the results.
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+import toml
+from pandas import DataFrame
+
+# the store of a run is this directory inside the resultdir
+STORE_DIR = "result_store"
+
+
+def _plain(value):
+    """ numpy scalars to python floats, toml would write them as strings """
+    return None if value is None else float(value)
+
+
+class ResultStore:
+    def __init__(self, storedir):
+        self.storedir = Path(storedir)
+        self.storedir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def of_resultdir(resultdir) -> "ResultStore":
+        return ResultStore(Path(resultdir, STORE_DIR))
+
+    def _path(self, star_id: int) -> Path:
+        return Path(self.storedir, f"{star_id}.npz")
+
+    def __contains__(self, star_id: int):
+        return self._path(star_id).exists()
+
+    def put(self, star_id: int, df: DataFrame, period, epoch, info: dict):
+        """ stores the lightcurve (JD, floatJD, realV, realErr), the period (see do_charts_vast.Period), epoch and info """
+        computed = {
+            "period": _plain(period.period),
+            "origin": period.origin,
+            "err": _plain(period.err),
+            "epoch": _plain(epoch),
+        }
+        # toml leaves out the None values, get_computed gives them back as None
+        text = toml.dumps({"computed": {k: v for k, v in computed.items() if v is not None}, "info": info})
+        path = self._path(star_id)
+        tmp_path = path.with_name(f"{star_id}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fp:
+            np.savez(
+                fp,
+                JD=np.asarray(df["JD"], dtype=str),
+                floatJD=df["floatJD"].to_numpy(dtype=float),
+                realV=df["realV"].to_numpy(dtype=float),
+                realErr=df["realErr"].to_numpy(dtype=float),
+                toml=np.array(text),
+            )
+        os.replace(tmp_path, path)
+
+    def _load_toml(self, star_id: int) -> Optional[dict]:
+        path = self._path(star_id)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as data:
+                return toml.loads(str(data["toml"]))
+        except (OSError, ValueError, KeyError) as ex:
+            logging.warning(f"Ignoring unreadable result of star {star_id} in {path}: {ex}")
+            return None
+
+    def get_info(self, star_id: int) -> Optional[dict]:
+        """ the dict which is written as the toml file of the star, or None """
+        loaded = self._load_toml(star_id)
+        return None if loaded is None else loaded["info"]
+
+    def get_computed(self, star_id: int) -> Optional[dict]:
+        """ dict with period, origin, err and epoch (each possibly None), or None """
+        loaded = self._load_toml(star_id)
+        if loaded is None:
+            return None
+        computed = loaded["computed"]
+        return {key: computed.get(key) for key in ("period", "origin", "err", "epoch")}
+
+    def get_lightcurve(self, star_id: int) -> Optional[DataFrame]:
+        path = self._path(star_id)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return pd.DataFrame({key: data[key] for key in ("JD", "floatJD", "realV", "realErr")})
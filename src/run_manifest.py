@@ -0,0 +1,70 @@
+"""
+The per-star completion manifest of one charting pass (e.g. the vsx stars). For every finished star it records a
+hash of its inputs and the files it produced, so a resumed run (--resume) can skip the stars which were completed
+before and whose inputs did not change.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+import numpy as np
+import toml
+from pandas import DataFrame
+
+# the manifests of a run are in this directory inside the resultdir
+MANIFEST_DIR = "manifests"
+
+
+class RunManifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                self.entries = toml.load(self.path)
+            except (OSError, ValueError) as ex:
+                logging.warning(f"Ignoring unreadable manifest {self.path}, all stars will be processed: {ex}")
+
+    @staticmethod
+    def of_resultdir(resultdir, name: str) -> "RunManifest":
+        return RunManifest(Path(resultdir, MANIFEST_DIR, f"{name}.toml"))
+
+    @staticmethod
+    def key(df: DataFrame, *params) -> str:
+        """ hash of the calibrated lightcurve of a star (floatJD, realV, realErr, can be None) and the repr of params """
+        sha = hashlib.sha1()
+        for column in ("floatJD", "realV", "realErr") if df is not None else ():
+            sha.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).tobytes())
+        sha.update(repr(params).encode())
+        return sha.hexdigest()
+
+    def is_done(self, star_id: int, key: str) -> bool:
+        """ the star was completed with the same key and all of its outputs still exist """
+        entry = self.entries.get(str(star_id))
+        if entry is None or entry["key"] != key:
+            return False
+        return all(Path(output).exists() for output in entry["outputs"].values())
+
+    def get_outputs(self, star_id: int) -> Optional[dict]:
+        entry = self.entries.get(str(star_id))
+        return None if entry is None else entry["outputs"]
+
+    def mark_done(self, star_id: int, key: str, outputs: dict):
+        self.entries[str(star_id)] = {
+            "key": key,
+            "outputs": {name: str(output) for name, output in outputs.items() if output is not None},
+        }
+
+    def clear(self):
+        self.entries = {}
+        self.flush()
+
+    def flush(self):
+        """ writes the manifest, a crash during the write leaves the previous version """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as fp:
+            toml.dump(self.entries, fp)
+        os.replace(tmp_path, self.path)
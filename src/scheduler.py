@@ -0,0 +1,209 @@
+"""
+Orders and batches per-star work for a process pool. Stars with many observations take much longer than others, fed
+in list order they often end up last and leave one process working while the others wait. The most expensive stars
+are dispatched first, cheap stars are batched so they don't cost a round trip each, and priority stars (e.g. the
+selected stars, which are needed for the site) go before all others.
+
+With a TaskBudget every item gets a wall-clock and memory budget. The worker of an item which exceeds it is killed,
+the item is recorded as a TaskFailure and the other items of its batch are dispatched again. With a RecyclingPool the
+same happens when a worker dies by itself, e.g. by the OOM killer.
+"""
+
+import itertools
+import logging
+import os
+import signal
+import time
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Manager
+from typing import Callable, Iterable, List, Sequence
+import worker_pool
+
+# cost of a product of one star relative to the compute stage (period, cleaning, toml), per observation
+PRODUCT_COSTS = {"compute": 1.0, "bootstrap": 5.0, "phase": 1.0, "light": 3.0, "light_raw": 1.0, "aavso": 20.0}
+# the part of the cost of a product which does not depend on the number of observations, in observations
+STAR_OVERHEAD_OBS = 500
+# the work of one pool is cut in about this many batches per process, the last ones are short
+BATCHES_PER_WORKER = 4
+# seconds between two checks of the budgets of the running items
+BUDGET_POLL_SECONDS = 0.2
+# with a budget, at most this many batches per worker are dispatched and not yet done
+PENDING_BATCHES_PER_WORKER = 2
+# a batch whose worker died fails if it still has no result this many seconds later
+WORKER_GONE_SECONDS = 2.0
+
+# the max seconds and resident memory (MB) of one item, None is unlimited
+TaskBudget = namedtuple("TaskBudget", "seconds max_rss_mb", defaults=(None, None))
+# an item whose worker was killed because it exceeded its budget
+TaskFailure = namedtuple("TaskFailure", "item_id stage reason")
+
+
+def estimate_cost(nr_obs: int, products: Iterable[str]) -> float:
+    """ the relative cost of making products (keys of PRODUCT_COSTS) of a star with nr_obs observations """
+    return (max(nr_obs or 0, 0) + STAR_OVERHEAD_OBS) * sum(PRODUCT_COSTS[product] for product in products)
+
+
+def schedule(items: Sequence, costs: Sequence[float], priorities: Sequence[bool], nr_workers: int) -> List[List]:
+    """
+    Batches of items in the order they should be dispatched: the priority items first, in each group the most
+    expensive first. Items which cost less than a share of the total work are combined into batches of about that
+    share, expensive items get a batch of their own
+    """
+    if len(items) == 0:
+        return []
+    target = sum(costs) / (max(nr_workers, 1) * BATCHES_PER_WORKER)
+    batches = []
+    for priority in (True, False):
+        group = sorted(
+            (index for index in range(len(items)) if bool(priorities[index]) == priority),
+            key=lambda index: costs[index],
+            reverse=True,
+        )
+        batch, batch_cost = [], 0.0
+        for index in group:
+            batch.append(items[index])
+            batch_cost += costs[index]
+            if batch_cost >= target:
+                batches.append(batch)
+                batch, batch_cost = [], 0.0
+        if batch:
+            batches.append(batch)
+    logging.debug(f"Scheduled {len(items)} items in {len(batches)} batches, target cost per batch {target:.0f}")
+    return batches
+
+
+def _run_batch(func: Callable, batch: List) -> List:
+    return [func(item) for item in batch]
+
+
+def _prepared(prepare: Callable, batches: Iterable[List]):
+    """ the batches with prepare applied to their items, one batch at a time """
+    for batch in batches:
+        yield batch if prepare is None else [prepare(item) for item in batch]
+
+
+def _run_watched_batch(func: Callable, running, batch_nr: int, batch: List) -> List:
+    """ runs a batch of (item_id, item), running tells the pool which item this worker is busy with since when """
+    pid = os.getpid()
+    results = []
+    for index, (_, item) in enumerate(batch):
+        running[pid] = (batch_nr, index, time.time())
+        results.append(func(item))
+    running.pop(pid, None)
+    return results
+
+
+def imap_scheduled(
+    pool,
+    func: Callable,
+    items: Sequence,
+    costs,
+    priorities,
+    nr_workers: int,
+    budget: TaskBudget = None,
+    item_ids: Sequence = None,
+    stage: str = "task",
+    failures: List[TaskFailure] = None,
+    prepare: Callable = None,
+):
+    """
+    pool.imap_unordered(func, items) in the order and batches of schedule, yields the result of every item. With a
+    budget, an item which exceeds it yields None and is appended to failures, identified by its item_id and stage.
+    With prepare, func gets prepare(item), which is made in this process when the batch of the item is dispatched. So
+    large work items (e.g. a lightcurve) are not all in memory at once
+    """
+    if budget is None or (budget.seconds is None and budget.max_rss_mb is None):
+        # the pool takes the batches as fast as its workers read them
+        batches = _prepared(prepare, schedule(items, costs, priorities, nr_workers))
+        for results in pool.imap_unordered(partial(_run_batch, func), batches):
+            yield from results
+        return
+    item_ids = range(len(items)) if item_ids is None else item_ids
+    batches = schedule(list(zip(item_ids, items)), costs, priorities, nr_workers)
+    failures = [] if failures is None else failures
+    with Manager() as manager:
+        running = manager.dict()
+        batch_nrs = itertools.count()
+        pending = {}
+
+        def submit(batch):
+            batch_nr = next(batch_nrs)
+            work = [(item_id, item if prepare is None else prepare(item)) for item_id, item in batch]
+            pending[batch_nr] = (pool.apply_async(_run_watched_batch, (func, running, batch_nr, work)), batch)
+
+        def top_up():
+            """ dispatches the next batches, apply_async keeps every submitted batch until a worker takes it """
+            for batch in itertools.islice(queued, max(PENDING_BATCHES_PER_WORKER * nr_workers - len(pending), 0)):
+                submit(batch)
+
+        def fail(batch_nr, index, pid, reason):
+            """ the item index of batch_nr failed, its worker is gone: the other items are dispatched again """
+            _, batch = pending.pop(batch_nr)
+            batch_workers.pop(batch_nr, None)
+            gone.pop(batch_nr, None)
+            item_id = batch[index][0]
+            logging.error(f"The {stage} of {item_id} in worker {pid} failed: {reason}")
+            failures.append(TaskFailure(item_id, stage, reason))
+            # the results of the batch are lost with its worker, the others are done again
+            rest = batch[:index] + batch[index + 1 :]
+            if rest:
+                submit(rest)
+
+        # the worker pid and item index of every started batch, as last seen in running
+        batch_workers = {}
+        # since when the worker of a pending batch is gone
+        gone = {}
+        queued = iter(batches)
+        top_up()
+        while pending:
+            done = [batch_nr for batch_nr, (result, _) in pending.items() if result.ready()]
+            for batch_nr in done:
+                result, _ = pending.pop(batch_nr)
+                batch_workers.pop(batch_nr, None)
+                gone.pop(batch_nr, None)
+                yield from result.get()
+            now = time.time()
+            snapshot = running.items()
+            for pid, (batch_nr, index, _) in snapshot:
+                if batch_nr in pending:
+                    batch_workers[batch_nr] = pid, index
+            for pid, (batch_nr, index, start) in snapshot:
+                # the batch may have finished since the sweep, and its worker may have started another one
+                if batch_nr not in pending or pending[batch_nr][0].ready():
+                    continue
+                reason = _exceeded(budget, pid, now - start)
+                if reason is None or running.get(pid) != (batch_nr, index, start):
+                    continue
+                running.pop(pid, None)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                fail(batch_nr, index, pid, reason)
+                yield None
+            exitcodes = pool.worker_exitcodes() if isinstance(pool, worker_pool.RecyclingPool) else {}
+            for batch_nr, (pid, index) in list(batch_workers.items()):
+                # a recycled worker exits with 0, also before the pool has handled its last result
+                if batch_nr not in pending or pending[batch_nr][0].ready() or not exitcodes.get(pid):
+                    gone.pop(batch_nr, None)
+                    continue
+                # a pool never completes the result of a worker which died, the batch would be pending forever
+                if now - gone.setdefault(batch_nr, now) > WORKER_GONE_SECONDS and not pending[batch_nr][0].ready():
+                    running.pop(pid, None)
+                    fail(batch_nr, index, pid, f"the worker died (exitcode {exitcodes[pid]})")
+                    yield None
+            top_up()
+            if not done:
+                time.sleep(BUDGET_POLL_SECONDS)
+
+
+def _exceeded(budget: TaskBudget, pid: int, seconds: float):
+    """ why the item running in worker pid for seconds exceeds the budget, or None """
+    if budget.seconds is not None and seconds > budget.seconds:
+        return f"took more than {budget.seconds:g} s"
+    if budget.max_rss_mb is not None:
+        rss = worker_pool.process_rss_mb(pid)
+        if rss is not None and rss > budget.max_rss_mb:
+            return f"used {rss:.0f} MB, more than {budget.max_rss_mb:g} MB"
+    return None
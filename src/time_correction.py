@@ -0,0 +1,55 @@
+"""
+Heliocentric and barycentric times of the frames of a field. VSX epochs are mostly HJD, the VaST lightcurves are in
+JD. A TimeCorrection computes the position of the observer relative to the Sun or the barycentre for all frames in
+one transform. The light travel time of a star is the projection of these positions on its direction, a matrix
+product, so every star gets its exact correction at no cost.
+"""
+
+import logging
+import numpy as np
+from astropy import constants as const
+from astropy import units as u
+from astropy.coordinates import SkyCoord, EarthLocation, GCRS, HCRS, ICRS, solar_system_ephemeris
+from astropy.time import Time
+
+# JD as measured, HJD (heliocentric, same time scale as the JD) and BJD (barycentric, TDB)
+TIME_REFERENCES = ("JD", "HJD", "BJD")
+KINDS = {"HJD": "heliocentric", "BJD": "barycentric"}
+GEOCENTRE = EarthLocation.from_geocentric(0, 0, 0, unit=u.m)
+
+
+class TimeCorrection:
+    """ the HJD or BJD of frames as seen from location (the geocentre by default, the site changes it < 0.03 s) """
+
+    def __init__(self, jds, time_reference: str, location: EarthLocation = None):
+        assert time_reference in KINDS, f"No correction for time reference {time_reference}"
+        self.time_reference = time_reference
+        self.jds = np.unique(np.asarray(jds, dtype=float))
+        times = Time(self.jds, format="jd", scale="utc")
+        itrs = (GEOCENTRE if location is None else location).get_itrs(obstime=times)
+        with solar_system_ephemeris.set("builtin"):
+            if KINDS[time_reference] == "heliocentric":
+                position = itrs.transform_to(HCRS(obstime=times)).cartesian.xyz
+            else:
+                position = itrs.transform_to(GCRS(obstime=times)).transform_to(ICRS()).cartesian.xyz
+        # the observer in light-days, [index_of_frame] = x, y, z
+        self.positions = (position / const.c).to(u.day).value.T
+        # BJD is in TDB, HJD keeps the time scale of the JD
+        self.offsets = np.zeros(len(self.jds))
+        if time_reference == "BJD":
+            self.offsets = (times.tdb.jd1 - times.jd1) + (times.tdb.jd2 - times.jd2)
+        logging.debug(f"Calculated the {time_reference} corrections of {len(self.jds)} frames")
+
+    def correct(self, jds, coord: SkyCoord) -> np.ndarray:
+        """ the jds, which must be frames of this correction, in the time reference for a star at coord """
+        jds = np.asarray(jds, dtype=float)
+        if len(jds) == 0:
+            return jds
+        index = np.searchsorted(self.jds, jds).clip(max=len(self.jds) - 1)
+        assert np.all(self.jds[index] == jds), "Time correction of an unknown frame"
+        direction = coord.icrs.cartesian.xyz.value
+        direction = direction / np.linalg.norm(direction)
+        return jds + self.offsets[index] + self.positions[index] @ direction
+
+    def __repr__(self):
+        return f"TimeCorrection({self.time_reference}, {len(self.jds)} frames)"
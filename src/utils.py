@@ -6,10 +6,9 @@ import sys
 
 import numpy as np
 import star_description
+import worker_pool
 from star_description import StarDescription, StarMetaData
 from typing import List, Dict, Tuple
-import multiprocessing as mp
-from multiprocessing import cpu_count
 import re
 import logging
 from astropy.coordinates import SkyCoord
@@ -73,35 +72,46 @@ def catalog_filter(star: StarDescription, catalog_name):
 
 
 # filters a DataFrame with a floatJD column according to julian dates
+def jd_filter_mask(jds, jdfilter: List[float]) -> np.ndarray:
+    """
+    False for the julian dates strictly inside one of the ranges of jdfilter, a list of start/stop pairs:
+    [start1, stop1, start2, stop2, ...]. Without jdfilter everything is True
+    """
+    jds = np.asarray(jds, dtype=float)
+    mask = np.ones(len(jds), dtype=bool)
+    if jdfilter is None:
+        return mask
+    if len(jdfilter) % 2 != 0:
+        raise ValueError(f"The jdfilter needs pairs of start and stop JD's, got {jdfilter}")
+    for start, stop in np.reshape(np.asarray(jdfilter, dtype=float), (-1, 2)):
+        mask &= (jds <= start) | (jds >= stop)
+    return mask
+
+
 def jd_filter_df(df: DataFrame, jdfilter: List[float]):
-    """ takes a list of 2 julian dates and uses these so the region between them is not used. The DataFrame needs a column named 'floatJD' """
+    """ takes a list of julian date pairs and uses these so the regions between them are not used. The DataFrame needs a column named 'floatJD' """
     if jdfilter is not None:
         logging.debug(
             f"Before jd_filter_df(): jdfilter is: {jdfilter}, len is {len(df)}"
         )
-        df = df[(df.floatJD <= jdfilter[0]) | (df.floatJD >= jdfilter[1])]
+        df = df[jd_filter_mask(df.floatJD, jdfilter)]
         logging.debug(f"After jd_filter_df(): len is {len(df)}")
         if len(df) < 2:
             logging.warning(
                 f"Applying the jdfilter caused the lightcurve to contain less than 2 points! "
-                f"Everything between {jdfilter[0]} and {jdfilter[1]} is thrown away"
+                f"Everything inside of {jdfilter} is thrown away"
             )
     return df
 
 
 def jd_filter_array(jds, values, jdfilter: List[float]):
-    """ takes a JD array and a value array (mags) together with a min/max jdfilter list """
+    """ takes a JD array and a value array (mags) together with a jdfilter list of start/stop pairs """
     if jdfilter is not None:
         logging.debug(
             f"jd_filter_array(): jdfilter is: {jdfilter}, of type {type(jdfilter)}"
         )
-        return zip(
-            *filter(
-                lambda jdsvaluezip: jdsvaluezip[0] <= jdfilter[0]
-                or jdsvaluezip[0] >= jdfilter[1],
-                zip(jds, values),
-            )
-        )
+        mask = jd_filter_mask(jds, jdfilter)
+        return np.asarray(jds)[mask], np.asarray(values)[mask]
     else:
         return jds, values
 
@@ -150,8 +160,9 @@ def get_lesve_coords(coord: SkyCoord):
     )
 
 
-def get_pool(processes=cpu_count() - 1, maxtasksperchild=10):
-    return mp.Pool(processes, maxtasksperchild=maxtasksperchild)
+def get_pool(processes=None, max_rss_mb=None):
+    """ a pool of warm workers, see worker_pool.get_pool """
+    return worker_pool.get_pool(processes, max_rss_mb)
 
 
 def add_metadata(stars: List[star_description.StarDescription], metadata: StarMetaData):
@@ -0,0 +1,136 @@
+"""
+Process pools with warm workers. The heavy modules are imported once per worker (or once in the forkserver) and a
+worker lives until its resident memory passes a threshold, instead of being replaced every few tasks and paying
+for the imports, the matplotlib state and the caches again.
+"""
+
+import importlib
+import logging
+import multiprocessing as mp
+import os
+import resource
+import sys
+import threading
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool, worker
+from typing import Dict, Optional
+
+# a worker is replaced after a task which leaves it with more resident memory than this
+MAX_WORKER_RSS_MB = 2048
+# imported in every worker before its first task, see preload
+PRELOAD_MODULES = ["numpy", "pandas", "matplotlib.pyplot", "astropy.coordinates", "astropy.time"]
+
+
+def process_rss_mb(pid) -> Optional[float]:
+    """ the resident memory of process pid in MB, or None if unknown (no /proc or no such process) """
+    try:
+        with open(f"/proc/{pid}/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def rss_mb() -> float:
+    """ the resident memory of this process in MB. Where /proc is missing, the peak resident memory """
+    rss = process_rss_mb("self")
+    if rss is not None:
+        return rss
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def available_memory_mb() -> Optional[float]:
+    """ the memory available for new processes in MB, or None if unknown """
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 2 ** 10
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def auto_threads(max_rss_mb: float = MAX_WORKER_RSS_MB) -> int:
+    """ one process per core but one, and no more than fit in the available memory at max_rss_mb each """
+    threads = max(cpu_count() - 1, 1)
+    available = available_memory_mb()
+    if available is not None:
+        threads = min(threads, max(int(available // max_rss_mb), 1))
+    logging.debug(f"Automatic number of threads: {threads}, available memory: {available} MB")
+    return threads
+
+
+def preload(modules=PRELOAD_MODULES, initializer=None, initargs=()):
+    """ the initializer of the workers: imports modules, then calls initializer """
+    for module in modules:
+        importlib.import_module(module)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class _RecyclingQueue:
+    """ the result queue of a worker, which stops the worker after a result if it uses too much memory """
+
+    def __init__(self, queue, max_rss_mb):
+        self._queue = queue
+        self._max_rss_mb = max_rss_mb
+
+    def put(self, obj):
+        self._queue.put(obj)
+        rss = rss_mb()
+        if rss > self._max_rss_mb:
+            logging.debug(f"Recycling worker {os.getpid()}, resident memory {rss:.0f} MB")
+            # not an Exception, so it leaves the worker loop. The pool starts a new worker
+            raise SystemExit(0)
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+
+def _recycling_worker(inqueue, outqueue, initializer, initargs, maxtasks, wrap_exception, max_rss_mb):
+    worker(inqueue, _RecyclingQueue(outqueue, max_rss_mb), initializer, initargs, maxtasks, wrap_exception)
+
+
+class RecyclingPool(Pool):
+    """ a multiprocessing Pool which replaces a worker when its resident memory passes max_rss_mb """
+
+    def __init__(self, processes=None, initializer=None, initargs=(), max_rss_mb=MAX_WORKER_RSS_MB, context=None):
+        self._max_rss_mb = max_rss_mb
+        # the workers started by this pool, except those which exited cleanly. Appended by the pool's own thread
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        super().__init__(processes, initializer, initargs, None, context)
+
+    def Process(self, ctx, *args, **kwds):
+        kwds["target"] = _recycling_worker
+        kwds["args"] = (*kwds["args"], self._max_rss_mb)
+        process = ctx.Process(*args, **kwds)
+        with self._workers_lock:
+            self._workers.append(process)
+        return process
+
+    def worker_exitcodes(self) -> Dict[int, Optional[int]]:
+        """
+        The exitcode of every started worker by pid, None while it runs. Workers which exited with 0 (e.g. recycled
+        ones) are left out, a non-zero exitcode means the worker died, negative by that signal
+        """
+        with self._workers_lock:
+            self._workers = [process for process in self._workers if process.exitcode != 0]
+            return {process.pid: process.exitcode for process in self._workers if process.pid is not None}
+
+
+def get_pool(processes=None, max_rss_mb=None, initializer=None, initargs=()) -> RecyclingPool:
+    """
+    A pool of warm workers, see preload and RecyclingPool. processes and max_rss_mb default to auto_threads and
+    MAX_WORKER_RSS_MB
+    """
+    max_rss_mb = MAX_WORKER_RSS_MB if max_rss_mb is None else max_rss_mb
+    processes = auto_threads(max_rss_mb) if processes is None else processes
+    if mp.get_start_method(allow_none=True) == "forkserver":
+        mp.set_forkserver_preload(PRELOAD_MODULES)
+    return RecyclingPool(processes, preload, (PRELOAD_MODULES, initializer, initargs), max_rss_mb)
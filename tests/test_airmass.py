@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord, EarthLocation
+import airmass
+import do_aavso_report
+
+location = EarthLocation(lat="-22 57 13", lon="-68 10 43", height=2500 * u.m)
+centre = SkyCoord(150, -40, unit="deg")
+# the field is up between about .55 and .85
+jds = 2458000.5 + np.linspace(0.55, 0.85, 50)
+
+
+def exact(coord, jds):
+    return np.array([do_aavso_report.calculate_airmass(coord, location, jd).value for jd in jds])
+
+
+class TestAirmass(unittest.TestCase):
+    def test_centre(self):
+        table = airmass.AirmassTable(centre, location, jds)
+        self.assertEqual(len(jds), len(table))
+        np.testing.assert_allclose(exact(centre, jds[::7]), table.get_airmass(jds[::7]), rtol=1e-9)
+
+    def test_offset_star(self):
+        table = airmass.AirmassTable(centre, location, jds)
+        star = SkyCoord(150.8, -39.5, unit="deg")
+        np.testing.assert_allclose(exact(star, jds[::7]), table.get_airmass(jds[::7], star), atol=1e-3)
+        far = SkyCoord(160, -40, unit="deg")
+        np.testing.assert_allclose(exact(far, jds[::7]), table.get_airmass(jds[::7], far), rtol=1e-9)
+
+    def test_extend(self):
+        table = airmass.AirmassTable(centre, location, jds[:10])
+        table.extend(jds[5:20])
+        self.assertEqual(20, len(table))
+        self.assertTrue(np.all(np.diff(table.jds) > 0))
+        # unknown JDs are added on lookup
+        np.testing.assert_allclose(exact(centre, jds[30:32]), table.get_airmass(jds[30:32]), rtol=1e-9)
+        self.assertEqual(22, len(table))
+
+    def test_coords_centre(self):
+        mean = airmass.coords_centre([SkyCoord(359.5, -1, unit="deg"), SkyCoord(0.5, 1, unit="deg")])
+        self.assertLess(mean.separation(SkyCoord(0, 0, unit="deg")).arcsec, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
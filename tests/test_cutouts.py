@@ -0,0 +1,95 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from astropy.io import fits
+from scipy import ndimage
+import cutouts
+from reading import ImageRecord
+
+
+class TestCutouts(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.data = np.random.default_rng(1).integers(0, 1000, (120, 100)).astype(np.int16)
+        fits.PrimaryHDU(self.data).writeto(Path(self.tempdir.name, "frame.fit"))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_extract_cutout(self):
+        stamp = cutouts.extract_cutout(ImageRecord(1.0, 40, 60, "frame.fit", 0.0), self.tempdir.name, 10)
+        self.assertEqual(np.float32, stamp.dtype)
+        np.testing.assert_array_equal(self.data[55:65, 35:45], stamp)
+        # the full frame rotated, cropped around the same pixel
+        rotated = cutouts.extract_cutout(ImageRecord(1.0, 40, 60, "frame.fit", 90.0), self.tempdir.name, 10)
+        expected = cutouts.crop_center(ndimage.rotate(self.data[30:90, 10:70].astype(np.float32), 90.0), 10, 10)
+        np.testing.assert_allclose(expected, rotated)
+
+    def test_edge(self):
+        stamp = cutouts.extract_cutout(ImageRecord(1.0, 2, 3, "frame.fit", 0.0), self.tempdir.name, 10)
+        self.assertEqual((10, 10), stamp.shape)
+        np.testing.assert_array_equal(self.data[0:8, 0:7], stamp[2:, 3:])
+
+    def test_cube(self):
+        records = [ImageRecord(2.0 + nr, 40 + nr, 60, "frame.fit", 0.0) for nr in range(3)]
+        path = Path(self.tempdir.name, "cube.npy")
+        cutouts.cutout_cube(records, self.tempdir.name, 8, path, nr_threads=2)
+        cube, jds = cutouts.load_cube(path)
+        self.assertEqual((3, 8, 8), cube.shape)
+        np.testing.assert_array_equal([2.0, 3.0, 4.0], jds)
+        np.testing.assert_array_equal(self.data[56:64, 38:46], cube[2])
+
+    def test_cubes_one_sweep(self):
+        fits.PrimaryHDU(self.data[::-1]).writeto(Path(self.tempdir.name, "frame2.fit"))
+        first = [ImageRecord(1.0, 40, 60, "frame.fit", 0.0), ImageRecord(2.0, 40, 60, "frame2.fit", 0.0)]
+        second = [ImageRecord(2.0, 20, 30, "frame2.fit", 0.0)]
+        paths = [Path(self.tempdir.name, "first.npy"), Path(self.tempdir.name, "second.npy")]
+        cutouts.cutout_cubes([first, second], paths, self.tempdir.name, 10, nr_threads=2)
+        cube, jds = cutouts.load_cube(paths[0])
+        np.testing.assert_array_equal([1.0, 2.0], jds)
+        np.testing.assert_array_equal(self.data[55:65, 35:45], cube[0])
+        np.testing.assert_array_equal(self.data[::-1][55:65, 35:45], cube[1])
+        cube, jds = cutouts.load_cube(paths[1])
+        np.testing.assert_array_equal(self.data[::-1][25:35, 15:25], cube[0])
+
+    def test_movie_frames(self):
+        cube = np.array([[[0, 2500, 5000], [-10, 1250, 0], [0, 0, 0]]], dtype=np.float32)
+        frame = next(cutouts.movie_frames(cube, scale=3))
+        self.assertEqual((10, 10), frame.shape)
+        self.assertEqual(np.uint8, frame.dtype)
+        # origin lower left, clipped to vmin..vmax, the odd sides padded
+        np.testing.assert_array_equal([0, 0, 0, 255, 255, 255, 255, 255, 255, 255], frame[-1])
+        np.testing.assert_array_equal([0, 127, 0], frame[3, [0, 3, 6]])
+
+    def test_ffmpeg(self):
+        command = cutouts.ffmpeg_command(Path("movie.mp4"), 720, 480, 25, Path("movie.srt"))
+        self.assertEqual(["ffmpeg", "-y"], command[:2])
+        self.assertIn("720x480", command)
+        # the frames on stdin, then the subtitles
+        self.assertEqual("-", command[command.index("-i") + 1])
+        self.assertEqual("-i", command[command.index("movie.srt") - 1])
+        self.assertEqual("movie.mp4", command[-1])
+        srt = Path(self.tempdir.name, "movie.srt")
+        cutouts.write_subtitles(srt, [2458000.5, 2458000.6], 4)
+        self.assertEqual(
+            "1\n00:00:00,000 --> 00:00:00,250\nJD: 2458000.5\n\n2\n00:00:00,250 --> 00:00:00,500\nJD: 2458000.6\n\n",
+            srt.read_text(),
+        )
+
+    def test_stamp_sheet(self):
+        cube = np.arange(10 * 4 * 4, dtype=np.float32).reshape(10, 4, 4) * 10
+        sheet, indexes = cutouts.stamp_sheet(cube, columns=3, rows=2, vmin=0, vmax=1600)
+        np.testing.assert_array_equal([0, 2, 4, 5, 7, 9], indexes)
+        # a black line between the stamps
+        self.assertEqual((9, 14), sheet.shape)
+        np.testing.assert_array_equal(next(cutouts.movie_frames(cube[5:6], 0, 1600)), sheet[5:9, 0:4])
+        self.assertEqual(0, sheet[4].max())
+        path = Path(self.tempdir.name, "sheet.png")
+        cutouts.write_stamp_sheet(cube, np.arange(10) + 2458000.5, path)
+        self.assertTrue(path.exists())
+        self.assertEqual(len(np.loadtxt(path.with_suffix(".txt"))), min(10, cutouts.SHEET_COLUMNS * cutouts.SHEET_ROWS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ from astropy.coordinates import SkyCoord
 import logging
 import main_vast
 import os
+import tempfile
 from pathlib import PurePath
 import logging
 import reading
@@ -18,6 +19,7 @@ import numpy as np
 from pandas import DataFrame
 import pandas as pd
 from timeit import default_timer as timer
+import io
 
 logging.getLogger().setLevel(logging.DEBUG)
 logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
@@ -85,9 +87,11 @@ class TestDoAAVSO(unittest.TestCase):
             "chart": "na",
             "notes": "na",
         }
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
         start = timer()
         try:
-            aavso_out_txt = "./tests/data/aavso_out.txt"
+            aavso_out_txt = os.path.join(tempdir.name, "aavso_out.txt")
             with open(aavso_out_txt, "w") as fp:
                 writer = aavso.ExtendedFormatWriter(
                     fp,
@@ -146,6 +150,37 @@ class TestDoAAVSO(unittest.TestCase):
         )
 
 
+    def test_chunk_filenames(self):
+        self.assertEqual(
+            [PurePath("aavso", "00001_ext.txt")],
+            [PurePath(x) for x in do_aavso_report.chunk_filenames("aavso", "00001", 10)],
+        )
+        self.assertEqual(
+            [PurePath("aavso", "00001_ext_1.txt"), PurePath("aavso", "00001_ext_2.txt")],
+            [PurePath(x) for x in do_aavso_report.chunk_filenames("aavso", "00001", 10, 6)],
+        )
+        self.assertEqual([], do_aavso_report.chunk_filenames("aavso", "00001", 0, 6))
+
+    def test_addrows(self):
+        rows = [
+            {"name": "Star_00001", "date": "2457236.66302", "magnitude": 12.0, "magnitude_error": 0.0114,
+             "filter": "V", "transformed": "NO", "magnitude_type": "STD", "check_name": "UCAC4 1",
+             "check_magnitude": "na", "airmass": 1.2345},
+            {"name": "Star_00001", "date": "2457236.67302", "magnitude": 12.25, "magnitude_error": 0.02,
+             "filter": "V", "transformed": "NO", "magnitude_type": "STD", "check_name": "UCAC4 1",
+             "check_magnitude": "42.200", "airmass": 1.3},
+        ]
+        expected, streamed = io.StringIO(), io.StringIO()
+        writer = aavso.ExtendedFormatWriter(expected, "RMH")
+        for row in rows:
+            writer.addrow(row)
+        writer.flush()
+        writer = aavso.ExtendedFormatWriter(streamed, "RMH")
+        writer.addrows(pd.DataFrame(rows[:1]))
+        writer.addrows({**rows[1], "magnitude": [12.25], "date": ["2457236.67302"]})
+        self.assertEqual(expected.getvalue(), streamed.getvalue())
+
+
 if __name__ == "__main__":
     logging.getLogger().setLevel(logging.INFO)
     logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
@@ -0,0 +1,68 @@
+import unittest
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+from astropy.wcs import WCS
+import do_charts_field
+from do_charts_field import Background
+from star_description import StarDescription
+
+
+def simple_wcs():
+    wcs = WCS(naxis=2)
+    wcs.wcs.crpix = [500, 400]
+    wcs.wcs.cdelt = [-0.0005, 0.0005]
+    wcs.wcs.crval = [100, 20]
+    wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    return wcs
+
+
+def star_at(local_id, wcs, x, y, label=""):
+    star = StarDescription(local_id=local_id, coords=wcs.pixel_to_world(x, y))
+    star.label = label
+    return star
+
+
+class TestDoChartsField(unittest.TestCase):
+    def test_rasterize(self):
+        background = Background(np.array([[0.0, 100.0], [100.0, 1000.0]]), 4, (9, 8))
+        raster = do_charts_field.rasterize(background, 5)
+        # 5 pixels of padding are 2 blocks, the first block starts 3 pixels before the frame
+        self.assertEqual((6, 6), raster.data.shape)
+        self.assertEqual(np.uint8, raster.data.dtype)
+        self.assertEqual((-3, (19, 18)), (raster.offset, raster.shape))
+        # white at 0, black from 5x the median (100) up
+        np.testing.assert_array_equal([[255, 204], [204, 0]], raster.data[2:4, 2:4])
+        self.assertIsNone(do_charts_field.rasterize(background._replace(data=None), 5).data)
+
+    def test_show_raster(self):
+        raster = do_charts_field.rasterize(Background(np.ones((100, 200)), 2, (200, 400)), 10)
+        fig = plt.figure()
+        do_charts_field.show_raster(raster, (100.2, 140.7, 50.0, 60.0))
+        image = plt.gca().get_images()[0]
+        # only the blocks under the window
+        self.assertEqual((6, 21), image.get_array().shape)
+        self.assertEqual((99.5, 141.5, 49.5, 61.5), tuple(image.get_extent()))
+        self.assertEqual((100.2, 140.7), plt.gca().get_xlim())
+        plt.close(fig)
+
+    def test_finder_chart(self):
+        wcs = simple_wcs()
+        star = star_at(1, wcs, 500, 400)
+        comps = [star_at(2, wcs, 500, 900, "12.0")]
+        check = [star_at(3, wcs, 450, 420, "Kmag=13.0")]
+        vsx = [star_at(4, wcs, 520, 410), star_at(5, wcs, 1500, 400)]
+        chart = do_charts_field.finder_chart(star, vsx, comps, check, wcs, "title", "path")
+        self.assertAlmostEqual(500 + do_charts_field.PADDING, chart.centre[0], delta=1)
+        # the window holds the comparison star
+        self.assertAlmostEqual(500 + do_charts_field.FINDER_MARGIN, chart.half, delta=1)
+        self.assertEqual([4], [sd.local_id for sd in chart.star_lists[1]])
+        # copies of the stars, the labels stay
+        comps[0].label = "other"
+        self.assertEqual("12.0", chart.star_lists[2][0].label)
+
+
+if __name__ == "__main__":
+    unittest.main()
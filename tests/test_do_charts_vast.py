@@ -1,7 +1,13 @@
 import unittest
+import tempfile
+from pathlib import Path
 import do_charts_vast
 import numpy as np
+import pandas as pd
+import period_engines
+from calibrated_lightcurves import CalibratedLightcurves
 from star_description import StarDescription
+from star_metadata import CatalogData, SiteData
 from astropy.coordinates import SkyCoord
 import logging
 
@@ -16,6 +22,72 @@ class TestDoChartsVast(unittest.TestCase):
         self.assertEqual(10, len(t_np_zeroed))
         self.assertEqual(0, t_np_zeroed[6])
 
+    def test_get_prior_period(self):
+        star = self.stardesc(1, 10, 10)
+        self.assertIsNone(do_charts_vast.get_prior_period(star))
+        star.metadata = CatalogData(key="VSX", extradata={"Period": float("nan")})
+        self.assertIsNone(do_charts_vast.get_prior_period(star))
+        star.metadata = CatalogData(key="VSX", extradata={"Period": 0.5})
+        self.assertEqual(do_charts_vast.Period(0.5, "VSX"), do_charts_vast.get_prior_period(star))
+        star.metadata = SiteData(period=0.25, source="OWN")
+        self.assertEqual(do_charts_vast.Period(0.25, "OWN"), do_charts_vast.get_prior_period(star))
+
+    def test_add_bootstrap_error(self):
+        rng = np.random.default_rng(5)
+        t = np.sort(rng.uniform(0, 30, 300))
+        mags = 12 + 0.2 * np.sin(2 * np.pi * t / 1.3) + rng.normal(0, 0.02, 300)
+        df = pd.DataFrame({"floatJD": t, "realV": mags, "realErr": 0.02})
+        star = self.stardesc(1, 10, 10)
+        period = do_charts_vast.Period(1.3, "LS")
+        settings = period_engines.SearchSettings(bootstrap_resamples=50)
+        no_bootstrap = period_engines.SearchSettings()
+        self.assertEqual(period, do_charts_vast.add_bootstrap_error(df, star, period, no_bootstrap))
+        with_err = do_charts_vast.add_bootstrap_error(df, star, period, settings)
+        self.assertTrue(0 < with_err.err < 0.01)
+        # the same resamples every time
+        self.assertEqual(with_err, do_charts_vast.add_bootstrap_error(df, star, period, settings))
+        star.metadata = SiteData(period=1.3, source="OWN")
+        self.assertEqual(period, do_charts_vast.add_bootstrap_error(df, star, period, settings))
+
+    def test_batch_periods_max_period(self):
+        rng = np.random.default_rng(3)
+        t = np.sort(rng.uniform(0, 40, 400))
+        mags = np.column_stack([12 + 0.2 * np.sin(2 * np.pi * t / 1.3), 13 + 0.3 * np.sin(2 * np.pi * t / 16)])
+        mags += rng.normal(0, 0.01, mags.shape)
+        # the second star is only measured in the first 8 days
+        mags[t > 8, 1] = np.nan
+        calibrated = CalibratedLightcurves(t.astype(str), [1, 2], mags, np.full(mags.shape, 0.01))
+        stars = [self.stardesc(1, 10, 10), self.stardesc(2, 10, 10)]
+        periods = do_charts_vast.calculate_batch_periods(stars, calibrated)
+        self.assertAlmostEqual(1.3, periods[1].period, delta=0.01)
+        self.assertLess(periods[2].period, 8)
+        # a max_period is not limited to the baseline of the star, like the search of a single star
+        settings = period_engines.SearchSettings(max_period=30)
+        periods = do_charts_vast.calculate_batch_periods(stars, calibrated, search_settings=settings)
+        self.assertGreater(periods[2].period, 8)
+
+    def test_link_to_groups(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            dirs = [
+                do_charts_vast.ChartDirs(*(Path(tempdir, f"{part}{group}") for part in ("phase", "light", "aavso")))
+                for group in range(3)
+            ]
+            for adir in dirs:
+                Path(adir.phasedir, "txt").mkdir(parents=True)
+                adir.chartsdir.mkdir()
+            toml_file = Path(dirs[0].phasedir, "txt", "00001.txt")
+            toml_file.write_text("period = 1.3")
+            plot = Path(dirs[0].chartsdir, "00001_light.png")
+            plot.write_text("png")
+            do_charts_vast.link_to_groups([toml_file, plot, None], dirs)
+            for adir in dirs[1:]:
+                self.assertEqual("period = 1.3", Path(adir.phasedir, "txt", "00001.txt").read_text())
+                self.assertEqual("png", Path(adir.chartsdir, "00001_light.png").read_text())
+            self.assertEqual(
+                Path(dirs[2].chartsdir, "00001_light.png"), do_charts_vast.relocate(plot, dirs[0], dirs[2])
+            )
+            with self.assertRaises(ValueError):
+                do_charts_vast.relocate(Path(tempdir, "elsewhere.png"), dirs[0], dirs[1])
 
     def stardesc(self, id, ra, dec):
         return StarDescription(local_id=id, coords=SkyCoord(ra, dec, unit="deg"))
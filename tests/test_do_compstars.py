@@ -11,6 +11,9 @@ from pathlib import Path
 import logging
 from pandas import DataFrame
 import utils
+import reading
+import numpy as np
+from star_metadata import CompStarData
 
 logging.getLogger().setLevel(logging.DEBUG)
 logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
@@ -53,6 +56,58 @@ class TestDoCompstars(unittest.TestCase):
         self.assertEqual(15.415, round(realV[0], 3))
         self.assertEqual(0.0121, round(realErr[0], 4))
 
+    def test_calculate_ensemble_photometry_missing_observations(self):
+        data = {"JD": ["1", "2", "3"], "Vrel": [15.414] * 3, "err": [0.012] * 3}
+        df = DataFrame(data, columns=["JD", "Vrel", "err"])
+        # comp star 2 is missing on JD 2, no comp star has JD 3
+        observations_1 = {"1": (11.775, 0.001), "2": (11.775, 0.001)}
+        observations_2 = {"1": (12.220, 0.0012)}
+        observations = [observations_1, observations_2]
+        catalogmags = [11.8, 12.2]
+        comp_stars = ComparisonStars([1, 2], None, observations, catalogmags, None)
+
+        realV, realErr = do_compstars.calculate_ensemble_photometry(
+            df, comp_stars, do_compstars.weighted_value_ensemble_method
+        )
+        self.assertEqual(3, len(realV))
+        self.assertEqual(15.439, round(realV[1], 3))
+        self.assertEqual(0.012, round(realErr[1], 4))
+        self.assertTrue(np.isnan(realV[2]))
+        self.assertTrue(np.isnan(realErr[2]))
+
+    def test_calculate_batch_ensemble_photometry(self):
+        # the comparison star is the star itself, so every calibrated magnitude equals the catalog magnitude
+        observations = [reading.read_magdict_for_star(test_file_path, 2391)]
+        comp_stars = ComparisonStars(
+            [2391], [StarDescription(local_id=2391)], observations, [12.0], [0.1]
+        )
+        stars = [
+            StarDescription(local_id=1, path=str(Path(test_file_path, "out02391.dat"))),
+            StarDescription(local_id=2, path=""),
+        ]
+        stars[0].metadata = CompStarData(compstar_ids=[2391])
+
+        calibrated = do_compstars.calculate_batch_ensemble_photometry(
+            stars, comp_stars, do_compstars.weighted_value_ensemble_method
+        )
+        self.assertTrue(1 in calibrated)
+        self.assertFalse(2 in calibrated)
+        df = calibrated.get_star_df(1)
+        self.assertEqual(851, len(df))
+        self.assertTrue(np.allclose(12.0, df["realV"], atol=1e-5))
+        self.assertTrue((np.diff(df["floatJD"]) > 0).all())
+
+    def test_group_stars_by_compstars(self):
+        stars = [StarDescription(local_id=x) for x in range(4)]
+        stars[0].metadata = CompStarData(compstar_ids=[3, 2])
+        stars[1].metadata = CompStarData(compstar_ids=[2, 3])
+        stars[2].metadata = CompStarData(compstar_ids=[1, 2])
+        comp_stars = ComparisonStars([1, 2, 3], None, None, None, None)
+        groups = do_compstars.group_stars_by_compstars(stars, comp_stars)
+        self.assertEqual([0, 1], [x.local_id for x in groups[(2, 3)]])
+        self.assertEqual([2], [x.local_id for x in groups[(1, 2)]])
+        self.assertEqual([3], [x.local_id for x in groups[(1, 2, 3)]])
+
     def test_get_calculated_compstars(self):
         stars = [
             self.stardesc(1, 1, 1, 10, 0.01, 10),
@@ -0,0 +1,51 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+import figure_templates
+
+
+class TestFigureTemplates(unittest.TestCase):
+    def tearDown(self):
+        figure_templates.close_templates()
+
+    def test_template_is_reused(self):
+        template = figure_templates.get_template(width=4, height=3, dpi=50, xlabel="JD")
+        self.assertIs(template, figure_templates.get_template(width=4, height=3, dpi=50, xlabel="JD"))
+        self.assertIsNot(
+            template, figure_templates.get_template(width=4, height=3, dpi=50, xlabel="JD", errorbars=False)
+        )
+
+    def test_render_swaps_data(self):
+        template = figure_templates.get_template(width=4, height=3, dpi=50, xlabel="Phase")
+        with tempfile.TemporaryDirectory() as tempdir:
+            for star in range(2):
+                x = np.linspace(-1, 1, 10 + star)
+                y = np.full(len(x), 12.0 + star)
+                save_location = Path(tempdir, f"{star}.png")
+                template.render(x, y, np.full(len(x), 0.1), f"Star {star}", save_location=save_location)
+                self.assertTrue(save_location.exists())
+            self.assertEqual(11, len(template.line.get_xdata()))
+            self.assertEqual(11, len(template.bars.get_segments()))
+            self.assertEqual("Star 1", template.ax.get_title())
+            # magnitudes are inverted, the data and its error bars plus a margin
+            low, high = template.ax.get_ylim()
+            self.assertAlmostEqual(13.1 + 0.01, low)
+            self.assertAlmostEqual(12.9 - 0.01, high)
+
+    def test_layout_follows_labels(self):
+        template = figure_templates.get_template(width=4, height=3, dpi=50, xlabel="Phase")
+        x = np.linspace(-1, 1, 10)
+        template.render(x, np.full(10, 12.0), np.full(10, 0.1), "Star")
+        left, top = template.ax.get_position().x0, template.ax.get_position().y1
+        # the same labels keep the layout
+        template.render(x, np.full(10, 13.0), np.full(10, 0.1), "Star 2")
+        self.assertEqual(left, template.ax.get_position().x0)
+        # wider tick labels and a second title line get more room
+        template.render(x, np.full(10, -1.123456), np.full(10, 0.0001), "Star\nsecond line")
+        self.assertLess(left, template.ax.get_position().x0)
+        self.assertGreater(top, template.ax.get_position().y1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from astropy.io import fits
+import fits_frame
+import reading
+from fits_frame import FitsFrame
+
+
+class TestFitsFrame(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name, "frame.fit")
+        self.data = np.random.default_rng(2).integers(0, 30000, (1100, 61)).astype(np.int16)
+        fits.PrimaryHDU(self.data).writeto(self.path)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_data(self):
+        with FitsFrame(self.path) as frame:
+            self.assertEqual((1100, 61), frame.shape)
+            self.assertEqual(61, frame.header["NAXIS1"])
+            data = frame.data()
+            self.assertEqual(np.float32, data.dtype)
+            np.testing.assert_array_equal(self.data, data)
+            self.assertEqual(np.dtype(">i2"), frame.data(None).dtype)
+        self.assertEqual((1100, 61), fits_frame.read_shape(self.path))
+        data, shapex, shapey = reading.get_fits_data(self.path, blank_data=True)
+        self.assertEqual((1100, 61, 0), (shapex, shapey, np.count_nonzero(data)))
+
+    def test_unsigned(self):
+        # unsigned 16 bit is stored as int16 with BZERO 32768, which can't be memory mapped as a whole
+        path = Path(self.tempdir.name, "unsigned.fit")
+        data = self.data.astype(np.uint16) + 30000
+        fits.PrimaryHDU(data).writeto(path)
+        self.assertEqual(32768, fits.getheader(path)["BZERO"])
+        np.testing.assert_array_equal(data, fits_frame.read_data(path))
+        with FitsFrame(path) as frame:
+            self.assertEqual(np.uint16, frame.data(None).dtype)
+            np.testing.assert_array_equal(data[10:20, 5:7], frame.section(10, 20, 5, 7))
+
+    def test_section(self):
+        with FitsFrame(self.path) as frame:
+            np.testing.assert_array_equal(self.data[1090:, :3], frame.section(1090, 1200, -5, 3))
+            cutout = frame.cutout(1, 1098, 4, fill=-1)
+            self.assertEqual((8, 8), cutout.shape)
+            np.testing.assert_array_equal(self.data[1094:, :5], cutout[:6, 3:])
+            self.assertEqual(64 - 6 * 5, np.count_nonzero(cutout == -1))
+
+    def test_downsampled(self):
+        # more rows than one strip and a remainder in both directions
+        data = fits_frame.read_downsampled(self.path, 3)
+        self.assertEqual((366, 20), data.shape)
+        expected = self.data[:1098, :60].astype(float).reshape(366, 3, 20, 3).mean(axis=(1, 3))
+        np.testing.assert_allclose(expected, data, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from astropy.io import fits
+import fits_index
+import read_camera_filters
+from fits_index import FitsIndex
+
+
+def write_fits(path, jd, fits_filter, shape=(4, 6)):
+    hdu = fits.PrimaryHDU(np.zeros(shape, dtype=np.int16))
+    hdu.header["JD"] = jd
+    hdu.header["FILTER"] = fits_filter
+    hdu.writeto(path, overwrite=True)
+
+
+class TestFitsIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.fitsdir = Path(self.tempdir.name)
+        for nr, (jd, fits_filter) in enumerate([(2458000.5, "V"), (2458000.6, "B "), (2458000.7, "V")]):
+            write_fits(Path(self.fitsdir, f"frame{nr}.fit"), jd, fits_filter)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_index(self):
+        with FitsIndex(self.fitsdir) as index:
+            self.assertEqual(3, index.update())
+            self.assertEqual(0, index.update())
+            header = index.get("frame1.fit")
+            self.assertEqual((2458000.6, "B", 6, 4), (header.jd, header.filter, header.naxis1, header.naxis2))
+            self.assertEqual(["frame1.fit", "frame2.fit"], [header.name for header in index.select(2458000.55)])
+            self.assertEqual(["frame0.fit"], [header.name for header in index.select(None, 2458000.55)])
+
+    def test_incremental(self):
+        FitsIndex.of_fitsdir(self.fitsdir).close()
+        write_fits(Path(self.fitsdir, "frame1.fit"), 2458000.65, "R")
+        stat = os.stat(Path(self.fitsdir, "frame0.fit"))
+        os.utime(Path(self.fitsdir, "frame1.fit"), (stat.st_atime, stat.st_mtime + 10))
+        Path(self.fitsdir, "frame2.fit").unlink()
+        with FitsIndex(self.fitsdir) as index:
+            self.assertEqual(1, index.update())
+            self.assertEqual({2458000.5: "V", 2458000.65: "R"}, index.get_filters())
+
+    def test_lookup_filters(self):
+        filters = read_camera_filters.lookup_filters(self.fitsdir, [2458000.6001, 2458000.5, 2458000.9])
+        self.assertEqual(["B", "V", None], list(filters))
+        self.assertEqual({2458000.5: "V", 2458000.6: "B", 2458000.7: "V"}, read_camera_filters.read_filters(self.fitsdir))
+
+    def test_index_file(self):
+        with tempfile.TemporaryDirectory() as resultdir:
+            index_file = Path(resultdir, "index.sqlite")
+            filters = read_camera_filters.lookup_filters(self.fitsdir, [2458000.5], index_file)
+            self.assertEqual(["V"], list(filters))
+            self.assertTrue(index_file.exists())
+        self.assertFalse(Path(self.fitsdir, fits_index.INDEX_FILE).exists())
+        # nothing is written to a fitsdir which is not writable
+        with mock.patch("os.access", return_value=False):
+            with FitsIndex.of_fitsdir(self.fitsdir) as index:
+                self.assertEqual(fits_index.MEMORY_INDEX, index.index_file)
+                self.assertEqual(3, len(index))
+        self.assertFalse(Path(self.fitsdir, fits_index.INDEX_FILE).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
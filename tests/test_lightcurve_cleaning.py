@@ -0,0 +1,51 @@
+import unittest
+import lightcurve_cleaning
+import numpy as np
+import pandas as pd
+
+
+class TestLightcurveCleaning(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.t = np.sort(rng.uniform(2458000, 2458030, 500))
+        self.mags = 12 + 0.3 * np.sin(2 * np.pi * self.t / 0.8) + rng.normal(0, 0.02, 500)
+        self.errs = np.full(500, 0.02)
+        self.outliers = [10, 200, 333]
+        self.mags[self.outliers] += 2
+
+    def test_bucket_medians_stds(self):
+        buckets = np.array([2, 0, 2, 2, 0, 3])
+        values = np.array([1.0, 5.0, 3.0, 2.0, 7.0, 4.0])
+        medians, stds = lightcurve_cleaning.phase_bucket_medians_stds(buckets, values, 4)
+        np.testing.assert_allclose([6.0, np.nan, 2.0, 4.0], medians)
+        np.testing.assert_allclose([np.std([5, 7], ddof=1), np.nan, 1.0, np.nan], stds)
+
+    def test_phase_outliers_like_groupby(self):
+        mask = lightcurve_cleaning.phase_outlier_mask(self.t, self.mags, 0.8, stdev=2)
+        # the same clipping with pandas, per bucket of the rounded phase
+        df = pd.DataFrame({"mag": self.mags, "bucket": np.round(np.fmod(self.t / 0.8, 1), 1)})
+        grouped = df.groupby("bucket")["mag"]
+        expected = (df["mag"] - grouped.transform("median")).abs() < 2 * grouped.transform("std")
+        np.testing.assert_array_equal(expected.to_numpy(), mask)
+
+    def test_clean_lightcurve(self):
+        self.mags[5] = np.nan
+        self.errs[6] = 0.5
+        jdfilter = [2458010, 2458012, 2458020, 2458021]
+        mask, counts = lightcurve_cleaning.clean_lightcurve(
+            self.t, self.mags, self.errs, 0.8, jdfilter, max_err=0.1
+        )
+        inside = ((self.t > 2458010) & (self.t < 2458012)) | ((self.t > 2458020) & (self.t < 2458021))
+        self.assertEqual(np.count_nonzero(inside), counts.jd_filtered)
+        self.assertEqual((1, 1, np.count_nonzero(~inside[self.outliers])), counts[1:])
+        self.assertEqual(len(self.t) - sum(counts), np.count_nonzero(mask))
+        self.assertFalse(mask[self.outliers].any() or mask[inside].any() or mask[5] or mask[6])
+
+    def test_clean_lightcurve_without_period(self):
+        mask, counts = lightcurve_cleaning.clean_lightcurve(self.t, self.mags, self.errs)
+        self.assertTrue(mask.all())
+        self.assertEqual(0, sum(counts))
+
+
+if __name__ == "__main__":
+    unittest.main()
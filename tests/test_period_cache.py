@@ -0,0 +1,50 @@
+import unittest
+import tempfile
+import numpy as np
+from period_cache import PeriodCache
+
+
+class TestPeriodCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.t = np.linspace(0, 10, 100)
+        self.mags = np.sin(self.t)
+        self.errs = np.full(100, 0.01)
+        self.frequencies = np.linspace(0.1, 10, 500)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_key(self):
+        key = PeriodCache.key(self.t, self.mags, self.errs, self.frequencies)
+        self.assertEqual(key, PeriodCache.key(self.t, self.mags.copy(), self.errs, self.frequencies))
+        # missing observations don't change the key, different data or grids do
+        mags = np.append(self.mags, np.nan)
+        self.assertEqual(
+            key, PeriodCache.key(np.append(self.t, 11), mags, np.append(self.errs, 0.01), self.frequencies)
+        )
+        self.assertNotEqual(key, PeriodCache.key(self.t, self.mags + 0.1, self.errs, self.frequencies))
+        self.assertNotEqual(key, PeriodCache.key(self.t, self.mags, self.errs, self.frequencies[1:]))
+
+    def test_put_and_get(self):
+        cache = PeriodCache(self.tempdir.name)
+        key = PeriodCache.key(self.t, self.mags, self.errs, self.frequencies)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, 6.28, 0.9)
+        self.assertEqual((6.28, 0.9), cache.get(key))
+        self.assertIsNone(cache.get_periodogram(key))
+        # an entry without periodogram is a miss when periodograms are wanted
+        self.assertIsNone(PeriodCache(self.tempdir.name, store_periodograms=True).get(key))
+
+    def test_periodogram(self):
+        cache = PeriodCache(self.tempdir.name, store_periodograms=True)
+        key = PeriodCache.key(self.t, self.mags, self.errs, self.frequencies)
+        power = np.linspace(0, 1, 500)
+        cache.put(key, 6.28, 0.9, self.frequencies, power)
+        frequencies, stored_power = cache.get_periodogram(key)
+        np.testing.assert_allclose(self.frequencies, frequencies)
+        np.testing.assert_allclose(power, stored_power, atol=1e-3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+import period_engines
+import periodogram
+import numpy as np
+
+
+class TestPeriodEngines(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.t = np.sort(rng.uniform(2458000, 2458030, 800))
+        self.mags = np.column_stack(
+            [
+                12 + 0.3 * np.sin(2 * np.pi * self.t / 0.37) + rng.normal(0, 0.05, 800),
+                # an eclipse of 5% of the period
+                12 + np.where((self.t / 1.7) % 1 < 0.05, 0.5, 0) + rng.normal(0, 0.02, 800),
+            ]
+        )
+        self.errs = np.full_like(self.mags, 0.05)
+        self.mags[rng.random(self.mags.shape) < 0.2] = np.nan
+        self.frequencies = periodogram.get_frequency_grid(self.t)
+
+    def best_periods(self, name):
+        engine = period_engines.get_engine(name)
+        batches = list(engine(self.t, self.mags, self.errs, self.frequencies))
+        return 1 / np.concatenate([frequency for _, frequency, _, _ in batches])
+
+    def test_pdm_and_aov(self):
+        for name in ["PDM", "AOV"]:
+            self.assertAlmostEqual(0.37, self.best_periods(name)[0], places=3)
+
+    def test_parallel_blocks(self):
+        serial = self.best_periods("AOV")
+        with mock.patch.multiple(periodogram, PARALLEL_MIN_POINTS=100, MAX_THREADS=2), mock.patch.object(
+            period_engines, "MAX_BLOCK_ELEMENTS", 100_000
+        ):
+            np.testing.assert_array_equal(serial, self.best_periods("AOV"))
+
+    def test_rounds_of_batches(self):
+        engine = period_engines.get_engine("PDM")
+        mags, errs = np.tile(self.mags, 3), np.tile(self.errs, 3)
+        expected = np.concatenate([power for _, _, _, power in engine(self.t, mags, errs, self.frequencies)])
+        # one star per batch, two batches per round: the binning of a block is shared by the stars of a round
+        nr_frequencies = len(self.frequencies)
+        with mock.patch.object(periodogram, "MAX_BLOCK_ELEMENTS", nr_frequencies), mock.patch.object(
+            period_engines, "MAX_RESULT_ELEMENTS", 2 * nr_frequencies
+        ), mock.patch.object(period_engines, "_binning_matrix", wraps=period_engines._binning_matrix) as binning:
+            batches = list(engine(self.t, mags, errs, self.frequencies))
+        self.assertEqual([slice(star, star + 1) for star in range(6)], [stars for stars, _, _, _ in batches])
+        nr_blocks = -(-nr_frequencies // (period_engines.MAX_BLOCK_ELEMENTS // len(self.t)))
+        self.assertEqual(3 * nr_blocks, binning.call_count)
+        np.testing.assert_allclose(expected, np.concatenate([power for _, _, _, power in batches]))
+
+    def test_box_search(self):
+        self.assertAlmostEqual(1.7, self.best_periods("BLS")[1], places=2)
+
+    def test_coarse_to_fine(self):
+        settings = period_engines.SearchSettings(oversampling=1)
+        frequencies = period_engines.get_coarse_grid(self.t, settings)
+        for name in ["LS", "PDM"]:
+            _, frequency, _, _ = next(
+                period_engines.coarse_to_fine(
+                    name, self.t, self.mags, self.errs, frequencies, top_peaks=settings.top_peaks
+                )
+            )
+            self.assertAlmostEqual(0.37, 1 / frequency[0], places=3)
+
+    def test_top_peak_frequencies(self):
+        power = np.array([[0.1, 0.5, 0.2, 0.3, 0.9, 0.1], [0, 0, 0, 0, 0, 0]])
+        peaks = period_engines.top_peak_frequencies(power, np.arange(6.0), 2)
+        self.assertEqual([1.0, 4.0], sorted(peaks[0]))
+        self.assertTrue(np.isnan(peaks[1]).all())
+
+    def test_get_engine(self):
+        self.assertEqual(period_engines.ENGINES["LS"], period_engines.get_engine("ls"))
+        with self.assertRaises(ValueError):
+            period_engines.get_engine("FOO")
+
+    def test_select_engine_name(self):
+        vartype_engines = period_engines.parse_vartype_engines(["EA=bls", "EA/SD=pdm"])
+        self.assertEqual({"EA": "BLS", "EA/SD": "PDM"}, vartype_engines)
+        self.assertEqual("BLS", period_engines.select_engine_name("EA", "LS", vartype_engines))
+        self.assertEqual("PDM", period_engines.select_engine_name("EA/SD", "LS", vartype_engines))
+        self.assertEqual("LS", period_engines.select_engine_name("RRAB", "LS", vartype_engines))
+        self.assertEqual("LS", period_engines.select_engine_name(None, "LS", vartype_engines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+import periodogram
+import numpy as np
+
+
+class TestPeriodogram(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.t = np.sort(rng.uniform(2458000, 2458060, 800))
+        self.periods = np.array([0.37, 2.9, 11.0])
+        self.mags = 12 + 0.3 * np.sin(2 * np.pi * self.t[:, np.newaxis] / self.periods)
+        self.mags += rng.normal(0, 0.05, self.mags.shape)
+        self.errs = np.full_like(self.mags, 0.05)
+        # every star misses a different part of the frames
+        self.mags[rng.random(self.mags.shape) < 0.2] = np.nan
+
+    def test_best_periods(self):
+        periods, power = periodogram.best_periods(self.t, self.mags, self.errs)
+        self.assertEqual(3, len(periods))
+        np.testing.assert_allclose(self.periods, periods, rtol=0.01)
+        self.assertTrue((power > 0.9).all())
+
+    def test_fft_equals_direct(self):
+        frequencies = periodogram.get_frequency_grid(self.t)[:2000]
+        fft_power = periodogram.lombscargle_power(self.t, self.mags, self.errs, frequencies)
+        direct_power = periodogram.lombscargle_power(
+            self.t, self.mags, self.errs, frequencies[::-1]
+        )[:, ::-1]
+        self.assertEqual((3, 2000), fft_power.shape)
+        # the FFT is approximate, the best peak is refined with the exact direct evaluation
+        np.testing.assert_allclose(direct_power, fft_power, atol=1e-2)
+
+    def test_best_periods_star_without_observations(self):
+        mags = np.column_stack([self.mags[:, 0], np.full(len(self.t), np.nan)])
+        errs = np.column_stack([self.errs[:, 0], self.errs[:, 0]])
+        periods, power = periodogram.best_periods(self.t, mags, errs)
+        self.assertAlmostEqual(0.37, periods[0], places=2)
+        self.assertTrue(np.isnan(periods[1]))
+        self.assertTrue(np.isnan(power[1]))
+
+    def test_refine_peaks(self):
+        frequencies = periodogram.get_frequency_grid(self.t, oversampling=1)
+        _, coarse, _, _ = next(periodogram.search_frequencies(self.t, self.mags, self.errs, frequencies))
+        offsets = np.linspace(-1, 1, 21) * (frequencies[1] - frequencies[0])
+        fine, power = periodogram.refine_peaks(
+            self.t, self.mags, self.errs, coarse[:, np.newaxis], offsets
+        )
+        # within a tenth of the frequency resolution 1 / baseline
+        np.testing.assert_allclose(1 / self.periods, fine, atol=0.1 / 60)
+        for star in range(3):
+            direct_power = periodogram.lombscargle_power(
+                self.t, self.mags[:, star], self.errs[:, star], fine[star : star + 1]
+            )
+            self.assertAlmostEqual(direct_power[0, 0], power[star])
+
+    def test_parallel_equals_serial(self):
+        frequencies = periodogram.get_frequency_grid(self.t)
+        serial = periodogram.lombscargle_power(self.t, self.mags, self.errs, frequencies)
+        with mock.patch.multiple(periodogram, PARALLEL_MIN_POINTS=100, MAX_THREADS=3):
+            self.assertEqual(3, periodogram.get_threads(len(self.t)))
+            parallel = periodogram.lombscargle_power(self.t, self.mags, self.errs, frequencies)
+        self.assertEqual(serial.shape, parallel.shape)
+        # every chunk has its own FFT grid, both are within the FFT accuracy of the exact power
+        np.testing.assert_allclose(serial, parallel, atol=1e-2)
+        np.testing.assert_array_equal(np.argmax(serial, axis=1), np.argmax(parallel, axis=1))
+
+    def test_refine_prior_periods(self):
+        # a slightly wrong prior, a prior at double the period and a star of pure noise
+        mags = self.mags.copy()
+        mags[:, 2] = 12 + np.random.default_rng(1).normal(0, 0.05, len(self.t))
+        periods, errs, significant = periodogram.refine_prior_periods(
+            self.t, mags, self.errs, [0.3705, 5.8, 11.0]
+        )
+        np.testing.assert_allclose([0.37, 2.9], periods[:2], rtol=2e-3)
+        self.assertTrue(significant[0] and significant[1])
+        self.assertFalse(significant[2])
+        self.assertTrue((errs[:2] > 0).all() and (errs[:2] < 0.01 * periods[:2]).all())
+
+    def test_bootstrap_period_error(self):
+        t, mags, errs = self.t, self.mags[:, 0], self.errs[:, 0]
+        err = periodogram.bootstrap_period_error(t, mags, errs, 0.37, rng=np.random.default_rng(1))
+        valid = ~np.isnan(mags)
+        _, power = periodogram.refine_peaks(t, mags, errs, np.array([[1 / 0.37]]), np.array([0.0]))
+        expected = periodogram.period_uncertainty(0.37, power[0], valid.sum(), np.ptp(t[valid]))
+        self.assertTrue(expected / 3 < err < expected * 3)
+        # the time budget stops after the first batch, too few resamples give no error
+        with mock.patch.object(periodogram, "BOOTSTRAP_BATCH", 10):
+            self.assertTrue(np.isnan(periodogram.bootstrap_period_error(t, mags, errs, 0.37, time_budget=0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
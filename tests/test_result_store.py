@@ -0,0 +1,48 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from result_store import ResultStore
+from do_charts_vast import Period
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.store = ResultStore(self.tempdir.name)
+        floatjds = np.array([2458000.1234, 2458000.5, 2458001.75])
+        self.df = pd.DataFrame(
+            {
+                "JD": ["2458000.1234", "2458000.50000", "2458001.75"],
+                "floatJD": floatjds,
+                "realV": [12.1, 12.3, 12.2],
+                "realErr": [0.01, 0.02, 0.01],
+            }
+        )
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_put_and_get(self):
+        self.assertNotIn(42, self.store)
+        self.assertIsNone(self.store.get_info(42))
+        self.assertIsNone(self.store.get_lightcurve(42))
+        info = {"period": 0.5, "our_name": "42", "points_removed": 1}
+        self.store.put(42, self.df, Period(np.float64(0.5), "LS", 1e-5), np.float64(2458000.3), info)
+        self.assertIn(42, self.store)
+        self.assertEqual(info, self.store.get_info(42))
+        self.assertEqual(
+            {"period": 0.5, "origin": "LS", "err": 1e-5, "epoch": 2458000.3}, self.store.get_computed(42)
+        )
+        pd.testing.assert_frame_equal(self.df, self.store.get_lightcurve(42))
+
+    def test_missing_values(self):
+        self.store.put(7, self.df, Period(0.5, "VSX"), None, {"period": None})
+        self.assertEqual({}, self.store.get_info(7))
+        computed = self.store.get_computed(7)
+        self.assertIsNone(computed["err"])
+        self.assertIsNone(computed["epoch"])
+
+
+if __name__ == "__main__":
+    unittest.main()
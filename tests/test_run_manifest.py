@@ -0,0 +1,49 @@
+import unittest
+import tempfile
+from pathlib import Path
+import pandas as pd
+from run_manifest import RunManifest
+
+
+class TestRunManifest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame(
+            {"floatJD": [2458000.1, 2458000.5], "realV": [12.1, 12.3], "realErr": [0.01, 0.02]}
+        )
+        self.output = Path(self.tempdir.name, "00042_phase.png")
+        self.output.touch()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_key(self):
+        key = RunManifest.key(self.df, [1, 2], None)
+        self.assertEqual(key, RunManifest.key(self.df.copy(), [1, 2], None))
+        self.assertNotEqual(key, RunManifest.key(self.df, [1, 3], None))
+        changed = self.df.copy()
+        changed.loc[1, "realV"] = 12.4
+        self.assertNotEqual(key, RunManifest.key(changed, [1, 2], None))
+
+    def test_done_after_reload(self):
+        manifest = RunManifest.of_resultdir(self.tempdir.name, "phase_vsx")
+        self.assertFalse(manifest.is_done(42, "abc"))
+        manifest.mark_done(42, "abc", {"phase": self.output, "light": None})
+        manifest.flush()
+        reloaded = RunManifest.of_resultdir(self.tempdir.name, "phase_vsx")
+        self.assertTrue(reloaded.is_done(42, "abc"))
+        self.assertFalse(reloaded.is_done(42, "def"))
+        self.assertEqual({"phase": str(self.output)}, reloaded.get_outputs(42))
+        # a deleted output means the star is not done
+        self.output.unlink()
+        self.assertFalse(reloaded.is_done(42, "abc"))
+
+    def test_clear(self):
+        manifest = RunManifest.of_resultdir(self.tempdir.name, "phase_vsx")
+        manifest.mark_done(42, "abc", {"phase": self.output})
+        manifest.clear()
+        self.assertIsNone(RunManifest.of_resultdir(self.tempdir.name, "phase_vsx").get_outputs(42))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import signal
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+import scheduler
+import worker_pool
+
+
+def square(x):
+    return x * x
+
+
+def negate(x):
+    return -x
+
+
+def slow_square(x):
+    if x == 3:
+        time.sleep(60)
+    return x * x
+
+
+def dying_square(x):
+    if x == 3:
+        # like the OOM killer
+        os.kill(os.getpid(), signal.SIGKILL)
+    time.sleep(0.1)
+    return x * x
+
+
+def worker_rss(_):
+    return worker_pool.rss_mb()
+
+
+def greedy_square(x):
+    if x == 3:
+        data = b"x" * (300 * 2 ** 20)
+        time.sleep(60)
+    return x * x
+
+
+class TestScheduler(unittest.TestCase):
+    def test_estimate_cost(self):
+        self.assertLess(scheduler.estimate_cost(100, ["compute"]), scheduler.estimate_cost(5000, ["compute"]))
+        self.assertLess(scheduler.estimate_cost(100, ["phase"]), scheduler.estimate_cost(100, ["phase", "aavso"]))
+        self.assertEqual(scheduler.estimate_cost(0, ["phase"]), scheduler.estimate_cost(None, ["phase"]))
+
+    def test_expensive_first_cheap_batched(self):
+        items = ["a", "b", "c", "d", "e", "f"]
+        costs = [1, 100, 1, 50, 1, 1]
+        batches = scheduler.schedule(items, costs, [False] * 6, 4)
+        self.assertEqual(["b"], batches[0])
+        self.assertEqual(["d"], batches[1])
+        self.assertEqual(["a", "c", "e", "f"], batches[2])
+
+    def test_priority_first(self):
+        items = ["a", "b", "c"]
+        batches = scheduler.schedule(items, [100, 1, 10], [False, True, False], 4)
+        self.assertEqual([["b"], ["a"], ["c"]], batches)
+
+    def test_imap_scheduled(self):
+        items = list(range(20))
+        with ThreadPool(3) as pool:
+            results = list(scheduler.imap_scheduled(pool, square, items, items, [x % 5 == 0 for x in items], 3))
+        self.assertEqual(sorted(x * x for x in items), sorted(results))
+        self.assertEqual([], scheduler.schedule([], [], [], 3))
+
+    def test_prepare(self):
+        items = list(range(20))
+        with ThreadPool(3) as pool:
+            results = list(scheduler.imap_scheduled(pool, square, items, items, [False] * 20, 3, prepare=negate))
+        self.assertEqual(sorted(x * x for x in items), sorted(results))
+        with worker_pool.get_pool(2) as pool:
+            results = list(
+                scheduler.imap_scheduled(
+                    pool, square, items, [1] * 20, [False] * 20, 2, scheduler.TaskBudget(seconds=60), prepare=negate
+                )
+            )
+        self.assertEqual(sorted(x * x for x in items), sorted(results))
+
+    def test_budget_kills_item(self):
+        failures = []
+        items = list(range(8))
+        with worker_pool.get_pool(2) as pool:
+            start = time.time()
+            results = list(
+                scheduler.imap_scheduled(
+                    pool,
+                    slow_square,
+                    items,
+                    [1] * 8,
+                    [False] * 8,
+                    2,
+                    scheduler.TaskBudget(seconds=2),
+                    [f"star{x}" for x in items],
+                    "compute",
+                    failures,
+                )
+            )
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(sorted([x * x for x in items if x != 3]), sorted(r for r in results if r is not None))
+        self.assertEqual(1, results.count(None))
+        self.assertEqual(["star3"], [failure.item_id for failure in failures])
+        self.assertEqual("compute", failures[0].stage)
+
+    def test_memory_budget(self):
+        if worker_pool.process_rss_mb("self") is None:
+            self.skipTest("no /proc")
+        failures = []
+        with worker_pool.get_pool(2) as pool:
+            budget = scheduler.TaskBudget(max_rss_mb=max(pool.map(worker_rss, range(4))) + 150)
+            results = list(
+                scheduler.imap_scheduled(
+                    pool, greedy_square, range(5), [1] * 5, [False] * 5, 2, budget, failures=failures
+                )
+            )
+        self.assertEqual([0, 1, 4, 16], sorted(r for r in results if r is not None))
+        self.assertEqual([3], [failure.item_id for failure in failures])
+
+    def test_worker_dies(self):
+        failures = []
+        with worker_pool.get_pool(2) as pool:
+            start = time.time()
+            results = list(
+                scheduler.imap_scheduled(
+                    pool, dying_square, range(8), [1] * 8, [False] * 8, 2, scheduler.TaskBudget(seconds=60),
+                    failures=failures,
+                )
+            )
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(sorted(x * x for x in range(8) if x != 3), sorted(r for r in results if r is not None))
+        self.assertEqual(1, results.count(None))
+        self.assertEqual([(3, "the worker died (exitcode -9)")], [(failure.item_id, failure.reason) for failure in failures])
+
+    def test_recycled_workers_keep_results(self):
+        # every worker exits right after its result, which is no death
+        failures = []
+        with worker_pool.get_pool(2, max_rss_mb=1) as pool:
+            results = list(
+                scheduler.imap_scheduled(
+                    pool, square, range(8), [1] * 8, [False] * 8, 2, scheduler.TaskBudget(seconds=60),
+                    failures=failures,
+                )
+            )
+        self.assertEqual(sorted(x * x for x in range(8)), sorted(results))
+        self.assertEqual([], failures)
+
+
+if __name__ == "__main__":
+    unittest.main()
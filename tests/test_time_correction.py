@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord, EarthLocation
+from astropy.time import Time
+import time_correction
+from calibrated_lightcurves import CalibratedLightcurves
+
+location = EarthLocation(lat="-22 57 13", lon="-68 10 43", height=2500 * u.m)
+jds = 2458000.5 + np.linspace(0, 300, 200)
+
+
+class TestTimeCorrection(unittest.TestCase):
+    def test_against_astropy(self):
+        for time_reference in ("HJD", "BJD"):
+            correction = time_correction.TimeCorrection(jds, time_reference, location)
+            for coord in (SkyCoord(150, -40, unit="deg"), SkyCoord(10, 85, unit="deg")):
+                times = Time(jds[::20], format="jd", scale="utc", location=location)
+                ltt = times.light_travel_time(coord, time_correction.KINDS[time_reference])
+                expected = (times.utc + ltt).jd if time_reference == "HJD" else (times.tdb + ltt).jd
+                np.testing.assert_allclose(expected, correction.correct(jds[::20], coord), rtol=0, atol=1e-8)
+
+    def test_unknown_frame(self):
+        correction = time_correction.TimeCorrection(jds, "HJD")
+        with self.assertRaises(AssertionError):
+            correction.correct([jds[0] + 0.1], SkyCoord(150, -40, unit="deg"))
+
+    def test_star_df(self):
+        frames = np.char.mod("%.5f", jds[:3])
+        calibrated = CalibratedLightcurves(frames, [1], np.array([[12.0], [np.nan], [12.2]]), np.full((3, 1), 0.01))
+        calibrated.time_correction = time_correction.TimeCorrection(calibrated.floatjds, "HJD")
+        coord = SkyCoord(150, -40, unit="deg")
+        df = calibrated.get_star_df(1, coord)
+        self.assertEqual([frames[0], frames[2]], list(df["JD"]))
+        expected = calibrated.time_correction.correct(calibrated.floatjds[[0, 2]], coord)
+        np.testing.assert_allclose(expected, df["floatJD"], atol=1e-6)
+        # without the coord of the star, the frame JDs
+        np.testing.assert_allclose(jds[[0, 2]], calibrated.get_star_df(1)["floatJD"], atol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -188,6 +188,15 @@ class TestUtils(unittest.TestCase):
         except:
             pass
 
+    def test_jd_filter_mask(self):
+        jds = np.array([1.0, 2.0, 2.5, 3.0, 5.0, 6.5, 8.0])
+        self.assertTrue(utils.jd_filter_mask(jds, None).all())
+        np.testing.assert_array_equal(
+            [True, True, False, True, True, False, True], utils.jd_filter_mask(jds, [2, 3, 6, 7])
+        )
+        with self.assertRaises(ValueError):
+            utils.jd_filter_mask(jds, [2, 3, 6])
+
     @staticmethod
     def stardesc(id, ra, dec):
         return StarDescription(local_id=id, coords=SkyCoord(ra, dec, unit="deg"))
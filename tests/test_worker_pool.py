@@ -0,0 +1,57 @@
+import os
+import signal
+import time
+import unittest
+import worker_pool
+
+# grown by leak in the workers
+_leaked = []
+
+
+def leak(size_mb):
+    _leaked.append(bytearray(int(size_mb * 2 ** 20)))
+    return os.getpid()
+
+
+def die():
+    # like the OOM killer
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_rss(self):
+        before = worker_pool.rss_mb()
+        self.assertGreater(before, 0)
+        data = bytearray(50 * 2 ** 20)
+        self.assertGreater(worker_pool.rss_mb(), before + 40)
+        del data
+
+    def test_auto_threads(self):
+        self.assertGreaterEqual(worker_pool.auto_threads(), 1)
+        self.assertEqual(1, worker_pool.auto_threads(max_rss_mb=10 ** 9))
+
+    def test_workers_stay_warm(self):
+        with worker_pool.get_pool(2, max_rss_mb=10 ** 6) as pool:
+            pids = pool.map(leak, [0] * 30, chunksize=1)
+        self.assertLessEqual(len(set(pids)), 2)
+
+    def test_workers_recycled_on_memory(self):
+        with worker_pool.get_pool(2, max_rss_mb=1) as pool:
+            pids = pool.map(leak, [1] * 6, chunksize=1)
+        self.assertEqual(6, len(set(pids)))
+
+    def test_worker_exitcodes(self):
+        with worker_pool.get_pool(2, max_rss_mb=1) as pool:
+            pool.map(leak, [1] * 4, chunksize=1)
+            # the recycled workers exited with 0 and are left out
+            self.assertLessEqual(len(pool.worker_exitcodes()), 2)
+        with worker_pool.get_pool(2, max_rss_mb=10 ** 6) as pool:
+            pool.apply_async(die)
+            deadline = time.time() + 10
+            while -signal.SIGKILL not in pool.worker_exitcodes().values() and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertIn(-signal.SIGKILL, pool.worker_exitcodes().values())
+
+
+if __name__ == "__main__":
+    unittest.main()